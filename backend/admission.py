@@ -0,0 +1,266 @@
+"""
+Admission control for LLM-bound work.
+
+The Theta API rate-limits bursts, and before this every request went
+straight upstream: during busy periods they all queued there until the
+30 s timeout and every student got an error. AdmissionController caps how
+many LLM calls run at once, globally and per user, and makes the rest wait
+in a bounded queue:
+
+  - waiting requests are served by priority (text chat before voice
+    questions before background summaries), oldest first within a priority
+  - a user already at their concurrency limit waits without holding up
+    other users
+  - when the queue is full the lowest-priority waiter is shed if a more
+    important request arrives, otherwise the new request is rejected
+  - a request that waits longer than queue_timeout, or than the timeout it
+    passes in (what is left of its deadline), gives up
+
+A rejected request raises Overloaded carrying the HTTP status (429 when the
+user is over their own allowance, 503 when the server is saturated) and a
+Retry-After estimate, so the client gets a fast answer instead of a 30 s
+timeout.
+
+One controller is shared by the Flask threads and the ASGI event loop:
+acquire() blocks a thread, acquire_async() awaits on the loop.
+"""
+
+import math
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+from metrics import metrics
+
+PRIORITY_TEXT = 0
+PRIORITY_AUDIO = 1
+PRIORITY_BACKGROUND = 2
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted; carries the response status and Retry-After seconds"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(f"Not admitted ({reason}), retry after {retry_after}s")
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admission slot, queued or granted"""
+    __slots__ = ("user", "priority", "seq", "enqueued_at", "granted_at", "rejection", "notify")
+
+    def __init__(self, user, priority, seq):
+        self.user = user
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.rejection = None
+        self.notify = None
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 16, max_per_user: int = 2, max_queue: int = 64,
+                 max_user_queue: int = 4, queue_timeout: float = 10.0, name: str = "admission"):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self._active = 0
+        self._active_by_user = {}
+        self._waiting = []  # Tickets; small enough that a linear scan beats keeping a heap in sync
+        self._waiting_by_user = {}
+        self._seq = itertools.count()
+        self._mean_hold = 2.0  # EWMA of seconds a slot is held, for Retry-After estimates
+        self._lock = threading.Lock()
+
+    # -- bookkeeping, all called with the lock held --
+
+    def _user_allows(self, user) -> bool:
+        # Background work (user=None) only counts against the global limit
+        return user is None or self._active_by_user.get(user, 0) < self.max_per_user
+
+    def _grant(self, ticket):
+        ticket.granted_at = time.monotonic()
+        self._active += 1
+        if ticket.user is not None:
+            self._active_by_user[ticket.user] = self._active_by_user.get(ticket.user, 0) + 1
+
+    def _unqueue(self, ticket):
+        self._waiting.remove(ticket)
+        if ticket.user is not None:
+            left = self._waiting_by_user[ticket.user] - 1
+            if left:
+                self._waiting_by_user[ticket.user] = left
+            else:
+                del self._waiting_by_user[ticket.user]
+
+    def _dispatch(self):
+        """Grant freed capacity to the best waiting tickets whose user is under their limit"""
+        while self._active < self.max_concurrent:
+            eligible = [t for t in self._waiting if self._user_allows(t.user)]
+            if not eligible:
+                break
+            ticket = min(eligible, key=lambda t: (t.priority, t.seq))
+            self._unqueue(ticket)
+            self._grant(ticket)
+            ticket.notify()
+
+    def _retry_after(self, queued: int) -> int:
+        return max(1, min(60, math.ceil(self._mean_hold * (queued + 1) / self.max_concurrent)))
+
+    def _publish(self):
+        metrics.set_gauge(f"{self.name}.active", self._active)
+        metrics.set_gauge(f"{self.name}.queue_depth", len(self._waiting))
+
+    def _admit(self, user, priority) -> Ticket:
+        """Grant a ticket now, queue it (granted_at is None) or raise Overloaded"""
+        ticket = Ticket(user, priority, next(self._seq))
+        if self._active < self.max_concurrent and self._user_allows(user):
+            # Anyone still queued at this point is blocked by their own per-user limit
+            self._grant(ticket)
+            metrics.observe(f"{self.name}.wait", 0.0)
+            metrics.incr(f"{self.name}.admitted")
+            self._publish()
+            return ticket
+        if user is not None and self._waiting_by_user.get(user, 0) >= self.max_user_queue:
+            metrics.incr(f"{self.name}.rejected_user_limit")
+            raise Overloaded(429, "user_limit", max(1, math.ceil(self._mean_hold)))
+        if len(self._waiting) >= self.max_queue:
+            worst = max(self._waiting, key=lambda t: (t.priority, t.seq), default=None)
+            if worst is None or worst.priority <= priority:
+                metrics.incr(f"{self.name}.rejected_queue_full")
+                raise Overloaded(503, "queue_full", self._retry_after(len(self._waiting)))
+            # Make room by shedding the least important request still waiting
+            self._unqueue(worst)
+            worst.rejection = Overloaded(503, "shed", self._retry_after(len(self._waiting)))
+            metrics.incr(f"{self.name}.shed")
+            worst.notify()
+        self._waiting.append(ticket)
+        if user is not None:
+            self._waiting_by_user[user] = self._waiting_by_user.get(user, 0) + 1
+        metrics.incr(f"{self.name}.queued")
+        self._publish()
+        return ticket
+
+    def _abandon(self, ticket) -> bool:
+        """Take a waiter that gave up out of the queue; False if it was granted in the meantime"""
+        if ticket.granted_at is not None:
+            return False
+        if ticket.rejection is None:
+            self._unqueue(ticket)
+            self._publish()
+        return True
+
+    def _admitted(self, ticket):
+        if ticket.rejection is not None:
+            raise ticket.rejection
+        metrics.observe(f"{self.name}.wait", ticket.granted_at - ticket.enqueued_at)
+        metrics.incr(f"{self.name}.admitted")
+
+    def _timed_out(self) -> Overloaded:
+        metrics.incr(f"{self.name}.rejected_timeout")
+        return Overloaded(503, "timeout", self._retry_after(len(self._waiting)))
+
+    # -- public API --
+
+    def _wait_limit(self, timeout: Optional[float]) -> float:
+        return self.queue_timeout if timeout is None else max(0.0, min(self.queue_timeout, timeout))
+
+    def acquire(self, user: Optional[str], priority: int = PRIORITY_TEXT, timeout: Optional[float] = None) -> Ticket:
+        """Block until admitted, at most timeout seconds (queue_timeout by default); raises Overloaded if rejected
+        or the wait runs out"""
+        event = threading.Event()
+        with self._lock:
+            ticket = self._admit(user, priority)
+            if ticket.granted_at is not None:
+                return ticket
+            ticket.notify = event.set
+        event.wait(self._wait_limit(timeout))
+        with self._lock:
+            if ticket.rejection is None and self._abandon(ticket):
+                raise self._timed_out()
+        self._admitted(ticket)
+        return ticket
+
+    async def acquire_async(self, user: Optional[str], priority: int = PRIORITY_TEXT,
+                            timeout: Optional[float] = None) -> Ticket:
+        """Await admission without holding a thread; raises Overloaded if rejected or the wait runs out"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            # May run on any thread (a Flask thread releasing its slot)
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            ticket = self._admit(user, priority)
+            if ticket.granted_at is not None:
+                return ticket
+            ticket.notify = wake
+        try:
+            await asyncio.wait_for(future, self._wait_limit(timeout))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if not self._abandon(ticket):
+                    self._release_locked(ticket)
+            raise
+        with self._lock:
+            if ticket.rejection is None and self._abandon(ticket):
+                raise self._timed_out()
+        self._admitted(ticket)
+        return ticket
+
+    def _release_locked(self, ticket):
+        held = time.monotonic() - ticket.granted_at
+        self._mean_hold = 0.9 * self._mean_hold + 0.1 * held
+        self._active -= 1
+        if ticket.user is not None:
+            left = self._active_by_user[ticket.user] - 1
+            if left:
+                self._active_by_user[ticket.user] = left
+            else:
+                del self._active_by_user[ticket.user]
+        self._dispatch()
+        self._publish()
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            self._release_locked(ticket)
+
+    @contextmanager
+    def slot(self, user: Optional[str], priority: int = PRIORITY_TEXT, timeout: Optional[float] = None):
+        ticket = self.acquire(user, priority, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, user: Optional[str], priority: int = PRIORITY_TEXT, timeout: Optional[float] = None):
+        ticket = await self.acquire_async(user, priority, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiting),
+                "users_active": len(self._active_by_user),
+                "max_concurrent": self.max_concurrent,
+                "max_per_user": self.max_per_user,
+                "max_queue": self.max_queue,
+                "mean_hold_seconds": round(self._mean_hold, 2)
+            }
@@ -0,0 +1,166 @@
+"""
+Semantic answer cache.
+
+Students in one class ask near-identical questions against the same
+material, and each one costs a full completion. An answer is cached under
+the retrieved context it was built on (a fingerprint of the context chunk
+ids and contents) together with the embedding of the question. A later
+question is served from the cache only if it retrieved exactly the same
+chunks and its embedding is within the similarity threshold of a cached
+question. Answers built on a different document set are never reused.
+
+Only prompts that carry nothing of one student's besides their name are
+cached: no chat history, no session summary, no interests (an answer that
+says "as we said above" is wrong in any other conversation). The name is
+taken out of the cached text (depersonalize) and the asking student's put
+back in when it is served (personalize), so students share answers.
+prompt_fingerprint() covers the rest of a prompt, for callers that need to
+tell personalized prompts apart.
+
+Entries expire after a TTL and the least recently used entry is evicted
+once the cache is full.
+"""
+
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from metrics import metrics
+
+
+def context_fingerprint(docs: Iterable) -> str:
+    """Stable hash of the retrieved context chunks; order doesn't matter, content does"""
+    keys = []
+    for doc in docs:
+        content_hash = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+        keys.append(f"{getattr(doc, 'id', None) or ''}:{content_hash}")
+    return hashlib.sha256("\n".join(sorted(keys)).encode("utf-8")).hexdigest()
+
+
+def prompt_fingerprint(docs: Iterable, *prompt_parts: str) -> str:
+    """context_fingerprint plus the rest of the prompt besides the question (profile, history, summary):
+    two prompts with the same fingerprint differ in the question alone"""
+    digest = hashlib.sha256(context_fingerprint(docs).encode("utf-8"))
+    for part in prompt_parts:
+        digest.update(b"\0" + (part or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+NAME_SLOT = "\ue000name\ue000"  # stands in for the student's name in a cached answer
+
+
+def depersonalize(answer: str, name: str) -> str:
+    """The answer with the student's name replaced by NAME_SLOT, for serving to other students"""
+    if not name:
+        return answer
+    return re.sub(rf"\b{re.escape(name)}\b", NAME_SLOT, answer)
+
+
+def personalize(answer: str, name: str) -> str:
+    """A depersonalized answer addressed to name"""
+    return answer.replace(NAME_SLOT, name)
+
+
+class CachedAnswer:
+    __slots__ = ("answer", "vector", "fingerprint", "created_at", "upstream_seconds", "hits")
+
+    def __init__(self, answer, vector, fingerprint, upstream_seconds):
+        self.answer = answer
+        self.vector = vector
+        self.fingerprint = fingerprint
+        self.created_at = time.monotonic()
+        self.upstream_seconds = upstream_seconds
+        self.hits = 0
+
+
+class SemanticAnswerCache:
+    """Answers keyed by context fingerprint + question-embedding similarity, with TTL and LRU eviction"""
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # entry id -> CachedAnswer, least recently used first
+        self._by_fingerprint = {}  # fingerprint -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_fingerprint.get(entry.fingerprint)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_fingerprint[entry.fingerprint]
+
+    def lookup(self, query_vector, fingerprint: str) -> Optional[CachedAnswer]:
+        """Best cached answer for this context whose question is similar enough, or None"""
+        query = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_fingerprint.get(fingerprint, ())):
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    metrics.incr("answer_cache.expired")
+                    continue
+                score = float(np.dot(query, entry.vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                metrics.incr("answer_cache.misses")
+                return None
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            entry.hits += 1
+            self.hits += 1
+            self.saved_seconds += entry.upstream_seconds
+        metrics.incr("answer_cache.hits")
+        metrics.incr("answer_cache.saved_upstream_seconds", entry.upstream_seconds)
+        return entry
+
+    def store(self, query_vector, fingerprint: str, answer: str, upstream_seconds: float = 0.0):
+        entry = CachedAnswer(answer, self._normalize(query_vector), fingerprint, upstream_seconds)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_fingerprint.setdefault(fingerprint, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                metrics.incr("answer_cache.evictions")
+        metrics.incr("answer_cache.stores")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_fingerprint.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "contexts": len(self._by_fingerprint),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_upstream_seconds": round(self.saved_seconds, 2),
+                "threshold": self.threshold
+            }
@@ -0,0 +1,102 @@
+"""
+One answer pipeline for text and voice questions.
+
+/api/chat, /api/chat/stream, their asyncio twins in asgi.py and /api/audio
+all answer a question the same way, and each used to carry its own copy of
+that logic, which had started to drift. They now share these stages, run
+in order on a Turn:
+
+  profile    load the session's history and the name/interests profile
+  history    the session's running summary
+  route      intent routing: template reply, LLM without retrieval, or the
+             full path
+  retrieve   scored chunks from the session cache and the indexes
+  dedupe     best first, duplicates removed, capped
+  prompt     system + user messages within the token budget
+  generate   the answer: answer cache, single-flight, admission, LLM
+  persist    append the turn to the session and save it
+
+The stage functions themselves live in app.py. Once a stage has set
+turn.answer (a template reply, say), the remaining stages up to persist are
+skipped. Callers may run stages one or a few at a time, e.g. to put them on
+different executors, or to stream the generate stage themselves inside
+timing().
+
+A turn carries its request's Deadline; stages read what is left of it and
+scale their own work down rather than overrun it.
+
+Every stage is timed: its latency goes to the "<name>.<stage>" histogram
+in /api/metrics, into turn.timings, and to any hooks added with add_hook().
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from metrics import metrics
+
+STAGES = ("profile", "history", "route", "retrieve", "dedupe", "prompt", "generate", "persist")
+
+
+class Turn:
+    """Everything one question/answer turn accumulates on its way through the stages"""
+
+    def __init__(self, user, session_id="default", message=None, priority=0, transcript=None, deadline=None):
+        self.user = user
+        self.session_id = session_id
+        self.message = message
+        self.priority = priority  # admission priority of the LLM call
+        self.transcript = transcript  # voice_pipeline.VoiceTranscript for voice questions
+        self.deadline = deadline  # deadline.Deadline every stage budgets against; None: unbounded
+        self.conv = None
+        self.profile = None  # {"name", "interests"}
+        self.summary = None
+        self.route = None
+        self.hits = []  # [(doc, relevance)]
+        self.query_vector = None
+        self.docs = []
+        self.retrieval = None  # {"query_vector", "fingerprint", "shareable", "name", "prompt_fingerprint"} for the answer cache
+        self.messages = None
+        self.answer = None
+        self.interrupted = False
+        self.assistant_msg = None
+        self.timings: Dict[str, float] = {}
+
+
+class AnswerPipeline:
+    def __init__(self, stages: Dict[str, Callable[[Turn], None]], name: str = "pipeline"):
+        missing = [stage for stage in STAGES if stage not in stages]
+        if missing:
+            raise ValueError(f"AnswerPipeline is missing stages: {', '.join(missing)}")
+        self.stages = stages
+        self.name = name
+        self.hooks = []
+
+    def add_hook(self, hook: Callable[[Turn, str, float], None]):
+        """Call hook(turn, stage, seconds) after every stage"""
+        self.hooks.append(hook)
+
+    @contextmanager
+    def timing(self, turn: Turn, stage: str):
+        """Time a stage run by the caller itself (e.g. a streamed generate) like run() times its own"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            turn.timings[stage] = turn.timings.get(stage, 0.0) + seconds
+            metrics.observe(f"{self.name}.{stage}", seconds)
+            for hook in self.hooks:
+                try:
+                    hook(turn, stage, seconds)
+                except Exception as e:
+                    print(f"[AnswerPipeline] Stage hook failed: {e}")
+
+    def run(self, turn: Turn, *stages: str) -> Turn:
+        """Run the given stages, in the order given (all of them by default)"""
+        for stage in stages or STAGES:
+            if turn.answer is not None and stage != "persist":
+                continue
+            with self.timing(turn, stage):
+                self.stages[stage](turn)
+        return turn
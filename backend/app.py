@@ -1,22 +1,42 @@
 import os
 import re
 import json
+import shutil
+import math
+import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
 from flask import Flask, request, session, jsonify, make_response, Response, stream_template, redirect
 from flask_cors import CORS
 from dotenv import load_dotenv
-import requests
-import pytesseract
-from PIL import Image
-from faster_whisper import WhisperModel
-import docx
+from ocr_engine import ocr_image
+from docx_stream import iter_docx_blocks, iter_text_chunks
+from transcription import transcribe_segments, iter_segment_windows, format_timestamp, decode_audio_stream
 import pandas as pd
+import numpy as np
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from storage_manager import storage_manager, GoogleDriveStorageProvider
-from functools import wraps
+from chunked_upload import ChunkedUploadManager, ChunkedUploadError
+from llm_client import ThetaLLM, AsyncThetaLLM, CircuitBreaker, HedgePolicy, LLMBackend
+from metrics import metrics
+from answer_cache import SemanticAnswerCache, context_fingerprint, prompt_fingerprint, depersonalize, personalize
+from retrieval_cache import SessionRetrievalCache, REUSE
+import retrieval_plan
+from prompt_cache import PromptCache
+from prompt_builder import PromptBudget, summary_messages
+from singleflight import SingleFlight, flight_key, shared_answer
+from session_profile import extract_user_profile, session_record_profile
+from intent_router import IntentRouter
+from voice_pipeline import VoicePipeline
+from answer_pipeline import AnswerPipeline, Turn, STAGES
+from deadline import Deadline
+from admission import AdmissionController, Overloaded, PRIORITY_TEXT, PRIORITY_AUDIO, PRIORITY_BACKGROUND
+from functools import wraps, partial
+from contextlib import nullcontext
 from flask import request, Response
 import os
 
@@ -29,6 +49,83 @@ load_dotenv()
 THETA_API_KEY = os.getenv("THETA_API_KEY")
 THETA_API_URL = os.getenv("THETA_API_URL", "https://ondemand.thetaedgecloud.com/infer_request/llama_3_1_70b/completions")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+# LLM client tuning
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BREAKER_FAILURE_RATIO = float(os.getenv("LLM_BREAKER_FAILURE_RATIO", "0.5"))
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "10"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "15"))
+# Backends to route completions over, as a JSON list of {"url", "kind": "theta"|"openai", "model", "name",
+# "api_key_env"}; unset means THETA_API_URL alone
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"  # backup request for slow completions
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))  # latency percentile after which to hedge
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+LLM_HEDGE_MAX_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MAX_DELAY_SECONDS", "10.0"))
+LLM_HEDGE_BUDGET_RATIO = float(os.getenv("LLM_HEDGE_BUDGET_RATIO", "0.1"))  # max extra upstream calls per request
+LLM_HEDGE_URL = os.getenv("LLM_HEDGE_URL") or None  # secondary endpoint for hedges (default: THETA_API_URL)
+LLM_HEDGE_KIND = os.getenv("LLM_HEDGE_KIND", LLMBackend.THETA)  # LLM_HEDGE_URL's API: theta or openai, as in LLM_BACKENDS
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL") or None  # model name sent to an openai-kind hedge endpoint
+LLM_HEDGE_API_KEY_ENV = os.getenv("LLM_HEDGE_API_KEY_ENV") or None  # env var holding its key (default: THETA_API_KEY)
+LLM_ASYNC_POOL_SIZE = int(os.getenv("LLM_ASYNC_POOL_SIZE", "200"))  # upstream connections for the ASGI chat routes
+ASYNC_RETRIEVAL_WORKERS = int(os.getenv("ASYNC_RETRIEVAL_WORKERS", "8"))  # threads for retrieval under asgi.py
+WSGI_BRIDGE_THREADS = int(os.getenv("WSGI_BRIDGE_THREADS", "16"))  # threads running the Flask routes under asgi.py
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity between questions
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_MIN_WORDS = int(os.getenv("ANSWER_CACHE_MIN_WORDS", "4"))  # shorter questions are usually follow-ups
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))  # shared pool for user/global index searches
+RETRIEVAL_USER_K = int(os.getenv("RETRIEVAL_USER_K", "3"))  # chunks from the user's own documents
+RETRIEVAL_GLOBAL_K = int(os.getenv("RETRIEVAL_GLOBAL_K", "2"))  # global chunks when the user's results are middling
+RETRIEVAL_GLOBAL_WIDE_K = int(os.getenv("RETRIEVAL_GLOBAL_WIDE_K", "4"))  # global chunks when they are weak or missing
+# Relevance thresholds for the adaptive global search. The defaults are uncalibrated placeholders
+# that disable the skip and shrink paths (only an exact match reaches 1.0) and widen the global
+# search only for users with no index or a very poor match (below 0.0), so the global search stays at
+# RETRIEVAL_GLOBAL_K. Set both from benchmarks/eval_adaptive_retrieval.py --calibrate for your indexes.
+RETRIEVAL_STRONG_RELEVANCE = float(os.getenv("RETRIEVAL_STRONG_RELEVANCE", "1.0"))  # user hits this good shrink/skip global
+RETRIEVAL_WEAK_RELEVANCE = float(os.getenv("RETRIEVAL_WEAK_RELEVANCE", "0.0"))  # best user hit below this widens global
+RETRIEVAL_PLAN_WAIT_SECONDS = float(os.getenv("RETRIEVAL_PLAN_WAIT_SECONDS", "0.05"))  # wait this long for user hits to size global
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"  # per-session reuse for follow-ups
+RETRIEVAL_CACHE_REUSE_SIMILARITY = float(os.getenv("RETRIEVAL_CACHE_REUSE_SIMILARITY", "0.9"))  # this close: skip the search
+RETRIEVAL_CACHE_MERGE_SIMILARITY = float(os.getenv("RETRIEVAL_CACHE_MERGE_SIMILARITY", "0.75"))  # this close: keep recent chunks too
+RETRIEVAL_CACHE_TURNS = int(os.getenv("RETRIEVAL_CACHE_TURNS", "3"))  # recent retrievals kept per session
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+RETRIEVAL_DEADLINES = {  # seconds each source may take before the turn goes ahead without it
+    "user": float(os.getenv("RETRIEVAL_USER_DEADLINE_SECONDS", "2.0")),
+    "global": float(os.getenv("RETRIEVAL_GLOBAL_DEADLINE_SECONDS", "2.0"))
+}
+REQUEST_DEADLINES = {  # seconds a whole turn may take, per route, from request to saved answer; 0 = unbounded
+    "chat": float(os.getenv("DEADLINE_CHAT_SECONDS", "25")),
+    "chat_stream": float(os.getenv("DEADLINE_CHAT_STREAM_SECONDS", "60")),
+    "audio": float(os.getenv("DEADLINE_AUDIO_SECONDS", "60"))
+}
+DEADLINE_GENERATE_RESERVE_SECONDS = float(os.getenv("DEADLINE_GENERATE_RESERVE_SECONDS", "8"))  # kept for the LLM while retrieving
+DEADLINE_MIN_GENERATE_SECONDS = float(os.getenv("DEADLINE_MIN_GENERATE_SECONDS", "2"))  # less left: don't call the LLM at all
+DEADLINE_PERSIST_RESERVE_SECONDS = float(os.getenv("DEADLINE_PERSIST_RESERVE_SECONDS", "0.5"))  # less left: save history in the background
+LLM_TOKENS_PER_SECOND = float(os.getenv("LLM_TOKENS_PER_SECOND", "25"))  # generation rate max_tokens is cut to the time left by
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "3000"))  # system + user message budget
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.35"))  # max share of the budget for chat history
+PROMPT_HISTORY_MESSAGES = int(os.getenv("PROMPT_HISTORY_MESSAGES", "6"))  # recent messages considered for history
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))  # newest messages never folded into the summary
+# Unsummarized older messages before re-summarizing: one background LLM call per this many messages
+# (half as many turns), competing with chat for admission slots and the upstream's rate limits
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "10"))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "30"))  # how long a duplicate question waits for the first
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))  # LLM calls in flight across all users
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "2"))  # LLM calls in flight per user
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))  # requests waiting for a slot before new ones are turned away
+ADMISSION_MAX_USER_QUEUE = int(os.getenv("ADMISSION_MAX_USER_QUEUE", "4"))  # of those, per user
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+INTENT_CLASSIFIER_ENABLED = os.getenv("INTENT_CLASSIFIER_ENABLED", "true").lower() == "true"  # embedding stage; rules always run
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.8"))  # cosine similarity to a small-talk prototype
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", "6"))  # longer messages are always treated as questions
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", "prompt_cache.sqlite3")  # shared by all workers on the machine
+PROMPT_CACHE_TTL_SECONDS = float(os.getenv("PROMPT_CACHE_TTL_SECONDS", "86400"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "5000"))
 # Secret key for JWT signing
 JWT_SECRET = os.getenv("SECRET_KEY", "studybuddy_secret_key")
 
@@ -40,6 +137,20 @@ DEMO_CODES = [
     os.getenv("DEMO_CODE_3", "STARTUP_DEMO_PASS")
 ]
 
+# Upload and ingestion configuration
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "500"))
+UPLOAD_PART_SIZE_MB = int(os.getenv("UPLOAD_PART_SIZE_MB", "8"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+VOICE_QUESTION_MAX_SECONDS = float(os.getenv("VOICE_QUESTION_MAX_SECONDS", "120"))  # longer voice questions are truncated
+VOICE_PIPELINE_ENABLED = os.getenv("VOICE_PIPELINE_ENABLED", "true").lower() == "true"  # overlap transcription and retrieval
+VOICE_PIPELINE_WORKERS = int(os.getenv("VOICE_PIPELINE_WORKERS", "4"))  # threads for profile loads and speculative retrieval
+VOICE_SPECULATE_AFTER_SEGMENTS = int(os.getenv("VOICE_SPECULATE_AFTER_SEGMENTS", "1"))  # transcript segments before retrieval starts
+VOICE_SPECULATE_MIN_WORDS = int(os.getenv("VOICE_SPECULATE_MIN_WORDS", "4"))  # ... and words
+VOICE_SPECULATION_KEEP_SIMILARITY = float(os.getenv("VOICE_SPECULATION_KEEP_SIMILARITY", "0.9"))  # partial vs final question
+AUDIO_EMBED_BATCH_WINDOWS = int(os.getenv("AUDIO_EMBED_BATCH_WINDOWS", "8"))  # transcript windows embedded per batch
+DOCX_EMBED_BATCH_CHUNKS = int(os.getenv("DOCX_EMBED_BATCH_CHUNKS", "32"))  # document chunks embedded per batch
+SUPPORTED_FILE_TYPES = ["pdf", "docx", "xlsx", "xls", "jpg", "jpeg", "png", "mp3", "wav", "m4a"]
+
 # Basic authentication credentials
 BASIC_AUTH_USERNAME = os.getenv('BASIC_AUTH_USERNAME', 'admin')
 BASIC_AUTH_PASSWORD = os.getenv('BASIC_AUTH_PASSWORD', 'your-secure-password')
@@ -74,7 +185,8 @@ if not THETA_API_KEY:
 app = Flask(__name__)
 app.secret_key = JWT_SECRET  # Secret key for session (also used for JWT signing)
 # Enable CORS for cross-origin requests with credentials (allow React dev origin)
-CORS(app, supports_credentials=True, resources={r"/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}})
+CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+CORS(app, supports_credentials=True, resources={r"/*": {"origins": CORS_ORIGINS}})
 print("[Flask] CORS configured for localhost:3000")
 
 # Apply basic auth to all routes except login/signup
@@ -99,15 +211,57 @@ def require_basic_auth():
 users_db_path = "users.json"
 vectorstores_dir = "vectorstores"
 vectorstores_cache = {}  # cache to store loaded vectorstores per user in memory
+vectorstore_merge_lock = threading.Lock()  # finished documents merged into a user's index one at a time
 global_vectorstore = None  # global vectorstore for shared knowledge
 
 books_dir = "books"
 conversation_histories = {}  # in-memory chat history per user
 chat_sessions = {}  # in-memory chat sessions per user
 
+# Resumable uploads: state is kept on disk so any worker can accept the next part
+chunked_uploads = ChunkedUploadManager(
+    state_dir="uploads",
+    max_upload_bytes=MAX_UPLOAD_SIZE_MB * 1024 * 1024,
+    default_part_size=UPLOAD_PART_SIZE_MB * 1024 * 1024
+)
+
+# Identical questions over the same context that are in flight together share one LLM call
+chat_flights = SingleFlight(wait_timeout=SINGLEFLIGHT_WAIT_SECONDS, name="singleflight.chat")
+
+# Concurrency limits and wait queue in front of the LLM, shared with asgi.py
+llm_admission = AdmissionController(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    max_per_user=ADMISSION_MAX_PER_USER,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_user_queue=ADMISSION_MAX_USER_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    name="admission.llm"
+)
+
+# Token budget for prompt assembly
+prompt_budget = PromptBudget(max_input_tokens=PROMPT_MAX_INPUT_TOKENS, max_history_share=PROMPT_HISTORY_SHARE)
+
+# Shared pool for fanning retrieval out over the user and global indexes
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
 # Initialize embeddings model
 embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/multi-qa-mpnet-base-dot-v1")
 
+# Answers to near-identical questions over the same retrieved context
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES
+)
+
+# Recent retrievals per chat session, reused for follow-up questions
+retrieval_cache = SessionRetrievalCache(
+    reuse_similarity=RETRIEVAL_CACHE_REUSE_SIMILARITY,
+    merge_similarity=RETRIEVAL_CACHE_MERGE_SIMILARITY,
+    turns=RETRIEVAL_CACHE_TURNS,
+    ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS
+)
+
 # Ensure base directories exist
 os.makedirs(vectorstores_dir, exist_ok=True)
 os.makedirs(books_dir, exist_ok=True)
@@ -151,6 +305,7 @@ def save_vectorstore_for_user(username, vs):
     vs.save_local(user_vector_dir)
     # Cache the vectorstore in memory as well
     vectorstores_cache[username] = vs
+    retrieval_cache.invalidate_user(username)
 
 # Global vectorstore functions for shared knowledge
 def load_global_vectorstore():
@@ -193,16 +348,20 @@ def update_global_vectorstore(texts, metadata=None):
     
     global_vectorstore.add_texts(texts, metadata)
     save_global_vectorstore()
+    retrieval_cache.invalidate_all()
     print(f"[INFO] Updated global vectorstore with {len(texts)} new texts")
 
-def search_global_knowledge(query, k=5):
-    """Search global knowledge base"""
+def search_global_knowledge(query, k=5, query_vector=None):
+    """Search global knowledge base (pass query_vector to reuse an embedding already computed for query)"""
     global global_vectorstore
     if not global_vectorstore:
         global_vectorstore = load_global_vectorstore()
     
     try:
-        results = global_vectorstore.similarity_search(query, k=k)
+        if query_vector is not None:
+            results = global_vectorstore.similarity_search_by_vector(query_vector, k=k)
+        else:
+            results = global_vectorstore.similarity_search(query, k=k)
         return results
     except Exception as e:
         print(f"[ERROR] Global knowledge search failed: {e}")
@@ -316,6 +475,7 @@ def rebuild_user_vectorstore(user):
         # No documents left, clear vectorstore
         if user in vectorstores_cache:
             del vectorstores_cache[user]
+        retrieval_cache.invalidate_user(user)
         user_vector_dir = os.path.join(vectorstores_dir, safe_filename(user))
         if os.path.exists(user_vector_dir):
             import shutil
@@ -338,17 +498,17 @@ def rebuild_user_vectorstore(user):
                 pages = loader.load()
                 all_docs.extend(splitter.split_documents(pages))
             elif ext in ["jpg", "jpeg", "png"]:
-                text = pytesseract.image_to_string(Image.open(file_path))
-                all_docs.extend(splitter.create_documents([text]))
+                ocr_result = ocr_image(file_path)
+                all_docs.extend(splitter.create_documents([ocr_result["text"]], metadatas=[ocr_metadata(ocr_result, filename)]))
             elif ext in ["mp3", "wav", "m4a"]:
-                model = WhisperModel("base")
-                segments, info = model.transcribe(file_path)
-                result_text = " ".join([seg.text for seg in segments])
-                all_docs.extend(splitter.create_documents([result_text]))
+                segments, info = transcribe_segments(file_path)
+                # Collected before adding, so a transcription that fails part-way leaves nothing behind
+                all_docs.extend([audio_window_to_document(window, filename)
+                                 for window in iter_segment_windows(segments, window_chars=1000)])
             elif ext == "docx":
-                doc_obj = docx.Document(file_path)
-                full_text = "\n".join([para.text for para in doc_obj.paragraphs])
-                all_docs.extend(splitter.create_documents([full_text]))
+                # Collected before adding, so a document whose XML breaks part-way leaves nothing behind
+                all_docs.extend([Document(page_content=chunk, metadata={"source": filename})
+                                 for chunk in iter_text_chunks(iter_docx_blocks(file_path), splitter)])
             elif ext in ["xlsx", "xls"]:
                 df = pd.read_excel(file_path, engine="openpyxl" if ext == "xlsx" else "xlrd")
                 csv_text = df.to_csv(index=False)
@@ -369,11 +529,124 @@ def rebuild_user_vectorstore(user):
         # No valid documents, clear vectorstore
         if user in vectorstores_cache:
             del vectorstores_cache[user]
+        retrieval_cache.invalidate_user(user)
         user_vector_dir = os.path.join(vectorstores_dir, safe_filename(user))
         if os.path.exists(user_vector_dir):
             import shutil
             shutil.rmtree(user_vector_dir)
 
+def stage_documents(staged, docs):
+    """Embed docs into a document's staging index (created on the first batch), apart from the user's index"""
+    if staged is None:
+        return FAISS.from_documents(docs, embeddings)
+    staged.add_documents(docs)
+    return staged
+
+def merge_into_user_vectorstore(user, staged):
+    """Add a fully indexed document's staging index to the user's index and save it"""
+    with vectorstore_merge_lock:
+        vs = load_vectorstore_for_user(user)
+        if vs is None:
+            vs = staged
+        else:
+            vs.merge_from(staged)
+        save_vectorstore_for_user(user, vs)
+
+def audio_window_to_document(window, filename):
+    """Turn a transcript window into a chunk that remembers the time range it covers"""
+    return Document(
+        page_content=window["text"],
+        metadata={
+            "source": filename,
+            "start": round(window["start"], 2),
+            "end": round(window["end"], 2),
+            "time_range": f"{format_timestamp(window['start'])}-{format_timestamp(window['end'])}"
+        }
+    )
+
+def ocr_metadata(ocr_result, filename):
+    """Chunk metadata recording how an image was OCR'd and how confident Tesseract was"""
+    return {
+        "source": filename,
+        "ocr_confidence": ocr_result["confidence"],
+        "ocr_lang": ocr_result["lang"],
+        "ocr_preprocess_ms": ocr_result["preprocess_ms"],
+        "ocr_ms": ocr_result["ocr_ms"],
+        "ocr_skew_angle": ocr_result["skew_angle"]
+    }
+
+def update_processing_message(user, filename, content):
+    """Replace the in-progress message for a file upload with a progress update"""
+    conv = get_conversation(user, "default")
+    for msg in reversed(conv):
+        if msg["role"] == "assistant" and f"Processing your file '{filename}'" in msg["content"]:
+            msg["content"] = content
+            save_conversation(user, "default")
+            return
+
+def index_documents_incrementally(user, docs, batch_size, on_batch=None):
+    """Embed a stream of one document's chunks a batch at a time, then add them to the user's vectorstore.
+    
+    Batches go into a staging index of their own, which is merged into the user's index (and
+    saved) only once the whole stream has been read. If transcription, extraction or embedding
+    fails part-way the exception propagates and nothing of the document reaches the user's
+    index, so a retried upload doesn't add its chunks twice. on_batch(last_doc) is called after
+    each batch, e.g. to report progress. Returns the number of chunks indexed and the first
+    ~2000 characters of their text.
+    """
+    staged = None
+    pending = []
+    chunk_count = 0
+    text_blob = ""
+    
+    for doc in docs:
+        pending.append(doc)
+        if len(text_blob) < 2000:
+            text_blob = (text_blob + "\n" + doc.page_content).strip()[:2000]
+        if len(pending) >= batch_size:
+            staged = stage_documents(staged, pending)
+            chunk_count += len(pending)
+            pending = []
+            if on_batch:
+                on_batch(doc)
+    
+    if pending:
+        staged = stage_documents(staged, pending)
+        chunk_count += len(pending)
+    if staged is not None:
+        merge_into_user_vectorstore(user, staged)
+    return chunk_count, text_blob
+
+def index_audio_incrementally(user, file_path, filename):
+    """Transcribe an audio file and embed its transcript in batches as Whisper produces segments"""
+    segments, info = transcribe_segments(file_path)
+    duration = format_timestamp(info.duration)
+    
+    def report_progress(doc):
+        transcribed = format_timestamp(doc.metadata["end"])
+        print(f"[Background Processing] Transcribed {transcribed} of {duration}")
+        update_processing_message(
+            user, filename,
+            f"Processing your file '{filename}'... transcribed {transcribed} of {duration} so far."
+        )
+    
+    docs = (audio_window_to_document(window, filename)
+            for window in iter_segment_windows(segments, window_chars=1000))
+    return index_documents_incrementally(user, docs, AUDIO_EMBED_BATCH_WINDOWS, on_batch=report_progress)
+
+def index_docx_incrementally(user, file_path, filename, splitter):
+    """Stream paragraphs and table rows out of a .docx and embed them in batches"""
+    docs = (Document(page_content=chunk, metadata={"source": filename})
+            for chunk in iter_text_chunks(iter_docx_blocks(file_path), splitter))
+    return index_documents_incrementally(user, docs, DOCX_EMBED_BATCH_CHUNKS)
+
+def format_doc_for_prompt(doc):
+    """Render a retrieved chunk for the prompt, tagging transcript chunks with their time range"""
+    time_range = doc.metadata.get("time_range") if hasattr(doc, "metadata") else None
+    if time_range:
+        return f"[{doc.metadata.get('source', 'recording')} @ {time_range}] {doc.page_content}"
+    return doc.page_content
+
 def search_user_documents(user, query, k=5):
     """Search user's documents with query"""
     vs = load_vectorstore_for_user(user)
@@ -390,52 +663,89 @@ def search_user_documents(user, query, k=5):
 # Initialize embedding model for document vectors (multilingual support)
 embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/multi-qa-mpnet-base-dot-v1")
 
-# Theta API LLM interface (LLaMA 3 70B)
-class ThetaLLM:
-    def __init__(self, api_key, url=THETA_API_URL, temperature=0.5, top_p=0.7, max_tokens=500):
-        self.url = url
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        self.temperature = temperature
-        self.top_p = top_p
-        self.max_tokens = max_tokens
-
-    def invoke(self, messages):
-        # messages: list of {"role": ..., "content": ...}
-        payload = {
-            "input": {
-                "messages": messages,
-                "temperature": self.temperature,
-                "top_p": self.top_p,
-                "max_tokens": self.max_tokens,
-                "stream": False
-            }
-        }
-        try:
-            response = requests.post(self.url, headers=self.headers, json=payload, timeout=30)
-            response.raise_for_status()
-        except requests.exceptions.Timeout:
-            print("[Theta API Timeout] Request timed out")
-            return "⚠️ Request timed out. Please try again."
-        except Exception as e:
-            print(f"[Theta API Error] {e}")
-            return "⚠️ Error from Theta API"
-        data = response.json()
+# Small talk and acknowledgements are answered from templates, without retrieval or the LLM
+intent_router = IntentRouter(
+    embed_query=embeddings.embed_query if INTENT_CLASSIFIER_ENABLED else None,
+    embed_documents=embeddings.embed_documents if INTENT_CLASSIFIER_ENABLED else None,
+    threshold=INTENT_THRESHOLD,
+    max_words=INTENT_MAX_WORDS
+)
+
+# Voice questions: retrieval starts on the partial transcript while Whisper is still decoding
+voice_executor = ThreadPoolExecutor(max_workers=VOICE_PIPELINE_WORKERS, thread_name_prefix="voice")
+voice_pipeline = VoicePipeline(
+    # Voice questions are short: sequential decoding answers sooner than batching
+    transcribe=lambda audio: transcribe_segments(audio, batched=False),
+    embed_query=embeddings.embed_query,
+    executor=voice_executor,
+    speculate_after_segments=VOICE_SPECULATE_AFTER_SEGMENTS,
+    speculate_min_words=VOICE_SPECULATE_MIN_WORDS,
+    keep_similarity=VOICE_SPECULATION_KEEP_SIMILARITY
+)
+
+# Exact-match prompt cache on disk, shared by the sync and async clients
+prompt_cache = PromptCache(
+    path=PROMPT_CACHE_PATH,
+    ttl_seconds=PROMPT_CACHE_TTL_SECONDS,
+    max_entries=PROMPT_CACHE_MAX_ENTRIES
+) if PROMPT_CACHE_ENABLED else None
+
+# Optional hedging of slow completions, shared by both clients so they spend one budget
+llm_hedge = HedgePolicy(
+    percentile=LLM_HEDGE_PERCENTILE,
+    min_delay=LLM_HEDGE_MIN_DELAY_SECONDS,
+    max_delay=LLM_HEDGE_MAX_DELAY_SECONDS,
+    budget_ratio=LLM_HEDGE_BUDGET_RATIO,
+    url=LLM_HEDGE_URL,
+    kind=LLM_HEDGE_KIND,
+    model=LLM_HEDGE_MODEL,
+    api_key=os.getenv(LLM_HEDGE_API_KEY_ENV) if LLM_HEDGE_API_KEY_ENV else None
+) if LLM_HEDGE_ENABLED else None
+
+def load_llm_backends():
+    """Completion backends from LLM_BACKENDS, each with its own circuit breaker; THETA_API_URL if unset or invalid"""
+    def breaker():
+        return CircuitBreaker(
+            failure_ratio=LLM_BREAKER_FAILURE_RATIO,
+            min_requests=LLM_BREAKER_MIN_REQUESTS,
+            cooldown_seconds=LLM_BREAKER_COOLDOWN_SECONDS
+        )
+    if LLM_BACKENDS:
         try:
-            assistant_msg = data["body"]["infer_requests"][0]["output"]["message"]
-            if isinstance(assistant_msg, dict):
-                return assistant_msg.get("content", "")
-            return assistant_msg  # if it's already a string
-        except Exception as e:
-            print(f"[Theta API Error] {e}")
-            return "⚠️ Error from Theta API"
-
-
-
-# Initialize the LLM with API key
-llm = ThetaLLM(api_key=THETA_API_KEY)
+            backends = []
+            for spec in json.loads(LLM_BACKENDS):
+                api_key = os.getenv(spec["api_key_env"]) if spec.get("api_key_env") else THETA_API_KEY
+                backends.append(LLMBackend(spec["url"], api_key, kind=spec.get("kind", LLMBackend.THETA),
+                                           model=spec.get("model"), name=spec.get("name"), breaker=breaker()))
+            if backends:
+                print(f"[LLM] Routing over {len(backends)} backends: {', '.join(b.name for b in backends)}")
+                return backends
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[LLM] Invalid LLM_BACKENDS ({e}); using THETA_API_URL")
+    return [LLMBackend(THETA_API_URL, THETA_API_KEY, breaker=breaker())]
+
+llm_backends = load_llm_backends()
+
+# Initialize the LLM (routing over the backends, pooled session, retries, prompt cache and hedging)
+llm = ThetaLLM(
+    api_key=THETA_API_KEY,
+    backends=llm_backends,
+    timeout=LLM_TIMEOUT_SECONDS,
+    pool_size=LLM_POOL_SIZE,
+    max_retries=LLM_MAX_RETRIES,
+    prompt_cache=prompt_cache,
+    hedge=llm_hedge
+)
+# Asyncio client for the chat routes served by asgi.py; shares the backends, so load and health are tracked once
+async_llm = AsyncThetaLLM(
+    api_key=THETA_API_KEY,
+    backends=llm_backends,
+    timeout=LLM_TIMEOUT_SECONDS,
+    pool_size=LLM_ASYNC_POOL_SIZE,
+    max_retries=LLM_MAX_RETRIES,
+    prompt_cache=prompt_cache,
+    hedge=llm_hedge
+)
 
 # Chat sessions management
 def get_user_sessions(user):
@@ -460,8 +770,27 @@ def get_user_sessions(user):
             save_user_sessions(user)
     return chat_sessions[user]
 
+# Every write of a history or sessions file (chat turns, session edits, upload notices, summaries)
+# runs on this one thread, so writes to the same file never interleave whichever route or
+# background job makes them. It also takes history writes that don't fit in a request's deadline.
+persistence_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+
+def run_persistence(func, *args):
+    """Run func on the persistence thread and wait for its result; directly if already on it"""
+    if threading.current_thread().name.startswith("persistence"):
+        return func(*args)
+    try:
+        future = persistence_executor.submit(func, *args)
+    except RuntimeError:
+        # Shut down with the server: a late write from a background job is made here rather than lost
+        return func(*args)
+    return future.result()
+
 def save_user_sessions(user):
     """Save chat sessions for a user"""
+    run_persistence(write_user_sessions, user)
+
+def write_user_sessions(user):
     sessions = chat_sessions.get(user, [])
     filename = f"chat_sessions_{safe_filename(user)}.json"
     with open(filename, "w") as f:
@@ -484,6 +813,9 @@ def get_conversation(user, session_id="default"):
 
 def save_conversation(user, session_id="default"):
     """Save conversation history for a specific chat session"""
+    run_persistence(write_conversation, user, session_id)
+
+def write_conversation(user, session_id):
     key = f"{user}_{session_id}"
     hist = conversation_histories.get(key, [])
     filename = f"chat_history_{safe_filename(user)}_{session_id}.json"
@@ -536,33 +868,466 @@ def delete_session(user, session_id):
     key = f"{user}_{session_id}"
     if key in conversation_histories:
         del conversation_histories[key]
+    retrieval_cache.drop_session(user, session_id)
     
     filename = f"chat_history_{safe_filename(user)}_{session_id}.json"
     if os.path.exists(filename):
-        os.remove(filename)
+        # After any queued write of the same file, so it can't come back
+        run_persistence(os.remove, filename)
     
     return True
 
-# Extract simple profile info (name, interests) from past user messages
-def extract_user_profile(history, default_name="User"):
-    profile = {"name": default_name, "interests": set()}
-    for msg in history:
-        if msg.get("role") == "user":
-            text = msg["content"].lower()
-            if "my name is" in text:
-                part = text.split("my name is", 1)[1].strip()
-                if part:
-                    name = part.split()[0]
-                    profile["name"] = name.capitalize()
-            if "i like" in text or "i am interested in" in text:
-                if "i like" in text:
-                    interest = text.split("i like", 1)[1].strip()
-                else:
-                    interest = text.split("interested in", 1)[1].strip()
-                if interest:
-                    interest = interest.split('.')[0]
-                    profile["interests"].add(interest.capitalize())
-    return profile
+def find_session(user, session_id):
+    """The session record for session_id, or None"""
+    return next((s for s in get_user_sessions(user) if s["id"] == session_id), None)
+
+def get_session_profile(user, session_id, conv, default_name="User"):
+    """Profile for a chat session, kept in its session record (saved with the sessions file; see session_profile)"""
+    record = find_session(user, session_id)
+    if record is None:
+        return extract_user_profile(conv, default_name)
+    return session_record_profile(record, conv, default_name)
+
+def relevance(distance, query_norm_sq):
+    """Cosine-like relevance of a FAISS hit from its squared L2 distance: 1 - d² / 2|q|².
+    
+    Exact when the chunk's embedding has the query's norm; close enough to rank and threshold on.
+    """
+    return 1.0 - distance / (2.0 * query_norm_sq) if query_norm_sq else 0.0
+
+def search_user_source(user, query_vector, k):
+    """Scored top chunks from the user's own index (the 'user' retrieval source)"""
+    vs = load_vectorstore_for_user(user)
+    if vs is None:
+        return []
+    return vs.similarity_search_with_score_by_vector(query_vector, k=k)
+
+def search_global_source(query_vector, k):
+    """Scored top chunks from the global index (the 'global' source)"""
+    global global_vectorstore
+    if not global_vectorstore:
+        global_vectorstore = load_global_vectorstore()
+    return global_vectorstore.similarity_search_with_score_by_vector(query_vector, k=k)
+
+def timed_source(name, func, *args):
+    with metrics.timer(f"retrieval.{name}"):
+        return func(*args)
+
+def plan_global_search(user_hits):
+    """How many global chunks to fetch, given the user's own hits as (doc, relevance); returns (k, decision)"""
+    return retrieval_plan.plan_global_search(user_hits, RETRIEVAL_USER_K, RETRIEVAL_GLOBAL_K, RETRIEVAL_GLOBAL_WIDE_K,
+                                             RETRIEVAL_STRONG_RELEVANCE, RETRIEVAL_WEAK_RELEVANCE)
+
+def source_hits(name, future, start, query_norm_sq, cutoff=math.inf):
+    """A source's hits as (doc, relevance) within its deadline; [] if it errors or runs out of time.
+    
+    cutoff (time.monotonic()) is when the request's retrieval budget ends, if that comes first.
+    """
+    now = time.monotonic()
+    remaining = max(0.0, min(RETRIEVAL_DEADLINES[name] - (now - start), cutoff - now))
+    try:
+        return [(doc, relevance(distance, query_norm_sq)) for doc, distance in future.result(timeout=remaining)]
+    except FutureTimeoutError:
+        future.cancel()
+        metrics.incr(f"retrieval.{name}.timeouts")
+        print(f"[Retrieval] {name} index missed its deadline after {time.monotonic() - start:.2f}s; answering without it")
+    except Exception as e:
+        metrics.incr(f"retrieval.{name}.errors")
+        print(f"[Retrieval] {name} index search failed: {e}")
+    return []
+
+def dedupe_hits(hits, limit=5):
+    """(doc, relevance) hits best first, without repeated chunks, capped at limit"""
+    unique_hits = []
+    seen_content = set()
+    for doc, score in sorted(hits, key=lambda hit: hit[1], reverse=True):
+        if doc.page_content not in seen_content:
+            unique_hits.append((doc, score))
+            seen_content.add(doc.page_content)
+        if len(unique_hits) >= limit:
+            break
+    return unique_hits
+
+def search_context(user, message, query_vector=None, session_id=None, deadline=None):
+    """Score-aware search of the user's index, then as much of the global index as it needs.
+    
+    The question is embedded once (or query_vector, if already computed, is reused) and both
+    indexes are searched by that vector. How many global chunks are fetched depends on how well
+    the user's own chunks matched (see plan_global_search). The user's index usually answers
+    within RETRIEVAL_PLAN_WAIT_SECONDS, and then the global search starts at that size, or not at
+    all; if it is slower, the global search starts alongside it at RETRIEVAL_GLOBAL_WIDE_K and is
+    cut down, or dropped without waiting for it, once the user's hits are in. Each source has its own deadline,
+    counted from the start of retrieval; one that errors or runs out contributes nothing.
+    With a session_id, a follow-up close to one of the session's recent questions reuses that
+    retrieval, or keeps its chunks as candidates next to the fresh hits (see retrieval_cache).
+    With a request deadline, retrieval only spends what is left of it after
+    DEADLINE_GENERATE_RESERVE_SECONDS is kept back for the LLM: the global search is skipped
+    once that budget is gone, and no index is searched if it is gone before retrieval starts.
+    Returns (hits, query_vector): hits as (doc, relevance) from both sources, not yet
+    de-duplicated (see dedupe_hits); query_vector is None only if the question couldn't be embedded.
+    """
+    start = time.monotonic()
+    if query_vector is None:
+        try:
+            with metrics.timer("retrieval.embed"):
+                query_vector = embeddings.embed_query(message)
+        except Exception as e:
+            metrics.incr("retrieval.embed.errors")
+            print(f"[Retrieval] Could not embed the question: {e}")
+            return [], None
+    query_norm_sq = float(np.dot(query_vector, query_vector))
+    
+    use_cache = RETRIEVAL_CACHE_ENABLED and session_id is not None
+    cache_kind, carried = None, []
+    if use_cache:
+        # Taken before searching, so a retrieval racing an index change is never cached
+        index_version = retrieval_cache.version(user)
+        cache_kind, carried = retrieval_cache.lookup(user, session_id, query_vector)
+    cutoff = math.inf if deadline is None else time.monotonic() + deadline.remaining(DEADLINE_GENERATE_RESERVE_SECONDS)
+    searched = cache_kind != REUSE and time.monotonic() < cutoff
+    if cache_kind == REUSE:
+        hits = carried
+    elif not searched:
+        # Out of time before retrieval started: answer from the session's recent chunks, if any
+        metrics.incr("retrieval.skipped_deadline")
+        hits = carried
+    else:
+        user_future = retrieval_pool.submit(timed_source, "user", search_user_source, user, query_vector, RETRIEVAL_USER_K)
+        wait_futures([user_future], timeout=max(0.0, min(RETRIEVAL_PLAN_WAIT_SECONDS, cutoff - time.monotonic())))
+        global_future = None
+        if not user_future.done():
+            # A slow user index: search the global one alongside it at its widest, and trim later
+            metrics.incr("retrieval.global_speculative")
+            global_future = retrieval_pool.submit(timed_source, "global", search_global_source, query_vector,
+                                                  max(RETRIEVAL_GLOBAL_WIDE_K, RETRIEVAL_GLOBAL_K, 1))
+        hits = source_hits("user", user_future, start, query_norm_sq, cutoff)
+        global_k, decision = plan_global_search(hits)
+        metrics.incr(f"retrieval.global_{decision}")
+        if global_k and time.monotonic() >= cutoff:
+            metrics.incr("retrieval.global_skipped_deadline")
+            global_k = 0
+        if global_k:
+            if global_future is None:
+                global_future = retrieval_pool.submit(timed_source, "global", search_global_source, query_vector, global_k)
+            global_hits = source_hits("global", global_future, start, query_norm_sq, cutoff)
+            hits.extend(sorted(global_hits, key=lambda hit: hit[1], reverse=True)[:global_k])
+        elif global_future is not None:
+            # Not waited for; a search already running finishes on its worker and is discarded
+            global_future.cancel()
+        hits.extend(carried)
+    
+    if use_cache and searched:
+        retrieval_cache.store(user, session_id, query_vector, dedupe_hits(hits), index_version)
+    return hits, query_vector
+
+def retrieve_context(user, message, query_vector=None, session_id=None):
+    """search_context, de-duplicated: (docs, query_vector) with docs best first and capped at 5"""
+    hits, query_vector = search_context(user, message, query_vector, session_id)
+    return [doc for doc, _ in dedupe_hits(hits)], query_vector
+
+def assemble_system_prompt(user, instructions, docs, conv, user_content, summary=None):
+    """Fit ranked context and recent history into the prompt token budget and log the result.
+    
+    With a session summary, history is the summary plus every message it doesn't cover yet, however
+    far it lags behind; the budget keeps the newest of them that fit.
+    """
+    if summary and summary["covered"] <= len(conv):
+        history = conv[summary["covered"]:]
+        summary_text = summary["text"]
+    else:
+        history = conv[-PROMPT_HISTORY_MESSAGES:]
+        summary_text = None
+    system_content, stats = prompt_budget.build_system_prompt(
+        instructions,
+        [format_doc_for_prompt(doc) for doc in docs],
+        history,
+        user_content,
+        summary=summary_text
+    )
+    metrics.incr("prompt.turns")
+    metrics.incr("prompt.input_tokens", stats["input_tokens"])
+    metrics.incr("prompt.trimmed", stats["trimmed"])
+    metrics.incr("prompt.history_tokens", stats["history_tokens"])
+    print(f"[Prompt] {user}: {stats['input_tokens']}/{stats['budget']} input tokens, "
+          f"{stats['context_chunks']}/{stats['context_chunks_available']} chunks, "
+          f"{stats['history_messages']}/{stats['history_messages_available']} history messages"
+          f"{' + summary' if stats['summary'] else ''}, "
+          f"{stats['trimmed']} trimmed")
+    return system_content
+
+def answer_cache_applies(message, retrieval):
+    """Whether a question may be answered from / stored in the answer cache.
+    
+    Only a shareable prompt (see stage_prompt) is: one whose answer suits any student who asks it.
+    """
+    return (ANSWER_CACHE_ENABLED and retrieval["query_vector"] is not None and retrieval.get("shareable")
+            and len(message.split()) >= ANSWER_CACHE_MIN_WORDS)
+
+def cached_answer(message, retrieval):
+    """Answer given earlier, to any student, to a near-identical question over the same chunks, or None"""
+    if not answer_cache_applies(message, retrieval):
+        return None
+    entry = answer_cache.lookup(retrieval["query_vector"], retrieval["fingerprint"])
+    return personalize(entry.answer, retrieval["name"]) if entry else None
+
+def request_deadline(route):
+    """The deadline for a request to route, counted from now (see REQUEST_DEADLINES)"""
+    return Deadline(REQUEST_DEADLINES[route], route)
+
+def generation_skipped(deadline):
+    """Whether too little of the deadline is left to call the LLM at all"""
+    if deadline is None or deadline.remaining() >= DEADLINE_MIN_GENERATE_SECONDS:
+        return False
+    metrics.incr("deadline.generate_skipped")
+    return True
+
+def generation_wait(deadline):
+    """How long the LLM call may wait for an admission slot or an identical call in flight (None: their defaults)"""
+    return None if deadline is None or not deadline.bounded else deadline.remaining(DEADLINE_MIN_GENERATE_SECONDS)
+
+def generation_budget(deadline):
+    """LLM call kwargs that fit it into what is left of the deadline: a timeout, and a shorter max_tokens if needed.
+    
+    Called once the call is admitted, so time spent waiting is already gone from the budget.
+    """
+    if deadline is None or not deadline.bounded:
+        return {}
+    seconds = deadline.remaining(DEADLINE_PERSIST_RESERVE_SECONDS)
+    budget = {"timeout": seconds}
+    max_tokens = max(1, int(seconds * LLM_TOKENS_PER_SECOND))
+    if max_tokens < llm.max_tokens:
+        metrics.incr("deadline.max_tokens_cut")
+        budget["max_tokens"] = max_tokens
+    return budget
+
+def generate_answer(user, message, messages, retrieval, priority=PRIORITY_TEXT, deadline=None):
+    """Answer from the cache, from an identical call already in flight, or from the LLM.
+    
+    Only an actual LLM call takes an admission slot; raises Overloaded if it isn't admitted.
+    With a deadline, the waits and the LLM call itself are cut to what is left of it, and
+    DEADLINE_EXHAUSTED_MESSAGE is returned if too little is left to call the LLM.
+    """
+    answer_text = cached_answer(message, retrieval)
+    if answer_text is not None:
+        return answer_text
+    if generation_skipped(deadline):
+        return DEADLINE_EXHAUSTED_MESSAGE
+    
+    def call_llm():
+        with llm_admission.slot(user, priority, generation_wait(deadline)):
+            budget = generation_budget(deadline)
+            start = time.perf_counter()
+            result = llm.invoke(messages, **budget)
+        if isinstance(result, str):
+            text = result
+        elif isinstance(result, dict):
+            text = result.get("content", "")
+        else:
+            text = str(result)
+        if "max_tokens" not in budget:
+            # A shortened answer is fine for this request, not for the next one asking the same
+            remember_answer(message, retrieval, text, time.perf_counter() - start)
+        return shared_answer(text, retrieval)
+    
+    answer_text, _ = chat_flights.do(flight_key(user, message, retrieval), call_llm, generation_wait(deadline))
+    return personalize(answer_text, retrieval["name"])
+
+def remember_answer(message, retrieval, answer_text, upstream_seconds):
+    """Cache a fresh answer; error messages from the LLM client are never cached"""
+    if answer_text and "⚠️" not in answer_text and answer_cache_applies(message, retrieval):
+        answer_cache.store(retrieval["query_vector"], retrieval["fingerprint"],
+                           depersonalize(answer_text, retrieval["name"]), upstream_seconds)
+
+def save_chat_files(user, session_id):
+    try:
+        save_conversation(user, session_id)
+        save_user_sessions(user)
+    except Exception as e:
+        print(f"[History] Could not save session {session_id} for {user}: {e}")
+
+def record_chat_turn(user, session_id, conv, message, answer_text, interrupted=False, deadline=None):
+    """Append a question/answer pair to a session, save it and bump the session timestamp.
+    
+    The files are written on the persistence thread; if the deadline has less than
+    DEADLINE_PERSIST_RESERVE_SECONDS left, the turn doesn't wait for them.
+    """
+    assistant_msg = {"role": "assistant", "content": answer_text}
+    if interrupted:
+        assistant_msg["interrupted"] = True
+    conv.append({"role": "user", "content": message})
+    conv.append(assistant_msg)
+    
+    # Update session timestamp
+    sessions = get_user_sessions(user)
+    for session in sessions:
+        if session["id"] == session_id:
+            session["updated_at"] = datetime.datetime.now().isoformat()
+            break
+    if deadline is not None and deadline.remaining() < DEADLINE_PERSIST_RESERVE_SECONDS:
+        metrics.incr("deadline.persist_deferred")
+        persistence_executor.submit(save_chat_files, user, session_id)
+    else:
+        save_chat_files(user, session_id)
+    schedule_session_summary(user, session_id, conv)
+    return assistant_msg
+
+# The answer pipeline: the stages every text and voice question goes through (see answer_pipeline.py)
+NO_API_KEY_MESSAGE = "⚠️ LLM API key not configured. Please set THETA_API_KEY in your environment."
+DEADLINE_EXHAUSTED_MESSAGE = "⚠️ Sorry, this question took too long to answer. Please try again."
+CONTEXT_INSTRUCTIONS = (
+    "You are a knowledgeable teacher assistant. You strictly rely on the provided content to answer the question.\n"
+    "If the context does NOT contain enough information, politely say you couldn't find relevant info in the material, and then give a brief general explanation.\n"
+    "You can understand and respond in English, Tamil, or Arabic as appropriate.\n"
+    "When a context passage is tagged with a recording time range, cite that time range in your answer.\n"
+)
+GENERAL_INSTRUCTIONS = (
+    "You are a helpful teacher assistant. Answer the user's question clearly and truthfully.\n"
+    "If the question refers to uploaded documents but no relevant info is found, apologize for not finding info in the material and answer generally.\n"
+    "You can understand and respond in English, Tamil, or Arabic as appropriate."
+)
+
+def stage_profile(turn):
+    turn.conv = get_conversation(turn.user, turn.session_id)
+    turn.profile = get_session_profile(turn.user, turn.session_id, turn.conv,
+                                       default_name=turn.user.split('@')[0].capitalize())
+
+def stage_history(turn):
+    turn.summary = get_session_summary(turn.user, turn.session_id)
+
+def stage_route(turn):
+    """Small talk is answered from a template here, and everything is when there's no API key"""
+    turn.route = intent_router.classify(turn.message)
+    if turn.route.templated:
+        turn.answer = turn.route.reply(turn.profile["name"])
+    elif not THETA_API_KEY:
+        turn.answer = NO_API_KEY_MESSAGE
+    if turn.transcript is not None and (turn.answer is not None or not turn.route.needs_retrieval):
+        voice_pipeline.discard(turn.transcript)
+
+def stage_retrieve(turn):
+    """User's documents + global knowledge; a voice question reuses the retrieval it started on its partial transcript"""
+    if not turn.route.needs_retrieval:
+        turn.hits, turn.query_vector = [], turn.route.query_vector
+    elif turn.transcript is not None:
+        retrieve = partial(search_context, turn.user, session_id=turn.session_id, deadline=turn.deadline)
+        turn.hits, turn.query_vector = voice_pipeline.context(turn.transcript, retrieve, turn.route.query_vector)
+    else:
+        turn.hits, turn.query_vector = search_context(turn.user, turn.message, turn.route.query_vector,
+                                                      turn.session_id, turn.deadline)
+
+def stage_dedupe(turn):
+    turn.docs = [doc for doc, _ in dedupe_hits(turn.hits)]
+    # The question's embedding and the chunks it retrieved key the answer cache
+    turn.retrieval = {"query_vector": turn.query_vector, "fingerprint": context_fingerprint(turn.docs)}
+
+def stage_prompt(turn):
+    context_prefix = f"User Name: {turn.profile['name']}\n"
+    if turn.profile["interests"]:
+        context_prefix += "User Interests: " + ", ".join(turn.profile["interests"]) + "\n"
+    user_content = f"{context_prefix}Question: {turn.message}"
+    instructions = CONTEXT_INSTRUCTIONS if turn.docs else GENERAL_INSTRUCTIONS
+    system_content = assemble_system_prompt(turn.user, instructions, turn.docs, turn.conv, user_content, turn.summary)
+    turn.messages = [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": user_content}
+    ]
+    # Shareable: nothing in the prompt is this student's but their name (no history, summary or
+    # interests), so its answer, with the name swapped, is right for anyone asking over these chunks
+    name = turn.profile["name"]
+    turn.retrieval["shareable"] = not turn.conv and not turn.summary and not turn.profile["interests"]
+    turn.retrieval["name"] = name
+    # The rest of the prompt, name aside, for single-flight keys (see flight_key)
+    turn.retrieval["prompt_fingerprint"] = prompt_fingerprint(turn.docs, depersonalize(system_content, name),
+                                                              depersonalize(context_prefix, name))
+
+def stage_generate(turn):
+    turn.answer = generate_answer(turn.user, turn.message, turn.messages, turn.retrieval, turn.priority,
+                                  turn.deadline)
+
+def stage_persist(turn):
+    turn.assistant_msg = record_chat_turn(turn.user, turn.session_id, turn.conv, turn.message, turn.answer,
+                                          turn.interrupted, turn.deadline)
+    if turn.deadline is not None and turn.deadline.expired:
+        metrics.incr(f"deadline.{turn.deadline.route}.overruns")
+
+answer_pipeline = AnswerPipeline({
+    "profile": stage_profile,
+    "history": stage_history,
+    "route": stage_route,
+    "retrieve": stage_retrieve,
+    "dedupe": stage_dedupe,
+    "prompt": stage_prompt,
+    "generate": stage_generate,
+    "persist": stage_persist
+})
+
+# Rolling conversation summaries, compacted in the background off the request path
+summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+summaries_in_progress = set()
+summaries_lock = threading.Lock()
+
+def get_session_summary(user, session_id):
+    """The session's running summary ({"text", "covered"}), or None if it has none yet"""
+    record = find_session(user, session_id)
+    return record.get("summary") if record else None
+
+def schedule_session_summary(user, session_id, conv):
+    """Queue a summary update once enough older messages have piled up outside the recent window"""
+    if not SUMMARY_ENABLED or not THETA_API_KEY:
+        return
+    summary = get_session_summary(user, session_id) or {"covered": 0}
+    covered = summary["covered"] if summary["covered"] <= len(conv) else 0
+    if len(conv) - SUMMARY_KEEP_RECENT - covered < SUMMARY_TRIGGER_MESSAGES:
+        return
+    key = f"{user}_{session_id}"
+    with summaries_lock:
+        if key in summaries_in_progress:
+            return
+        summaries_in_progress.add(key)
+    summary_executor.submit(summarize_session, user, session_id, conv, key)
+
+def summarize_session(user, session_id, conv, key):
+    """Fold the messages older than the recent window into the session's stored summary"""
+    try:
+        record = find_session(user, session_id)
+        if record is None:
+            return
+        summary = record.get("summary")
+        if not summary or summary["covered"] > len(conv):
+            summary = {"text": "", "covered": 0}
+        end = len(conv) - SUMMARY_KEEP_RECENT
+        messages = summary_messages(prompt_budget, summary["text"], conv[summary["covered"]:end])
+        with llm_admission.slot(None, PRIORITY_BACKGROUND), metrics.timer("summary.latency"):
+            text = llm.invoke(messages)
+        if not text or "⚠️" in text:
+            metrics.incr("summary.failures")
+            print(f"[Summary] Could not summarize {key}: {text}")
+            return
+        record["summary"] = {"text": text.strip(), "covered": end, "updated_at": datetime.datetime.now().isoformat()}
+        save_user_sessions(user)
+        metrics.incr("summary.updates")
+        print(f"[Summary] {key}: summary now covers {end} of {len(conv)} messages")
+    except Overloaded:
+        # Busy: the next turn in this session will try again
+        metrics.incr("summary.deferred")
+    except Exception as e:
+        metrics.incr("summary.failures")
+        print(f"[Summary Error] {key}: {e}")
+    finally:
+        with summaries_lock:
+            summaries_in_progress.discard(key)
+
+def overloaded_response(e):
+    """Fast 429/503 with Retry-After for a request turned away by admission control"""
+    response = jsonify({"error": "The assistant is busy right now. Please try again shortly.",
+                        "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # Helper function to generate JWT token
 def create_jwt_for_user(username):
@@ -574,7 +1339,10 @@ def create_jwt_for_user(username):
 
 # Helper function to get current user from token in request
 def get_user_from_token():
-    token = request.cookies.get('token')
+    return decode_user_token(request.cookies.get('token'))
+
+def decode_user_token(token):
+    """Username from a JWT session token, or None if it is missing or invalid"""
     if not token:
         print("[DEBUG] No token found in cookies")
         return None
@@ -717,6 +1485,181 @@ def logout():
     resp.set_cookie("token", "", httponly=True, secure=secure_flag, samesite='Lax', expires=0)
     return resp
 
+# Background ingestion of uploaded files
+ingestion_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingest")
+
+def record_upload_started(user, filename):
+    """Add the upload/processing messages to the user's default conversation"""
+    msg_user = {"role": "user", "content": f"📎 Uploading `{filename}` for processing..."}
+    msg_assistant = {"role": "assistant", "content": f"Processing your file '{filename}'... This may take a few moments for large files."}
+    
+    # Note: File uploads are global per user, not per session
+    conv = get_conversation(user, "default")
+    conv.append(msg_user)
+    conv.append(msg_assistant)
+    save_conversation(user, "default")
+    return msg_user, msg_assistant
+
+def process_uploaded_file(user, filename, storage_provider):
+    """Extract, chunk and index a stored file, then report the result in the user's chat"""
+    try:
+        print(f"[Background Processing] Starting processing for {filename}")
+        
+        # Process straight from disk when the provider keeps a local copy, otherwise
+        # fetch it into a temporary file
+        temp_file_path = storage_provider.get_local_path(user, filename)
+        is_temp_file = temp_file_path is None
+        if is_temp_file:
+            file_data = storage_provider.get_file(user, filename)
+            if not file_data:
+                raise Exception("Failed to retrieve saved file")
+            
+            import tempfile
+            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{filename.split('.')[-1]}") as temp_file:
+                shutil.copyfileobj(file_data, temp_file)
+                temp_file_path = temp_file.name
+            
+            file_data.close()
+            print(f"[Background Processing] File saved to temp: {temp_file_path}")
+        else:
+            print(f"[Background Processing] Processing stored file in place: {temp_file_path}")
+        
+        # Load or initialize user's indexed files list
+        user_dir = os.path.join(books_dir, safe_filename(user))
+        os.makedirs(user_dir, exist_ok=True)
+        indexed_list_path = os.path.join(user_dir, "indexed_files.json")
+        indexed_files = []
+        if os.path.exists(indexed_list_path):
+            try:
+                with open(indexed_list_path, "r") as idxf:
+                    data = json.load(idxf)
+                    if isinstance(data, list):
+                        indexed_files = data
+                    elif isinstance(data, dict) and "indexed_files" in data:
+                        indexed_files = data["indexed_files"]
+            except:
+                indexed_files = []
+        
+        print(f"[Background Processing] Processing file type: {filename.split('.')[-1]}")
+        
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        new_docs = []
+        text_blob = ""
+        
+        ext = filename.lower().rsplit('.', 1)[-1]
+        if ext == "pdf":
+            print(f"[Background Processing] Processing PDF file")
+            loader = PyPDFLoader(temp_file_path)
+            pages = loader.load()
+            print(f"[Background Processing] PDF loaded with {len(pages)} pages")
+            new_docs.extend(splitter.split_documents(pages))
+            first_pages_text = [p.page_content for p in pages[:3]]
+            text_blob = "\n".join(first_pages_text)
+        elif ext in ["jpg", "jpeg", "png"]:
+            print(f"[Background Processing] Processing image file with OCR")
+            ocr_result = ocr_image(temp_file_path)
+            print(f"[Background Processing] OCR confidence {ocr_result['confidence']}% "
+                  f"(preprocess {ocr_result['preprocess_ms']} ms, OCR {ocr_result['ocr_ms']} ms)")
+            new_docs.extend(splitter.create_documents([ocr_result["text"]], metadatas=[ocr_metadata(ocr_result, filename)]))
+            text_blob = ocr_result["text"]
+        elif ext in ["mp3", "wav", "m4a"]:
+            print(f"[Background Processing] Processing audio file with Whisper")
+            # Audio is embedded window by window while it is transcribed, so it
+            # never passes through new_docs
+            chunk_count, text_blob = index_audio_incrementally(user, temp_file_path, filename)
+            print(f"[Background Processing] Indexed {chunk_count} transcript chunks")
+        elif ext == "docx":
+            print(f"[Background Processing] Processing Word document")
+            # Streamed and embedded in batches, so it never passes through new_docs
+            chunk_count, text_blob = index_docx_incrementally(user, temp_file_path, filename, splitter)
+            print(f"[Background Processing] Indexed {chunk_count} document chunks")
+        elif ext in ["xlsx", "xls"]:
+            print(f"[Background Processing] Processing Excel file")
+            df = pd.read_excel(temp_file_path, engine="openpyxl" if ext == "xlsx" else "xlrd")
+            csv_text = df.to_csv(index=False)
+            new_docs.extend(splitter.create_documents([csv_text]))
+            text_blob = csv_text[:2000]
+        else:
+            # Unsupported file type
+            raise Exception(f"Unsupported file type: {ext}")
+        
+        print(f"[Background Processing] Created {len(new_docs)} document chunks")
+        
+        # If new docs were successfully created, add to vectorstore
+        if new_docs:
+            print(f"[Background Processing] Adding documents to vectorstore")
+            vs = load_vectorstore_for_user(user)
+            if vs is None:
+                # Create new FAISS vectorstore for user
+                print(f"[Background Processing] Creating new vectorstore for user")
+                from langchain.vectorstores import FAISS
+                vs = FAISS.from_documents(new_docs, embeddings)
+            else:
+                # Add documents to existing vectorstore
+                print(f"[Background Processing] Adding to existing vectorstore")
+                vs.add_documents(new_docs)
+            
+            if vs:
+                print(f"[Background Processing] Saving vectorstore")
+                save_vectorstore_for_user(user, vs)
+                print(f"[Background Processing] Vectorstore saved successfully")
+        
+        # Update indexed files list on disk (only for local storage)
+        if not isinstance(storage_provider, GoogleDriveStorageProvider):
+            indexed_files.append(filename)
+            try:
+                with open(indexed_list_path, 'w') as idxf:
+                    json.dump({"indexed_files": indexed_files}, idxf)
+            except Exception as e:
+                print(f"[Indexed file list save error] {e}")
+        else:
+            # For Google Drive (Demo), files are automatically "indexed" when stored
+            print(f"[GoogleDrive] File {filename} automatically indexed in demo storage")
+        
+        # Clean up temporary file
+        if is_temp_file:
+            try:
+                os.unlink(temp_file_path)
+            except Exception as e:
+                print(f"[Temp file cleanup error] {e}")
+        
+        # Update chat with success message
+        print(f"[Background Processing] Processing completed successfully")
+        summary = ""
+        if text_blob:
+            snippet = (text_blob[:500] + "...") if len(text_blob) > 500 else text_blob
+            summary = f" Here's a snippet of the content: \n{snippet}"
+        
+        success_msg = {"role": "assistant", "content": f"✅ Your file '{filename}' has been successfully indexed and is ready to use in your studies!{summary}"}
+        
+        conv = get_conversation(user, "default")
+        # Replace the processing message with success message
+        if conv and conv[-1]["role"] == "assistant" and "Processing your file" in conv[-1]["content"]:
+            conv[-1] = success_msg
+        else:
+            conv.append(success_msg)
+        save_conversation(user, "default")
+        print(f"[Background Processing] Success message updated in chat")
+        
+    except Exception as e:
+        print(f"[Background Processing] Error processing file: {e}")
+        print(f"[Background Processing] Full error details: {type(e).__name__}: {str(e)}")
+        # Update chat with error message
+        error_msg = {"role": "assistant", "content": f"❌ Sorry, I couldn't process the file '{filename}'. Please try again or contact support."}
+        
+        conv = get_conversation(user, "default")
+        # Replace the processing message with error message
+        if conv and conv[-1]["role"] == "assistant" and "Processing your file" in conv[-1]["content"]:
+            conv[-1] = error_msg
+        else:
+            conv.append(error_msg)
+        save_conversation(user, "default")
+        print(f"[Background Processing] Error message updated in chat")
+
+def enqueue_file_processing(user, filename, storage_provider):
+    """Queue a stored file for background ingestion"""
+    return ingestion_executor.submit(process_uploaded_file, user, filename, storage_provider)
+
 # Protected routes (require valid JWT cookie)
 
 @app.route("/api/upload", methods=["POST"])
@@ -760,173 +1703,119 @@ def upload_file():
         
         return jsonify({"error": "Failed to save file"}), 500
     
-    # Return immediately with processing message
-    msg_user = {"role": "user", "content": f"📎 Uploading `{filename}` for processing..."}
-    msg_assistant = {"role": "assistant", "content": f"Processing your file '{filename}'... This may take a few moments for large files."}
+    msg_user, msg_assistant = record_upload_started(user, filename)
+    enqueue_file_processing(user, filename, storage_provider)
     
-    # Note: File uploads are global per user, not per session
-    conv = get_conversation(user, "default")
-    conv.append(msg_user)
-    conv.append(msg_assistant)
-    save_conversation(user, "default")
+    return jsonify({"messages": [msg_user, msg_assistant]})
+
+@app.route("/api/upload/chunked", methods=["POST"])
+def init_chunked_upload():
+    """Start a resumable upload; parts are then PUT individually"""
+    user = get_user_from_token()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json() or {}
+    filename = os.path.basename((data.get("filename") or "").strip())
+    if not filename:
+        return jsonify({"error": "No file selected"}), 400
+    ext = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+    if ext not in SUPPORTED_FILE_TYPES:
+        return jsonify({"error": f"Unsupported file type: {ext}"}), 400
     
-    # Start background processing
-    def process_file_background():
-        try:
-            print(f"[Background Processing] Starting processing for {filename}")
-            
-            # Get file from storage for processing
-            file_data = storage_provider.get_file(user, filename)
-            if not file_data:
-                raise Exception("Failed to retrieve saved file")
-            
-            # Create temporary file for processing
-            import tempfile
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{filename.split('.')[-1]}") as temp_file:
-                temp_file.write(file_data.read())
-                temp_file_path = temp_file.name
-            
-            file_data.close()
-            print(f"[Background Processing] File saved to temp: {temp_file_path}")
-            
-            # Load or initialize user's indexed files list
-            user_dir = os.path.join(books_dir, safe_filename(user))
-            os.makedirs(user_dir, exist_ok=True)
-            indexed_list_path = os.path.join(user_dir, "indexed_files.json")
-            indexed_files = []
-            if os.path.exists(indexed_list_path):
-                try:
-                    with open(indexed_list_path, "r") as idxf:
-                        data = json.load(idxf)
-                        if isinstance(data, list):
-                            indexed_files = data
-                        elif isinstance(data, dict) and "indexed_files" in data:
-                            indexed_files = data["indexed_files"]
-                except:
-                    indexed_files = []
-            
-            print(f"[Background Processing] Processing file type: {filename.split('.')[-1]}")
-            
-            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            new_docs = []
-            text_blob = ""
-            
-            ext = filename.lower().rsplit('.', 1)[-1]
-            if ext == "pdf":
-                print(f"[Background Processing] Processing PDF file")
-                loader = PyPDFLoader(temp_file_path)
-                pages = loader.load()
-                print(f"[Background Processing] PDF loaded with {len(pages)} pages")
-                new_docs.extend(splitter.split_documents(pages))
-                first_pages_text = [p.page_content for p in pages[:3]]
-                text_blob = "\n".join(first_pages_text)
-            elif ext in ["jpg", "jpeg", "png"]:
-                print(f"[Background Processing] Processing image file with OCR")
-                text = pytesseract.image_to_string(Image.open(temp_file_path))
-                new_docs.extend(splitter.create_documents([text]))
-                text_blob = text
-            elif ext in ["mp3", "wav", "m4a"]:
-                print(f"[Background Processing] Processing audio file with Whisper")
-                model = WhisperModel("base")
-                segments, info = model.transcribe(temp_file_path)
-                result_text = " ".join([seg.text for seg in segments])
-                new_docs.extend(splitter.create_documents([result_text]))
-                text_blob = result_text[:2000]
-            elif ext == "docx":
-                print(f"[Background Processing] Processing Word document")
-                doc_obj = docx.Document(temp_file_path)
-                full_text = "\n".join([para.text for para in doc_obj.paragraphs])
-                new_docs.extend(splitter.create_documents([full_text]))
-                text_blob = full_text[:2000]
-            elif ext in ["xlsx", "xls"]:
-                print(f"[Background Processing] Processing Excel file")
-                df = pd.read_excel(temp_file_path, engine="openpyxl" if ext == "xlsx" else "xlrd")
-                csv_text = df.to_csv(index=False)
-                new_docs.extend(splitter.create_documents([csv_text]))
-                text_blob = csv_text[:2000]
-            else:
-                # Unsupported file type
-                raise Exception(f"Unsupported file type: {ext}")
-            
-            print(f"[Background Processing] Created {len(new_docs)} document chunks")
-            
-            # If new docs were successfully created, add to vectorstore
-            if new_docs:
-                print(f"[Background Processing] Adding documents to vectorstore")
-                vs = load_vectorstore_for_user(user)
-                if vs is None:
-                    # Create new FAISS vectorstore for user
-                    print(f"[Background Processing] Creating new vectorstore for user")
-                    from langchain.vectorstores import FAISS
-                    vs = FAISS.from_documents(new_docs, embeddings)
-                else:
-                    # Add documents to existing vectorstore
-                    print(f"[Background Processing] Adding to existing vectorstore")
-                    vs.add_documents(new_docs)
-                
-                if vs:
-                    print(f"[Background Processing] Saving vectorstore")
-                    save_vectorstore_for_user(user, vs)
-                    print(f"[Background Processing] Vectorstore saved successfully")
-            
-            # Update indexed files list on disk (only for local storage)
-            if not isinstance(storage_provider, GoogleDriveStorageProvider):
-                indexed_files.append(filename)
-                try:
-                    with open(indexed_list_path, 'w') as idxf:
-                        json.dump({"indexed_files": indexed_files}, idxf)
-                except Exception as e:
-                    print(f"[Indexed file list save error] {e}")
-            else:
-                # For Google Drive (Demo), files are automatically "indexed" when stored
-                print(f"[GoogleDrive] File {filename} automatically indexed in demo storage")
-            
-            # Clean up temporary file
-            try:
-                os.unlink(temp_file_path)
-            except Exception as e:
-                print(f"[Temp file cleanup error] {e}")
-            
-            # Update chat with success message
-            print(f"[Background Processing] Processing completed successfully")
-            summary = ""
-            if text_blob:
-                snippet = (text_blob[:500] + "...") if len(text_blob) > 500 else text_blob
-                summary = f" Here's a snippet of the content: \n{snippet}"
-            
-            success_msg = {"role": "assistant", "content": f"✅ Your file '{filename}' has been successfully indexed and is ready to use in your studies!{summary}"}
-            
-            conv = get_conversation(user, "default")
-            # Replace the processing message with success message
-            if conv and conv[-1]["role"] == "assistant" and "Processing your file" in conv[-1]["content"]:
-                conv[-1] = success_msg
-            else:
-                conv.append(success_msg)
-            save_conversation(user, "default")
-            print(f"[Background Processing] Success message updated in chat")
-            
-        except Exception as e:
-            print(f"[Background Processing] Error processing file: {e}")
-            print(f"[Background Processing] Full error details: {type(e).__name__}: {str(e)}")
-            # Update chat with error message
-            error_msg = {"role": "assistant", "content": f"❌ Sorry, I couldn't process the file '{filename}'. Please try again or contact support."}
-            
-            conv = get_conversation(user, "default")
-            # Replace the processing message with error message
-            if conv and conv[-1]["role"] == "assistant" and "Processing your file" in conv[-1]["content"]:
-                conv[-1] = error_msg
-            else:
-                conv.append(error_msg)
-            save_conversation(user, "default")
-            print(f"[Background Processing] Error message updated in chat")
+    storage_provider = storage_manager.get_user_storage_provider(user)
+    if storage_provider.file_exists(user, filename):
+        return jsonify({"error": "This file is already indexed.", "duplicate": True}), 409
+    
+    try:
+        size = int(data.get("size", 0))
+        part_size = int(data["part_size"]) if data.get("part_size") else None
+        upload_id = chunked_uploads.new_upload_id()
+        staging_path = storage_provider.get_staging_path(user, upload_id)
+        manifest = chunked_uploads.create(user, upload_id, filename, size, staging_path, part_size)
+    except ChunkedUploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid size or part_size"}), 400
     
-    # Start background processing thread
-    thread = threading.Thread(target=process_file_background)
-    thread.daemon = True
-    thread.start()
+    return jsonify({
+        "success": True,
+        "upload_id": manifest["upload_id"],
+        "part_size": manifest["part_size"],
+        "total_parts": manifest["total_parts"],
+        "max_upload_bytes": chunked_uploads.max_upload_bytes
+    })
+
+@app.route("/api/upload/chunked/<upload_id>", methods=["GET"])
+def get_chunked_upload(upload_id):
+    """Report which parts of an upload have arrived so the client can resume"""
+    user = get_user_from_token()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        return jsonify({"success": True, **chunked_uploads.status(upload_id, user)})
+    except ChunkedUploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+@app.route("/api/upload/chunked/<upload_id>/parts/<int:part_number>", methods=["PUT"])
+def put_chunked_upload_part(upload_id, part_number):
+    """Stream one part of the request body into the upload's staging file"""
+    user = get_user_from_token()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        part = chunked_uploads.write_part(
+            upload_id, user, part_number, request.stream,
+            expected_sha256=request.headers.get("X-Content-SHA256")
+        )
+    except ChunkedUploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        print(f"[Chunked Upload Error] {e}")
+        return jsonify({"error": "Failed to store upload part"}), 500
+    return jsonify({"success": True, **part})
+
+@app.route("/api/upload/chunked/<upload_id>/complete", methods=["POST"])
+def complete_chunked_upload(upload_id):
+    """Commit a fully received upload to storage and queue it for indexing"""
+    user = get_user_from_token()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        manifest = chunked_uploads.finish(upload_id, user)
+    except ChunkedUploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    
+    filename = manifest["filename"]
+    storage_provider = storage_manager.get_user_storage_provider(user)
+    if not storage_provider.commit_staged_file(user, filename, manifest["staging_path"]):
+        if hasattr(storage_provider, 'real_provider') and storage_provider.real_provider:
+            if not storage_provider.real_provider.is_authenticated():
+                return jsonify({
+                    "error": "Google Drive authentication required",
+                    "auth_required": True,
+                    "message": "Please complete Google Drive authentication before uploading files"
+                }), 401
+        return jsonify({"error": "Failed to save file"}), 500
+    chunked_uploads.discard(upload_id, remove_staging=False)
+    
+    msg_user, msg_assistant = record_upload_started(user, filename)
+    enqueue_file_processing(user, filename, storage_provider)
     
     return jsonify({"messages": [msg_user, msg_assistant]})
 
+@app.route("/api/upload/chunked/<upload_id>", methods=["DELETE"])
+def abort_chunked_upload(upload_id):
+    """Abandon an upload and delete its staged data"""
+    user = get_user_from_token()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        chunked_uploads.get(upload_id, user)
+    except ChunkedUploadError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    chunked_uploads.discard(upload_id)
+    return jsonify({"success": True, "message": "Upload cancelled"})
+
 @app.route("/api/upload/status", methods=["GET"])
 def get_upload_status():
     """Get upload processing status for the current user"""
@@ -970,107 +1859,98 @@ def chat():
     session_id = data.get("session_id", "default")
     if not message:
         return jsonify({"error": "No message provided"}), 400
-    conv = get_conversation(user, session_id)
-    profile = extract_user_profile(conv, default_name=user.split('@')[0].capitalize())
-    user_name = profile["name"]
-    interests = profile["interests"]
-    # Greeting handling
-    if message.lower() in ["hi", "hello", "hey", "hi there", "hello there"]:
-        greeting = f"Hi {user_name}! 👋 How can I assist you today?"
-        assistant_msg = {"role": "assistant", "content": greeting}
-        conv.append({"role": "user", "content": message})
-        conv.append(assistant_msg)
-        save_conversation(user)
-        return jsonify({"messages": [assistant_msg]})
-    # Construct context prefix from user profile
-    context_prefix = f"User Name: {user_name}\n"
-    if interests:
-        context_prefix += "User Interests: " + ", ".join(interests) + "\n"
-    # Recent chat history snippet (last 6 messages) for context
-    history_snippets = []
-    for msg in conv[-6:]:
-        if msg["role"] == "user":
-            history_snippets.append(f"User: {msg['content']}")
-        elif msg["role"] == "assistant":
-            history_snippets.append(f"Assistant: {msg['content']}")
-    chat_history_str = "\n".join(history_snippets)
-    # Retrieve relevant docs for the query (user's documents + global knowledge)
-    vs = load_vectorstore_for_user(user)
-    docs = []
-    
-    # Search user's personal documents
-    if vs is not None:
-        query = f"{context_prefix}Question: {message}"
-        try:
-            user_docs = vs.similarity_search(query, k=3)
-            docs.extend(user_docs)
-        except Exception as e:
-            print(f"[User VectorStore Error] {e}")
-    
-    # Search global knowledge base
+    turn = Turn(user, session_id, message, PRIORITY_TEXT, deadline=request_deadline("chat"))
     try:
-        global_docs = search_global_knowledge(message, k=2)
-        docs.extend(global_docs)
-    except Exception as e:
-        print(f"[Global Knowledge Search Error] {e}")
-    
-    # Remove duplicates and limit total docs
-    unique_docs = []
-    seen_content = set()
-    for doc in docs:
-        if doc.page_content not in seen_content:
-            unique_docs.append(doc)
-            seen_content.add(doc.page_content)
-        if len(unique_docs) >= 5:  # Limit to 5 total docs
-            break
-    docs = unique_docs
-    # Build LLM prompt with context if available
-    if docs:
-        docs_text = "\n".join([doc.page_content for doc in docs])
-        system_content = (
-            "You are a knowledgeable teacher assistant. You strictly rely on the provided content to answer the question.\n"
-            "If the context does NOT contain enough information, politely say you couldn't find relevant info in the material, and then give a brief general explanation.\n"
-            "You can understand and respond in English, Tamil, or Arabic as appropriate.\n"
-            f"Context:\n{docs_text}\n\n"
-            f"Chat History:\n{chat_history_str}"
-        )
-    else:
-        system_content = (
-            "You are a helpful teacher assistant. Answer the user's question clearly and truthfully.\n"
-            "If the question refers to uploaded documents but no relevant info is found, apologize for not finding info in the material and answer generally.\n"
-            "You can understand and respond in English, Tamil, or Arabic as appropriate."
-        )
-    user_content = f"{context_prefix}Question: {message}"
-    messages = [
-        {"role": "system", "content": system_content},
-        {"role": "user", "content": user_content}
-    ]
-    # Check if API key is available
-    if not THETA_API_KEY:
-        answer_text = "⚠️ LLM API key not configured. Please set THETA_API_KEY in your environment."
+        answer_pipeline.run(turn)
+    except Overloaded as e:
+        return overloaded_response(e)
+    return jsonify({"messages": [turn.assistant_msg]})
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """Chat turn whose answer is relayed token by token as server-sent events.
+    
+    Events: 'token' ({"content": ...}) for each piece of the answer, then 'done'
+    ({"message": ...}) with the stored assistant message. The turn is saved when the
+    stream ends, including a partial answer if the client disconnects mid-stream. A stream
+    still going when the request's deadline runs out is cut short the same way, but still
+    ends with 'done'.
+    """
+    user = get_user_from_token()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json()
+    message = (data.get("message") or "").strip()
+    session_id = data.get("session_id", "default")
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+    turn = Turn(user, session_id, message, PRIORITY_TEXT, deadline=request_deadline("chat_stream"))
+    answer_pipeline.run(turn, "profile", "history", "route", "retrieve", "dedupe", "prompt")
+    
+    retrieval = None
+    ticket = None
+    generating = turn.answer is None
+    if not generating:
+        token_stream = iter([turn.answer])
     else:
-        result = llm.invoke(messages)
-        if isinstance(result, str):
-            answer_text = result
-        elif isinstance(result, dict):
-            answer_text = result.get("content", "")
+        cached = cached_answer(message, turn.retrieval)
+        if cached is not None:
+            token_stream = iter([cached])
+        elif generation_skipped(turn.deadline):
+            token_stream = iter([DEADLINE_EXHAUSTED_MESSAGE])
         else:
-            answer_text = str(result)
-    
-    assistant_msg = {"role": "assistant", "content": answer_text}
-    conv.append({"role": "user", "content": message})
-    conv.append(assistant_msg)
-    save_conversation(user, session_id)
-    
-    # Update session timestamp
-    sessions = get_user_sessions(user)
-    for session in sessions:
-        if session["id"] == session_id:
-            session["updated_at"] = datetime.datetime.now().isoformat()
-            break
-    save_user_sessions(user)
-    
-    return jsonify({"messages": [assistant_msg]})
+            try:
+                ticket = llm_admission.acquire(user, PRIORITY_TEXT, generation_wait(turn.deadline))
+            except Overloaded as e:
+                return overloaded_response(e)
+            token_stream = llm.stream(turn.messages, **generation_budget(turn.deadline))
+            retrieval = turn.retrieval
+    
+    def generate():
+        parts = []
+        completed = False
+        start = time.perf_counter()
+        try:
+            # The generate stage is the stream itself
+            with answer_pipeline.timing(turn, "generate") if generating else nullcontext():
+                for token in token_stream:
+                    parts.append(token)
+                    yield sse_event("token", {"content": token})
+                    if turn.deadline.expired:
+                        # Out of time: what has been said so far is the answer
+                        metrics.incr("deadline.streams_cut")
+                        turn.interrupted = True
+                        break
+            completed = True
+            if turn.interrupted:
+                close = getattr(token_stream, "close", None)
+                if close:
+                    close()
+            elif retrieval is not None:
+                remember_answer(message, retrieval, "".join(parts), time.perf_counter() - start)
+            turn.answer = "".join(parts)
+            answer_pipeline.run(turn, "persist")
+            yield sse_event("done", {"message": turn.assistant_msg})
+        finally:
+            if not completed:
+                # Client went away (or the upstream failed): stop reading from the LLM
+                # and keep whatever was already said
+                print(f"[Chat Stream] Stream for {user} ended early after {len(parts)} tokens")
+                close = getattr(token_stream, "close", None)
+                if close:
+                    close()
+                if parts:
+                    turn.answer, turn.interrupted = "".join(parts), True
+                    answer_pipeline.run(turn, "persist")
+    
+    response = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # stop nginx-style proxies from buffering the stream
+    })
+    if ticket is not None:
+        # Hold the slot for as long as the stream is open, even if it is never read
+        response.call_on_close(lambda: llm_admission.release(ticket))
+    return response
 
 
 
@@ -1142,6 +2022,20 @@ def test_llm():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """Operational metrics for this worker process"""
+    snapshot = metrics.snapshot()
+    snapshot["llm_pool"] = llm.pool_stats()
+    snapshot["async_llm_pool"] = async_llm.pool_stats()
+    snapshot["answer_cache"] = answer_cache.stats()
+    snapshot["admission"] = llm_admission.stats()
+    snapshot["intents"] = intent_router.stats()
+    snapshot["retrieval_cache"] = retrieval_cache.stats()
+    if prompt_cache is not None:
+        snapshot["prompt_cache"] = prompt_cache.stats()
+    return jsonify(snapshot)
+
 @app.route("/api/global-knowledge", methods=["POST"])
 def update_global_knowledge():
     """Add knowledge to the global vectorstore"""
@@ -1237,6 +2131,7 @@ def clear_user_vectorstore():
         if user in vectorstores_cache:
             del vectorstores_cache[user]
             print(f"[Vectorstore Clear] Cleared from cache for user {user}")
+        retrieval_cache.invalidate_user(user)
         
         # Delete vectorstore files
         user_vector_dir = os.path.join(vectorstores_dir, safe_filename(user))
@@ -1331,7 +2226,7 @@ def get_document_stats():
             "total_size_bytes": total_size,
             "total_size_mb": round(total_size / (1024 * 1024), 2),
             "file_types": file_types,
-            "supported_types": ["pdf", "docx", "xlsx", "xls", "jpg", "jpeg", "png", "mp3", "wav", "m4a"]
+            "supported_types": SUPPORTED_FILE_TYPES
         }
         
         return jsonify({
@@ -1640,6 +2535,8 @@ def get_google_drive_status():
 
 @app.route("/api/audio", methods=["POST"])
 def audio_question():
+    start = time.perf_counter()
+    deadline = request_deadline("audio")  # transcription counts against it too
     user = get_user_from_token()
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
@@ -1648,113 +2545,36 @@ def audio_question():
     audio_file = request.files["file"]
     if audio_file.filename == "":
         return jsonify({"error": "No audio file provided"}), 400
-    # Save audio to a temp path
-    temp_audio_path = os.path.join(books_dir, safe_filename(user), "temp_audio_input")
-    os.makedirs(os.path.dirname(temp_audio_path), exist_ok=True)
-    audio_file.save(temp_audio_path)
+    # Decode in memory straight from the upload; no per-user temp file to collide on
+    try:
+        audio = decode_audio_stream(audio_file.stream, max_seconds=VOICE_QUESTION_MAX_SECONDS)
+    except Exception as e:
+        print(f"[Audio Decode Error] {e}")
+        return jsonify({"error": "Unsupported or corrupt audio file"}), 400
+    session_id = request.form.get("session_id", "default")
+    turn = Turn(user, session_id, priority=PRIORITY_AUDIO, deadline=deadline)
+    # Pipelined: the profile loads and retrieval starts on the partial transcript while Whisper decodes
+    profile_future = voice_executor.submit(answer_pipeline.run, turn, "profile") if VOICE_PIPELINE_ENABLED else None
+    speculate = partial(search_context, user, session_id=session_id, deadline=deadline) if VOICE_PIPELINE_ENABLED else None
     try:
-        model = WhisperModel("base")
-        segments, info = model.transcribe(temp_audio_path)
-        question_text = " ".join([seg.text for seg in segments]).strip()
+        turn.transcript = voice_pipeline.transcribe(audio, speculate)
+        turn.message = turn.transcript.text
     except Exception as e:
         print(f"[Whisper Error] {e}")
         return jsonify({"error": "Audio transcription failed"}), 500
-    finally:
-        try:
-            os.remove(temp_audio_path)
-        except:
-            pass
-    if not question_text:
+    if not turn.message:
+        voice_pipeline.discard(turn.transcript)
         return jsonify({"error": "Unable to transcribe audio"}), 400
-    conv = get_conversation(user)
-    profile = extract_user_profile(conv, default_name=user.split('@')[0].capitalize())
-    user_name = profile["name"]
-    interests = profile["interests"]
-    # Greeting via audio
-    if question_text.lower() in ["hi", "hello", "hey", "hi there", "hello there"]:
-        greeting = f"Hi {user_name}! 👋 How can I assist you today?"
-        assistant_msg = {"role": "assistant", "content": greeting}
-        conv.append({"role": "user", "content": question_text})
-        conv.append(assistant_msg)
-        save_conversation(user, "default")  # Audio uses default session
-        return jsonify({"messages": [{"role": "user", "content": question_text}, assistant_msg]})
-    context_prefix = f"User Name: {user_name}\n"
-    if interests:
-        context_prefix += "User Interests: " + ", ".join(interests) + "\n"
-    history_snippets = []
-    for msg in conv[-6:]:
-        if msg["role"] == "user":
-            history_snippets.append(f"User: {msg['content']}")
-        elif msg["role"] == "assistant":
-            history_snippets.append(f"Assistant: {msg['content']}")
-    chat_history_str = "\n".join(history_snippets)
-    # Retrieve relevant docs for the query (user's documents + global knowledge)
-    vs = load_vectorstore_for_user(user)
-    docs = []
-    
-    # Search user's personal documents
-    if vs is not None:
-        query = f"{context_prefix}Question: {question_text}"
-        try:
-            user_docs = vs.similarity_search(query, k=3)
-            docs.extend(user_docs)
-        except Exception as e:
-            print(f"[User VectorStore Error] {e}")
-    
-    # Search global knowledge base
     try:
-        global_docs = search_global_knowledge(question_text, k=2)
-        docs.extend(global_docs)
-    except Exception as e:
-        print(f"[Global Knowledge Search Error] {e}")
-    
-    # Remove duplicates and limit total docs
-    unique_docs = []
-    seen_content = set()
-    for doc in docs:
-        if doc.page_content not in seen_content:
-            unique_docs.append(doc)
-            seen_content.add(doc.page_content)
-        if len(unique_docs) >= 5:  # Limit to 5 total docs
-            break
-    docs = unique_docs
-    if docs:
-        docs_text = "\n".join([doc.page_content for doc in docs])
-        system_content = (
-            "You are a knowledgeable teacher assistant. You strictly rely on the provided content to answer the question.\n"
-            "If the context does NOT contain enough information, politely say you couldn't find relevant info in the material, and then provide a brief general explanation.\n"
-            "You can understand and respond in English, Tamil, or Arabic as appropriate.\n"
-            f"Context:\n{docs_text}\n\n"
-            f"Chat History:\n{chat_history_str}"
-        )
-    else:
-        system_content = (
-            "You are a helpful teacher assistant. Answer the user's question clearly and truthfully.\n"
-            "If the question refers to the uploaded documents but no relevant info is found, apologize for not finding info and answer generally.\n"
-            "You can understand and respond in English, Tamil, or Arabic as appropriate."
-        )
-    user_content = f"User Name: {user_name}\nQuestion: {question_text}"
-    messages = [
-        {"role": "system", "content": system_content},
-        {"role": "user", "content": user_content}
-    ]
-    # Check if API key is available
-    if not THETA_API_KEY:
-        answer_text = "⚠️ LLM API key not configured. Please set THETA_API_KEY in your environment."
-    else:
-        result = llm.invoke(messages)
-        if isinstance(result, str):
-            answer_text = result
-        elif isinstance(result, dict):
-            answer_text = result.get("content", "")
+        if profile_future is not None:
+            profile_future.result()
+            answer_pipeline.run(turn, *STAGES[1:])
         else:
-            answer_text = str(result)
-    
-    assistant_msg = {"role": "assistant", "content": answer_text}
-    conv.append({"role": "user", "content": question_text})
-    conv.append(assistant_msg)
-    save_conversation(user, "default")  # Audio uses default session
-    return jsonify({"messages": [{"role": "user", "content": question_text}, assistant_msg]})
+            answer_pipeline.run(turn)
+    except Overloaded as e:
+        return overloaded_response(e)
+    metrics.observe("voice.pipelined" if VOICE_PIPELINE_ENABLED else "voice.sequential", time.perf_counter() - start)
+    return jsonify({"messages": [{"role": "user", "content": turn.message}, turn.assistant_msg]})
 
 # Initialize global vectorstore on startup
 print("[STARTUP] Initializing global vectorstore...")
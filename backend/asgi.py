@@ -0,0 +1,295 @@
+"""
+ASGI entry point: chat on an event loop, everything else on Flask.
+
+Under sync workers every /api/chat holds a whole worker for as long as the
+model takes to answer, so concurrency is capped at the worker count while
+the CPU sits idle. Here the two chat routes are served natively on asyncio:
+
+  - the LLM call goes through AsyncThetaLLM (httpx), so a waiting request
+    holds no thread
+  - profile and history reads and retrieval (embedding + FAISS) run on a
+    bounded thread pool, so concurrent turns start in parallel
+  - history writes run on app.py's single persistence thread, as do the
+    Flask routes' (see run_persistence), so no two writes to the same file
+    ever interleave
+  - each turn works to the same per-route deadline as the Flask routes
+
+All other routes are the existing Flask app, run on a thread pool by a2wsgi.
+
+Run:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import json
+import time
+import asyncio
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from a2wsgi import WSGIMiddleware
+
+from app import (
+    app as flask_app,
+    async_llm,
+    llm_admission,
+    answer_pipeline,
+    persistence_executor,
+    CORS_ORIGINS,
+    ASYNC_RETRIEVAL_WORKERS,
+    WSGI_BRIDGE_THREADS,
+    decode_user_token,
+    cached_answer,
+    remember_answer,
+    request_deadline,
+    generation_skipped,
+    generation_wait,
+    generation_budget,
+    DEADLINE_EXHAUSTED_MESSAGE,
+    SINGLEFLIGHT_WAIT_SECONDS,
+    sse_event
+)
+from answer_pipeline import Turn
+from singleflight import AsyncSingleFlight, flight_key, shared_answer
+from answer_cache import personalize
+from admission import Overloaded, PRIORITY_TEXT
+from metrics import metrics
+
+MAX_CHAT_BODY_BYTES = 1024 * 1024
+
+retrieval_executor = ThreadPoolExecutor(max_workers=ASYNC_RETRIEVAL_WORKERS, thread_name_prefix="chat")
+wsgi_app = WSGIMiddleware(flask_app, workers=WSGI_BRIDGE_THREADS)
+chat_flights = AsyncSingleFlight(wait_timeout=SINGLEFLIGHT_WAIT_SECONDS, name="singleflight.chat")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def request_headers(scope):
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+
+
+def cors_headers(headers):
+    """Mirror what flask-cors adds for an allowed origin, since these routes bypass Flask"""
+    origin = headers.get("origin")
+    if origin not in CORS_ORIGINS:
+        return []
+    return [
+        (b"access-control-allow-origin", origin.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin")
+    ]
+
+
+async def read_json_body(receive):
+    body = bytearray()
+    while True:
+        event = await receive()
+        if event["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+        body.extend(event.get("body", b""))
+        if len(body) > MAX_CHAT_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        if not event.get("more_body"):
+            break
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Invalid JSON")
+    return data
+
+
+async def send_json(send, status, body, extra_headers=()):
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+                   + list(extra_headers)
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def send_overloaded(send, e, cors):
+    """Same 429/503 + Retry-After as the Flask routes' overloaded_response()"""
+    await send_json(send, e.status,
+                    {"error": "The assistant is busy right now. Please try again shortly.",
+                     "retry_after": e.retry_after},
+                    [(b"retry-after", str(e.retry_after).encode())] + cors)
+
+
+async def run_in(executor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def start_chat_turn(receive, headers, route):
+    """Authenticate, parse the request and run the answer pipeline up to the LLM call"""
+    cookies = SimpleCookie(headers.get("cookie", ""))
+    user = decode_user_token(cookies["token"].value if "token" in cookies else None)
+    if not user:
+        raise HTTPError(401, "Unauthorized")
+    data = await read_json_body(receive)
+    message = (data.get("message") or "").strip()
+    session_id = data.get("session_id", "default")
+    if not message:
+        raise HTTPError(400, "No message provided")
+    turn = Turn(user, session_id, message, PRIORITY_TEXT, deadline=request_deadline(route))
+    # Reads only: a profile or sessions file that does need writing queues itself on the persistence thread
+    await run_in(retrieval_executor, answer_pipeline.run, turn,
+                 "profile", "history", "route", "retrieve", "dedupe", "prompt")
+    return turn
+
+
+async def chat(scope, receive, send):
+    """Async twin of Flask's /api/chat: same request, same response"""
+    headers = request_headers(scope)
+    cors = cors_headers(headers)
+    try:
+        turn = await start_chat_turn(receive, headers, "chat")
+    except HTTPError as e:
+        await send_json(send, e.status, {"error": e.message}, cors)
+        return
+
+    if turn.answer is None:
+        # The generate stage, on the event loop
+        with answer_pipeline.timing(turn, "generate"):
+            turn.answer = cached_answer(turn.message, turn.retrieval)
+            if turn.answer is None and generation_skipped(turn.deadline):
+                turn.answer = DEADLINE_EXHAUSTED_MESSAGE
+            if turn.answer is None:
+                async def call_llm():
+                    async with llm_admission.slot_async(turn.user, turn.priority, generation_wait(turn.deadline)):
+                        budget = generation_budget(turn.deadline)
+                        start = time.perf_counter()
+                        text = await async_llm.invoke(turn.messages, **budget)
+                    if "max_tokens" not in budget:
+                        remember_answer(turn.message, turn.retrieval, text, time.perf_counter() - start)
+                    return shared_answer(text, turn.retrieval)
+                try:
+                    answer, _ = await chat_flights.do(flight_key(turn.user, turn.message, turn.retrieval),
+                                                      call_llm, generation_wait(turn.deadline))
+                    turn.answer = personalize(answer, turn.retrieval["name"])
+                except Overloaded as e:
+                    await send_overloaded(send, e, cors)
+                    return
+
+    await run_in(persistence_executor, answer_pipeline.run, turn, "persist")
+    await send_json(send, 200, {"messages": [turn.assistant_msg]}, cors)
+
+
+async def chat_stream(scope, receive, send):
+    """Async twin of Flask's /api/chat/stream: 'token' events, then 'done'"""
+    headers = request_headers(scope)
+    cors = cors_headers(headers)
+    try:
+        turn = await start_chat_turn(receive, headers, "chat_stream")
+    except HTTPError as e:
+        await send_json(send, e.status, {"error": e.message}, cors)
+        return
+    user = turn.user
+
+    async def single(text):
+        yield text
+
+    retrieval = None
+    ticket = None
+    generating = turn.answer is None
+    if not generating:
+        token_stream = single(turn.answer)
+    else:
+        cached = cached_answer(turn.message, turn.retrieval)
+        if cached is not None:
+            token_stream = single(cached)
+        elif generation_skipped(turn.deadline):
+            token_stream = single(DEADLINE_EXHAUSTED_MESSAGE)
+        else:
+            try:
+                ticket = await llm_admission.acquire_async(user, turn.priority, generation_wait(turn.deadline))
+            except Overloaded as e:
+                await send_overloaded(send, e, cors)
+                return
+            token_stream = async_llm.stream(turn.messages, **generation_budget(turn.deadline))
+            retrieval = turn.retrieval
+
+    # The request body is consumed, so the next receive() only returns once the client goes away
+    disconnected = asyncio.ensure_future(receive())
+    parts = []
+    completed = False
+    start = time.perf_counter()
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")] + cors
+        })
+        # The generate stage is the stream itself
+        with answer_pipeline.timing(turn, "generate") if generating else nullcontext():
+            async for token in token_stream:
+                if disconnected.done():
+                    break
+                parts.append(token)
+                await send({"type": "http.response.body", "body": sse_event("token", {"content": token}).encode(),
+                            "more_body": True})
+                if turn.deadline.expired:
+                    # Out of time: what has been said so far is the answer
+                    metrics.incr("deadline.streams_cut")
+                    turn.interrupted = completed = True
+                    break
+            else:
+                completed = True
+        if completed:
+            if retrieval is not None and not turn.interrupted:
+                remember_answer(turn.message, retrieval, "".join(parts), time.perf_counter() - start)
+            turn.answer = "".join(parts)
+            await run_in(persistence_executor, answer_pipeline.run, turn, "persist")
+            await send({"type": "http.response.body",
+                        "body": sse_event("done", {"message": turn.assistant_msg}).encode()})
+    finally:
+        disconnected.cancel()
+        await token_stream.aclose()
+        if ticket is not None:
+            llm_admission.release(ticket)
+        if not completed:
+            # Keep whatever was already said, as the sync route does
+            print(f"[Chat Stream] Stream for {user} ended early after {len(parts)} tokens")
+            if parts:
+                turn.answer, turn.interrupted = "".join(parts), True
+                await run_in(persistence_executor, answer_pipeline.run, turn, "persist")
+
+
+ASYNC_ROUTES = {
+    "/api/chat": chat,
+    "/api/chat/stream": chat_stream
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            await async_llm.aclose()
+            retrieval_executor.shutdown(wait=False)
+            persistence_executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    handler = ASYNC_ROUTES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+    if handler is None:
+        # Everything else, including CORS preflights for the chat routes, is handled by Flask
+        await wsgi_app(scope, receive, send)
+        return
+    await handler(scope, receive, send)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent chat turns, sync workers vs one asyncio process.
+
+Default mode runs against the local stand-in LLM (dev_llm_server.py) with a
+fixed model latency and fires N simultaneous completions two ways:
+
+  sync-W     ThetaLLM on a pool of W threads, which is what W gunicorn sync
+             workers can have in flight at once
+  asyncio    AsyncThetaLLM on one event loop in one process
+
+and reports wall time, throughput, latency percentiles and the peak number
+of requests that were actually in flight.
+
+With --url it load-tests a running server instead: N concurrent POSTs to
+/api/chat with the given session token, e.g. to compare
+`gunicorn app:app -w 4` with `uvicorn asgi:application`.
+
+Usage (from backend/):
+    python benchmarks/bench_async_chat.py
+    python benchmarks/bench_async_chat.py --concurrency 50 200 500 --workers 4 --delay 2
+    python benchmarks/bench_async_chat.py --url http://127.0.0.1:5000 --token <jwt> --concurrency 100
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dev_llm_server import make_server  # noqa: E402
+from llm_client import ThetaLLM, AsyncThetaLLM  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Explain photosynthesis in one sentence."}]
+
+
+class InFlight:
+    """Counts concurrent requests and remembers the peak"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def summarize(label, latencies, wall, peak, errors):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * (len(ordered) - 1)))] if ordered else 0.0
+    print(f"{label:>12} {len(latencies):>6} {peak:>6} {wall:>8.2f} {len(latencies) / wall:>8.1f} "
+          f"{statistics.median(ordered) if ordered else 0.0:>8.2f} {p95:>8.2f} {errors:>6}")
+
+
+def run_sync(url, concurrency, workers):
+    client = ThetaLLM(api_key="bench", url=url, pool_size=workers, max_retries=0, timeout=120)
+    in_flight = InFlight()
+
+    def one():
+        with in_flight:
+            answer = client.invoke(MESSAGES)
+        # Every turn arrives at once, so latency includes the wait for a free worker
+        return time.perf_counter() - start, answer.startswith("⚠️")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: one(), range(concurrency)))
+    wall = time.perf_counter() - start
+    summarize(f"sync-{workers}", [r[0] for r in results], wall, in_flight.peak, sum(r[1] for r in results))
+
+
+async def run_async(url, concurrency):
+    client = AsyncThetaLLM(api_key="bench", url=url, pool_size=concurrency, max_retries=0, timeout=120)
+    in_flight = InFlight()
+
+    async def one():
+        with in_flight:
+            answer = await client.invoke(MESSAGES)
+        return time.perf_counter() - start, answer.startswith("⚠️")
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    await client.aclose()
+    summarize("asyncio", [r[0] for r in results], wall, in_flight.peak, sum(r[1] for r in results))
+
+
+async def run_server(base_url, token, concurrency):
+    """Fire concurrent /api/chat turns at a running server"""
+    in_flight = InFlight()
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, cookies={"token": token}, limits=limits, timeout=300) as client:
+        async def one(i):
+            start = time.perf_counter()
+            with in_flight:
+                response = await client.post("/api/chat", json={"message": f"Question {i}: what is osmosis?",
+                                                                "session_id": f"loadtest-{i}"})
+            return time.perf_counter() - start, response.status_code != 200
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+    summarize("server", [r[0] for r in results], wall, in_flight.peak, sum(r[1] for r in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200, 500],
+                        help="simultaneous chat turns per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16], help="sync worker counts to compare")
+    parser.add_argument("--delay", type=float, default=1.0, help="stand-in model latency in seconds")
+    parser.add_argument("--url", help="load-test a running server at this base URL instead")
+    parser.add_argument("--token", help="session token cookie for --url")
+    args = parser.parse_args()
+
+    header = f"{'mode':>12} {'turns':>6} {'peak':>6} {'wall s':>8} {'turns/s':>8} {'p50 s':>8} {'p95 s':>8} {'errors':>6}"
+    if args.url:
+        if not args.token:
+            parser.error("--url needs --token (the 'token' cookie of a logged-in user)")
+        print(header)
+        for concurrency in args.concurrency:
+            asyncio.run(run_server(args.url, args.token, concurrency))
+        return
+
+    server = make_server(port=0, delay=args.delay, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/completions"
+    print(f"Stand-in model latency {args.delay:.1f}s\n")
+    for concurrency in args.concurrency:
+        print(f"concurrency {concurrency}")
+        print(header)
+        for workers in args.workers:
+            run_sync(url, concurrency, workers)
+        asyncio.run(run_async(url, concurrency))
+        print()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming DOCX extraction vs python-docx.
+
+Generates .docx files of increasing size (paragraphs interleaved with
+tables), then extracts text from each with:
+
+  python-docx   docx.Document + paragraphs + every table cell (what it takes
+                to get the same content the streaming extractor returns)
+  streaming     docx_stream.iter_docx_blocks
+
+Each extraction runs in a fresh subprocess so peak RSS (which includes
+lxml's C allocations, unlike tracemalloc) is measured independently. Peak
+RSS includes the interpreter itself, so compare the growth between sizes.
+
+Usage (from backend/):
+    python benchmarks/bench_docx_stream.py
+    python benchmarks/bench_docx_stream.py --sizes 2000 20000 100000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+
+def make_docx(path, paragraphs):
+    import docx
+    document = docx.Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"Paragraph {i}: photosynthesis converts light energy into chemical energy " * 3)
+        if i % 50 == 0:
+            table = document.add_table(rows=10, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"r{r}c{c} value {i}"
+    document.save(path)
+
+
+def extract(method, path):
+    """Run one extraction in this process and report time, peak RSS and characters"""
+    start = time.perf_counter()
+    chars = 0
+    if method == "python-docx":
+        import docx
+        document = docx.Document(path)
+        chars += sum(len(p.text) for p in document.paragraphs)
+        for table in document.tables:
+            for row in table.rows:
+                chars += sum(len(cell.text) for cell in row.cells)
+    else:
+        from docx_stream import iter_docx_blocks
+        chars = sum(len(block) for block in iter_docx_blocks(path))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak_rss_mb(), "chars": chars}))
+
+
+def peak_rss_mb():
+    # ru_maxrss survives exec and would include the parent's high-water mark, so prefer
+    # VmHWM, which belongs to this process's own address space
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="paragraph counts")
+    parser.add_argument("--extract", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.extract:
+        extract(*args.extract)
+        return
+
+    print(f"{'paragraphs':>10} {'file MB':>8} {'method':>12} {'seconds':>8} {'peak MB':>8} {'MB/s':>7} {'chars':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.docx")
+            make_docx(path, size)
+            file_mb = os.path.getsize(path) / (1024 * 1024)
+            for method in ("python-docx", "streaming"):
+                out = subprocess.run([sys.executable, __file__, "--extract", method, path],
+                                     capture_output=True, text=True, cwd=BACKEND_DIR, check=True)
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{size:>10} {file_mb:>8.1f} {method:>12} {result['seconds']:>8.2f} "
+                      f"{result['peak_rss_mb']:>8.1f} {file_mb / result['seconds']:>7.1f} {result['chars']:>10}")
+
+
+if __name__ == "__main__":
+    main()
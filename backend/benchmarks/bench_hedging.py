@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark: completion latency with and without hedged requests.
+
+Sends the same batch of completions through ThetaLLM and AsyncThetaLLM,
+first plain and then with a HedgePolicy, and reports p50/p95/p99 latency
+plus how many extra upstream calls hedging cost.
+
+By default the upstream is the local stand-in (dev_llm_server.py) with a
+long tail: most replies take --delay seconds, a --slow-rate fraction take
+--slow-delay, which is what a completion stuck behind a busy replica looks
+like. Pass --url (and optionally --hedge-url) with --api-key to measure the
+real API instead.
+
+Usage (from backend/):
+    python benchmarks/bench_hedging.py
+    python benchmarks/bench_hedging.py --requests 400 --slow-rate 0.05 --slow-delay 10
+    python benchmarks/bench_hedging.py --url https://.../completions --api-key $THETA_API_KEY --requests 100
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dev_llm_server import make_server  # noqa: E402
+from llm_client import ThetaLLM, AsyncThetaLLM, HedgePolicy  # noqa: E402
+from metrics import LatencyHistogram  # noqa: E402
+
+
+def messages_for(i):
+    return [{"role": "user", "content": f"Question {i}: explain photosynthesis in one sentence."}]
+
+
+def make_policy(args):
+    if not args.hedge:
+        return None
+    return HedgePolicy(percentile=args.percentile, min_delay=args.min_delay, max_delay=args.max_delay,
+                       budget_ratio=args.budget_ratio, min_samples=args.min_samples, url=args.hedge_url)
+
+
+def run_sync(args, url):
+    hedge = make_policy(args)
+    client = ThetaLLM(api_key=args.api_key, url=url, pool_size=args.concurrency, max_retries=0,
+                      timeout=args.timeout, hedge=hedge)
+    latencies, errors = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        answer = client.invoke(messages_for(i))
+        return time.perf_counter() - start, answer.startswith("⚠️")
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for seconds, failed in pool.map(one, range(args.requests)):
+            latencies.append(seconds)
+            errors += failed
+    return latencies, errors, hedge
+
+
+def run_async(args, url):
+    hedge = make_policy(args)
+
+    async def main():
+        client = AsyncThetaLLM(api_key=args.api_key, url=url, pool_size=2 * args.concurrency, max_retries=0,
+                               timeout=args.timeout, hedge=hedge)
+        gate = asyncio.Semaphore(args.concurrency)
+
+        async def one(i):
+            async with gate:
+                start = time.perf_counter()
+                answer = await client.invoke(messages_for(i))
+                return time.perf_counter() - start, answer.startswith("⚠️")
+
+        try:
+            return await asyncio.gather(*(one(i) for i in range(args.requests)))
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(main())
+    return [r[0] for r in results], sum(r[1] for r in results), hedge
+
+
+def report(label, latencies, errors, hedge, requests):
+    histogram = LatencyHistogram(max_samples=len(latencies))
+    for seconds in latencies:
+        histogram.observe(seconds)
+    extra = f"{hedge.hedges_sent:>7} {hedge.hedge_wins:>6} {100 * hedge.hedges_sent / requests:>6.1f}%" if hedge \
+        else f"{'-':>7} {'-':>6} {'-':>7}"
+    print(f"{label:>14} {histogram.percentile(50):>7.2f} {histogram.percentile(95):>7.2f} "
+          f"{histogram.percentile(99):>7.2f} {max(latencies):>7.2f} {errors:>6} {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.3, help="stand-in: normal reply latency")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="stand-in: fraction of slow replies")
+    parser.add_argument("--slow-delay", type=float, default=8.0, help="stand-in: latency of a slow reply")
+    parser.add_argument("--percentile", type=float, default=95.0)
+    parser.add_argument("--min-delay", type=float, default=0.5)
+    parser.add_argument("--max-delay", type=float, default=10.0)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--budget-ratio", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--url", help="LLM endpoint (default: local stand-in)")
+    parser.add_argument("--hedge-url", help="secondary endpoint for hedges (default: same as --url)")
+    parser.add_argument("--api-key", default="bench")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = make_server(port=0, delay=args.delay, slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+                             quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/completions"
+
+    print(f"{args.requests} completions, concurrency {args.concurrency}"
+          f"{'' if args.url else f', stand-in {args.delay}s with {args.slow_rate:.0%} at {args.slow_delay}s'}")
+    print(f"{'client':>14} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'errors':>6} "
+          f"{'hedges':>7} {'wins':>6} {'extra':>7}")
+    for client_name, run in (("sync", run_sync), ("async", run_async)):
+        for hedged in (False, True):
+            args.hedge = hedged
+            latencies, errors, hedge = run(args, url)
+            report(f"{client_name}{' hedged' if hedged else ''}", latencies, errors, hedge, args.requests)
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prompt history with and without rolling summaries.
+
+Replays recorded sessions (the chat_history_*.json files the backend
+writes) turn by turn and, for every user question, compares the history
+part of the prompt under three policies:
+
+  window     the last 6 messages verbatim (the original fixed window)
+  full       the whole conversation verbatim (what it takes to keep all context)
+  summary    running summary + messages it doesn't cover yet, with the
+             summary refreshed the way the app does it (SUMMARY_KEEP_RECENT /
+             SUMMARY_TRIGGER_MESSAGES)
+
+Token counts use prompt_builder's counter. Each question is also sent to
+the LLM with the window and summary histories to compare answer latency.
+By default that's the local stand-in (dev_llm_server.py) with a per-token
+prefill cost, so the latency gain is modelled; pass --url and --api-key to
+measure against the real API. Summaries are produced by the same LLM.
+
+With no recorded sessions, synthetic ones are generated.
+
+Usage (from backend/):
+    python benchmarks/bench_history_summary.py
+    python benchmarks/bench_history_summary.py --sessions 'chat_history_*.json' --keep-recent 4 --trigger 8
+    python benchmarks/bench_history_summary.py --url https://.../completions --api-key $THETA_API_KEY
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dev_llm_server import make_server  # noqa: E402
+from llm_client import ThetaLLM  # noqa: E402
+from prompt_builder import PromptBudget, summary_messages  # noqa: E402
+
+INSTRUCTIONS = "You are a helpful teacher assistant. Answer the user's question clearly and truthfully.\n"
+TOPICS = ["photosynthesis", "cell division", "Newton's laws", "the French Revolution", "quadratic equations",
+          "plate tectonics", "the water cycle", "supply and demand"]
+
+
+def synthetic_sessions(count, turns, seed=7):
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        conv = []
+        for t in range(turns):
+            topic = rng.choice(TOPICS)
+            conv.append({"role": "user", "content": f"Can you explain {topic} again, in particular part {t}?"})
+            sentences = rng.randint(6, 20)
+            conv.append({"role": "assistant", "content": " ".join(
+                f"Sentence {i} about {topic}: it matters because of cause {i} and effect {i + 1}." for i in range(sentences))})
+        sessions.append(conv)
+    return sessions
+
+
+def history_text(messages, summary=None):
+    lines = [f"Summary of earlier conversation: {summary}"] if summary else []
+    for msg in messages:
+        if msg.get("role") == "user":
+            lines.append(f"User: {msg['content']}")
+        elif msg.get("role") == "assistant":
+            lines.append(f"Assistant: {msg['content']}")
+    return "\n".join(lines)
+
+
+def timed_invoke(llm, history, question):
+    messages = [
+        {"role": "system", "content": f"{INSTRUCTIONS}Chat History:\n{history}"},
+        {"role": "user", "content": f"Question: {question}"}
+    ]
+    start = time.perf_counter()
+    llm.invoke(messages)
+    return time.perf_counter() - start
+
+
+def replay(conv, llm, budget, keep_recent, trigger, window):
+    """Per-question history tokens and latencies for one session"""
+    rows = []
+    summary = {"text": "", "covered": 0}
+    for j, msg in enumerate(conv):
+        if msg.get("role") != "user":
+            continue
+        before = conv[:j]
+        if summary["covered"]:
+            recent = before[max(summary["covered"], len(before) - max(window, keep_recent + trigger)):]
+            summary_history = history_text(recent, summary["text"])
+        else:
+            summary_history = history_text(before[-window:])
+        window_history = history_text(before[-window:])
+        rows.append({
+            "window": budget.count(window_history),
+            "full": budget.count(history_text(before)),
+            "summary": budget.count(summary_history),
+            "window_s": timed_invoke(llm, window_history, msg["content"]),
+            "summary_s": timed_invoke(llm, summary_history, msg["content"])
+        })
+        # After the turn is recorded the app may refresh the summary in the background
+        after = j + 2
+        if after - keep_recent - summary["covered"] >= trigger:
+            end = after - keep_recent
+            text = llm.invoke(summary_messages(budget, summary["text"], conv[summary["covered"]:end]))
+            if text and "⚠️" not in text:
+                summary = {"text": text.strip(), "covered": end}
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="chat_history_*.json", help="glob of recorded session files")
+    parser.add_argument("--synthetic", type=int, default=5, help="synthetic sessions to use when none are found")
+    parser.add_argument("--turns", type=int, default=20, help="turns per synthetic session")
+    parser.add_argument("--keep-recent", type=int, default=2)
+    parser.add_argument("--trigger", type=int, default=4)
+    parser.add_argument("--window", type=int, default=6)
+    parser.add_argument("--url", help="LLM endpoint (default: local stand-in)")
+    parser.add_argument("--api-key", default="bench")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=150.0,
+                        help="stand-in prompt processing cost per 1000 input tokens")
+    args = parser.parse_args()
+
+    sessions = []
+    for path in sorted(glob.glob(args.sessions)):
+        with open(path) as f:
+            conv = json.load(f)
+        if sum(1 for m in conv if m.get("role") == "user") >= 3:
+            sessions.append(conv)
+    source = f"{len(sessions)} recorded sessions"
+    if not sessions:
+        sessions = synthetic_sessions(args.synthetic, args.turns)
+        source = f"{len(sessions)} synthetic sessions of {args.turns} turns"
+
+    server = None
+    url = args.url
+    if not url:
+        server = make_server(port=0, delay=0.05, token_delay=0, prefill_ms_per_1k=args.prefill_ms_per_1k, quiet=True,
+                             reply="The student has been studying several topics and asked follow-up questions.")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/completions"
+
+    llm = ThetaLLM(api_key=args.api_key, url=url)
+    budget = PromptBudget()
+    rows = []
+    for conv in sessions:
+        rows.extend(replay(conv, llm, budget, args.keep_recent, args.trigger, args.window))
+    if server:
+        server.shutdown()
+
+    print(f"{source}, {len(rows)} questions, keep_recent={args.keep_recent} trigger={args.trigger}")
+    print(f"{'history':>10} {'mean tok':>9} {'p95 tok':>8} {'max tok':>8}")
+    for key in ("window", "full", "summary"):
+        values = sorted(r[key] for r in rows)
+        print(f"{key:>10} {statistics.mean(values):>9.0f} {values[int(0.95 * (len(values) - 1))]:>8} {values[-1]:>8}")
+    window_s = statistics.mean(r["window_s"] for r in rows)
+    summary_s = statistics.mean(r["summary_s"] for r in rows)
+    full_tokens = statistics.mean(r["full"] for r in rows)
+    summary_tokens = statistics.mean(r["summary"] for r in rows)
+    window_tokens = statistics.mean(r["window"] for r in rows)
+    print(f"\nhistory tokens vs window: {100 * (1 - summary_tokens / window_tokens):.0f}% fewer; "
+          f"vs full history: {100 * (1 - summary_tokens / full_tokens):.0f}% fewer")
+    print(f"mean answer latency: window {window_s:.3f}s, summary {summary_s:.3f}s "
+          f"({100 * (1 - summary_s / window_s):.0f}% faster){'' if args.url else ' [stand-in model]'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark: routing completions over several backends.
+
+Starts local stand-ins (dev_llm_server.py) for three backends:
+
+  theta-fast    Theta-shaped endpoint, --fast-delay per reply
+  theta-slow    Theta-shaped endpoint, --slow-delay per reply (the slow region)
+  openai        OpenAI-compatible /chat/completions, --openai-delay per reply
+
+and runs the same batch of concurrent completions:
+
+  single        THETA_API_URL as before: everything on theta-slow
+  routed        AsyncThetaLLM over all three backends
+  failover      routed, with theta-fast answering 503 from halfway through
+
+For each run it reports latency percentiles, errors and how requests were
+spread over the backends.
+
+Usage (from backend/):
+    python benchmarks/bench_llm_router.py
+    python benchmarks/bench_llm_router.py --requests 400 --concurrency 50 --slow-delay 2
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dev_llm_server import make_server  # noqa: E402
+from llm_client import AsyncThetaLLM, CircuitBreaker, LLMBackend  # noqa: E402
+from metrics import LatencyHistogram, metrics  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Explain photosynthesis in one sentence."}]
+
+
+def start_stand_in(delay):
+    server = make_server(port=0, delay=delay, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def run(client, requests, concurrency, on_halfway=None):
+    gate = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def one():
+        nonlocal done
+        async with gate:
+            start = time.perf_counter()
+            answer = await client.invoke(MESSAGES)
+            done += 1
+            if on_halfway and done == requests // 2:
+                await asyncio.to_thread(on_halfway)
+            return time.perf_counter() - start, answer.startswith("⚠️")
+
+    try:
+        return await asyncio.gather(*(one() for _ in range(requests)))
+    finally:
+        await client.aclose()
+
+
+def report(label, results, backends):
+    histogram = LatencyHistogram(max_samples=len(results))
+    for seconds, _ in results:
+        histogram.observe(seconds)
+    errors = sum(failed for _, failed in results)
+    spread = "  ".join(f"{b.name}={b.requests}" for b in backends)
+    print(f"{label:>9} {histogram.percentile(50):>7.2f} {histogram.percentile(95):>7.2f} "
+          f"{histogram.percentile(99):>7.2f} {errors:>6}   {spread}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--fast-delay", type=float, default=0.2)
+    parser.add_argument("--slow-delay", type=float, default=1.5)
+    parser.add_argument("--openai-delay", type=float, default=0.4)
+    args = parser.parse_args()
+
+    def make_backends(servers):
+        fast, slow, openai = servers
+        return [
+            LLMBackend(f"{base_url(fast)}/completions", "bench", name="theta-fast",
+                       breaker=CircuitBreaker(min_requests=5, cooldown_seconds=30)),
+            LLMBackend(f"{base_url(slow)}/completions", "bench", name="theta-slow"),
+            LLMBackend(f"{base_url(openai)}/v1/chat/completions", "bench", kind=LLMBackend.OPENAI,
+                       model="stand-in", name="openai")
+        ]
+
+    print(f"{args.requests} completions, concurrency {args.concurrency}; stand-ins: theta-fast {args.fast_delay}s, "
+          f"theta-slow {args.slow_delay}s, openai {args.openai_delay}s")
+    print(f"{'run':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>6}   requests per backend")
+
+    slow = start_stand_in(args.slow_delay)
+    single = [LLMBackend(f"{base_url(slow)}/completions", "bench", name="theta-slow")]
+    results = asyncio.run(run(AsyncThetaLLM("bench", backends=single, max_retries=0), args.requests,
+                              args.concurrency))
+    report("single", results, single)
+
+    servers = [start_stand_in(args.fast_delay), slow, start_stand_in(args.openai_delay)]
+    backends = make_backends(servers)
+    results = asyncio.run(run(AsyncThetaLLM("bench", backends=backends, max_retries=0), args.requests,
+                              args.concurrency))
+    report("routed", results, backends)
+
+    backends = make_backends(servers)
+
+    def kill_fast():
+        servers[0].RequestHandlerClass.options.fail_rate = 1.0
+
+    failovers_before = metrics.snapshot()["counters"].get("llm.failovers", 0)
+    results = asyncio.run(run(AsyncThetaLLM("bench", backends=backends, max_retries=0), args.requests,
+                              args.concurrency, on_halfway=kill_fast))
+    report("failover", results, backends)
+    failovers = metrics.snapshot()["counters"].get("llm.failovers", 0) - failovers_before
+    print(f"\nfailover run: {failovers} requests failed over, theta-fast circuit {backends[0].breaker.state}")
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
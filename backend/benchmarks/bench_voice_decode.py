@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: voice-question latency, temp file vs in-memory decoding.
+
+For short clips, compares the old /api/audio path (write the upload to disk,
+let Whisper open and decode the file) with the current one (decode the
+upload in memory with PyAV and hand Whisper the array). Reports decode time
+and end-to-end transcription time, median of several runs.
+
+Clips are synthetic WAVs by default; pass --audio to use a real recording
+trimmed to each length (it is re-encoded to WAV in memory first).
+
+Usage (from backend/):
+    python benchmarks/bench_voice_decode.py
+    python benchmarks/bench_voice_decode.py --audio question.m4a --lengths 3 5 10
+"""
+
+import io
+import os
+import sys
+import time
+import wave
+import argparse
+import statistics
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from transcription import decode_audio_stream, transcribe_segments, get_whisper_model  # noqa: E402
+from bench_whisper_batched import synthetic_speech, SAMPLE_RATE  # noqa: E402
+
+
+def to_wav_bytes(audio):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+def temp_file_path(payload):
+    """Old path: save upload to disk, transcribe from the path, delete"""
+    path = os.path.join(tempfile.gettempdir(), "bench_temp_audio_input")
+    start = time.perf_counter()
+    with open(path, "wb") as f:
+        f.write(payload)
+    segments, _ = transcribe_segments(path, batched=False)
+    " ".join(seg.text for seg in segments)
+    os.remove(path)
+    return time.perf_counter() - start
+
+
+def in_memory(payload):
+    """New path: decode from the upload stream, transcribe the array"""
+    start = time.perf_counter()
+    audio = decode_audio_stream(io.BytesIO(payload))
+    decoded = time.perf_counter()
+    segments, _ = transcribe_segments(audio, batched=False)
+    " ".join(seg.text for seg in segments)
+    return time.perf_counter() - start, decoded - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="real recording to trim instead of synthetic audio")
+    parser.add_argument("--lengths", type=float, nargs="+", default=[2, 5, 10, 20], help="clip lengths in seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    source = None
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            source = decode_audio_stream(f)
+    get_whisper_model()
+
+    print(f"{'clip':>6} {'temp file ms':>13} {'in-memory ms':>13} {'decode ms':>10}")
+    for seconds in args.lengths:
+        samples = int(seconds * SAMPLE_RATE)
+        audio = source[:samples] if source is not None else synthetic_speech(int(np.ceil(seconds)))[:samples]
+        payload = to_wav_bytes(audio)
+        in_memory(payload)  # warm up
+        old = [temp_file_path(payload) for _ in range(args.runs)]
+        new = [in_memory(payload) for _ in range(args.runs)]
+        print(f"{seconds:>5}s {statistics.median(old) * 1000:>13.1f} "
+              f"{statistics.median(t for t, _ in new) * 1000:>13.1f} "
+              f"{statistics.median(d for _, d in new) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
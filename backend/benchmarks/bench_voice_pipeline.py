@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end voice-question latency, sequential vs. pipelined.
+
+Answers the same voice questions two ways:
+
+  sequential   the previous /api/audio order: whole transcript, then the
+               session profile, then retrieval, then the LLM
+  pipelined    VoicePipeline: the profile loads alongside transcription and
+               retrieval starts on the partial transcript; it is kept or
+               redone once the transcript is final, then the LLM
+
+and reports p50/p95 latency from upload to answer, plus how often the
+speculative retrieval was kept or had to be refined.
+
+By default every stage is simulated, so the run only shows the effect of
+the overlap: Whisper yields --segments segments --segment-delay apart,
+retrieval takes --retrieval-delay, the profile load --profile-delay, and
+the LLM is the local stand-in (dev_llm_server.py) answering after
+--llm-delay. A --drift-rate share of questions change topic after the first
+segment, which forces a refinement.
+
+With --audio, the real stack is used instead: the files are transcribed by
+Whisper and retrieval runs against --user's indexes through app.py (run
+from backend/ with the app's environment). The LLM stays the stand-in, so
+upstream variance doesn't drown the difference.
+
+Usage (from backend/):
+    python benchmarks/bench_voice_pipeline.py
+    python benchmarks/bench_voice_pipeline.py --segments 4 --segment-delay 0.5 --drift-rate 0.3
+    python benchmarks/bench_voice_pipeline.py --audio q1.wav q2.m4a --user alice@example.com
+"""
+
+import os
+import sys
+import time
+import random
+import zlib
+import argparse
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dev_llm_server import make_server  # noqa: E402
+from llm_client import ThetaLLM  # noqa: E402
+from metrics import LatencyHistogram, metrics  # noqa: E402
+from voice_pipeline import VoicePipeline  # noqa: E402
+
+EMBEDDING_DIM = 64
+
+
+def bag_of_words_embedding(text):
+    """Stand-in embedding: questions about the same topic words point the same way"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in text.split():
+        vector[zlib.crc32(word.encode()) % EMBEDDING_DIM] += 1.0
+    return vector.tolist()
+
+
+def simulated_stack(args):
+    """(questions, transcribe, retrieve, embed_query, load_profile) with every stage a sleep"""
+    rng = random.Random(11)
+    questions = []
+    for i in range(args.requests):
+        topic, drift = f"topic{i}", f"other{i}"
+        later = drift if rng.random() < args.drift_rate else topic
+        questions.append([" ".join([topic] * 5)] + [" ".join([later] * 5)] * (args.segments - 1))
+
+    def transcribe(audio):
+        def segments():
+            for text in audio:
+                time.sleep(args.segment_delay)
+                yield SimpleNamespace(text=text)
+        return segments(), None
+
+    def retrieve(text, query_vector=None):
+        time.sleep(args.retrieval_delay)
+        return [SimpleNamespace(page_content=f"context for {text[:20]}")], bag_of_words_embedding(text)
+
+    def load_profile():
+        time.sleep(args.profile_delay)
+
+    return questions, transcribe, retrieve, bag_of_words_embedding, load_profile
+
+
+def real_stack(args):
+    import app
+    from functools import partial
+    from transcription import decode_audio_stream, transcribe_segments
+
+    questions = []
+    for path in args.audio:
+        with open(path, "rb") as f:
+            questions.append(decode_audio_stream(f, max_seconds=app.VOICE_QUESTION_MAX_SECONDS))
+    questions = [questions[i % len(questions)] for i in range(args.requests)]
+
+    def load_profile():
+        conv = app.get_conversation(args.user)
+        app.get_session_profile(args.user, "default", conv)
+
+    return (questions, lambda audio: transcribe_segments(audio, batched=False), partial(app.retrieve_context, args.user),
+            app.embeddings.embed_query, load_profile)
+
+
+def ask(llm, text, docs):
+    context = "\n".join(doc.page_content for doc in docs)
+    llm.invoke([{"role": "system", "content": f"Context:\n{context}"}, {"role": "user", "content": text}])
+
+
+def sequential(stack, llm, audio):
+    _, transcribe, retrieve, _, load_profile = stack
+    start = time.perf_counter()
+    segments, _ = transcribe(audio)
+    text = " ".join(segment.text.strip() for segment in segments)
+    load_profile()
+    docs, _ = retrieve(text)
+    ask(llm, text, docs)
+    return time.perf_counter() - start
+
+
+def pipelined(stack, llm, audio, pipeline, executor):
+    _, _, retrieve, _, load_profile = stack
+    start = time.perf_counter()
+    profile = executor.submit(load_profile)
+    transcript = pipeline.transcribe(audio, retrieve)
+    profile.result()
+    docs, _ = pipeline.context(transcript, retrieve)
+    ask(llm, transcript.text, docs)
+    return time.perf_counter() - start
+
+
+def report(label, latencies, extra=""):
+    histogram = LatencyHistogram(max_samples=len(latencies))
+    for seconds in latencies:
+        histogram.observe(seconds)
+    print(f"{label:>11} {histogram.percentile(50):>7.2f} {histogram.percentile(95):>7.2f} "
+          f"{sum(latencies) / len(latencies):>7.2f}   {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--segments", type=int, default=3, help="simulated: Whisper segments per question")
+    parser.add_argument("--segment-delay", type=float, default=0.4, help="simulated: decode time per segment")
+    parser.add_argument("--retrieval-delay", type=float, default=0.35, help="simulated: embedding + index search")
+    parser.add_argument("--profile-delay", type=float, default=0.05, help="simulated: session/profile load")
+    parser.add_argument("--drift-rate", type=float, default=0.2, help="simulated: questions that change topic")
+    parser.add_argument("--llm-delay", type=float, default=0.8, help="stand-in LLM reply latency")
+    parser.add_argument("--keep-similarity", type=float, default=0.9)
+    parser.add_argument("--audio", nargs="*", default=[], help="real voice questions (needs the app environment)")
+    parser.add_argument("--user", help="with --audio: user whose indexes to search")
+    args = parser.parse_args()
+    if args.audio and not args.user:
+        parser.error("--audio needs --user")
+
+    server = make_server(port=0, delay=args.llm_delay, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    llm = ThetaLLM(api_key="bench", url=f"http://127.0.0.1:{server.server_address[1]}/completions",
+                   pool_size=args.concurrency, max_retries=0)
+
+    stack = real_stack(args) if args.audio else simulated_stack(args)
+    questions, transcribe, _, embed_query, _ = stack
+    executor = ThreadPoolExecutor(max_workers=2 * args.concurrency, thread_name_prefix="voice")
+    pipeline = VoicePipeline(transcribe, embed_query, executor, keep_similarity=args.keep_similarity)
+
+    if args.audio:
+        print(f"{args.requests} voice questions from {len(args.audio)} files, concurrency {args.concurrency}, "
+              f"stand-in LLM {args.llm_delay}s")
+    else:
+        print(f"{args.requests} simulated voice questions, concurrency {args.concurrency}: {args.segments} segments "
+              f"x {args.segment_delay}s, retrieval {args.retrieval_delay}s, LLM {args.llm_delay}s, "
+              f"{args.drift_rate:.0%} drift")
+    print(f"{'path':>11} {'p50 s':>7} {'p95 s':>7} {'mean s':>7}   speculative retrieval")
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(lambda audio: sequential(stack, llm, audio), questions))
+        report("sequential", latencies)
+        before = metrics.snapshot()["counters"]
+        latencies = list(pool.map(lambda audio: pipelined(stack, llm, audio, pipeline, executor), questions))
+        after = metrics.snapshot()["counters"]
+    outcomes = {name: after.get(f"voice.speculation_{name}", 0) - before.get(f"voice.speculation_{name}", 0)
+                for name in ("kept", "refined")}
+    report("pipelined", latencies, f"kept={outcomes['kept']} refined={outcomes['refined']}")
+
+    executor.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sequential vs batched Whisper transcription.
+
+Transcribes audio of several lengths with plain WhisperModel.transcribe and
+with BatchedInferencePipeline at a few batch sizes, and prints wall time and
+real-time factor for each.
+
+By default the audio is synthetic: voiced, syllable-shaped bursts separated
+by pauses, so VAD finds speech-like regions. Synthetic audio gives Whisper
+nothing real to transcribe, so for representative numbers pass a real
+recording with --audio; it is looped to each target length.
+
+Usage (from backend/):
+    python benchmarks/bench_whisper_batched.py
+    python benchmarks/bench_whisper_batched.py --audio lecture.mp3 --lengths 60 300 1200
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from faster_whisper import decode_audio  # noqa: E402
+from transcription import transcribe_segments, get_whisper_model  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_speech(seconds, seed=0):
+    """Harmonic bursts with syllable envelopes and short pauses, as 16 kHz float32"""
+    rng = np.random.default_rng(seed)
+    out = []
+    total = 0
+    while total < seconds * SAMPLE_RATE:
+        # A "phrase" of 3-8 syllables followed by a pause
+        for _ in range(rng.integers(3, 9)):
+            length = int(rng.uniform(0.12, 0.3) * SAMPLE_RATE)
+            t = np.arange(length) / SAMPLE_RATE
+            f0 = rng.uniform(100, 220)
+            voiced = sum(np.sin(2 * np.pi * f0 * h * t) / h for h in range(1, 8))
+            envelope = np.sin(np.pi * np.linspace(0, 1, length))
+            out.append((voiced * envelope * 0.3).astype(np.float32))
+            total += length
+        pause = int(rng.uniform(0.3, 0.9) * SAMPLE_RATE)
+        out.append((rng.normal(0, 0.003, pause)).astype(np.float32))
+        total += pause
+    return np.concatenate(out)[: seconds * SAMPLE_RATE]
+
+
+def looped(audio, seconds):
+    reps = int(np.ceil(seconds * SAMPLE_RATE / len(audio)))
+    return np.tile(audio, reps)[: seconds * SAMPLE_RATE]
+
+
+def run(audio, **kwargs):
+    start = time.perf_counter()
+    segments, _ = transcribe_segments(audio, **kwargs)
+    count = sum(1 for _ in segments)
+    return time.perf_counter() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="real recording to loop instead of synthetic audio")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[30, 120, 600], help="audio lengths in seconds")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    source = decode_audio(args.audio, sampling_rate=SAMPLE_RATE) if args.audio else None
+    get_whisper_model()  # load outside the timed region
+
+    print(f"{'length':>8} {'mode':>12} {'seconds':>9} {'RTF':>7} {'segments':>9}")
+    for seconds in args.lengths:
+        audio = looped(source, seconds) if source is not None else synthetic_speech(seconds)
+        elapsed, count = run(audio, batched=False)
+        print(f"{seconds:>7}s {'sequential':>12} {elapsed:>9.2f} {elapsed / seconds:>7.3f} {count:>9}")
+        for batch_size in args.batch_sizes:
+            elapsed, count = run(audio, batched=True, batch_size=batch_size)
+            print(f"{seconds:>7}s {f'batch={batch_size}':>12} {elapsed:>9.2f} {elapsed / seconds:>7.3f} {count:>9}")
+
+
+if __name__ == "__main__":
+    main()
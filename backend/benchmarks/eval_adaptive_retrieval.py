@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Evaluation: adaptive retrieval vs. the fixed user k=3 + global k=2 search.
+
+For every question in a labelled set, retrieves context two ways:
+
+  fixed      the previous policy: the user index searched with the
+             name-prefixed question (one embedding), the global index with
+             the bare question (a second embedding), k=3 and k=2, user
+             chunks first, capped at 5
+  adaptive   app.retrieve_context: one embedding, user index first, then
+             the global index skipped, shrunk or widened by how well the
+             user's chunks scored (searched alongside at its widest when
+             the user's index is slow)
+
+and reports recall, the embedding and search work done, latency and how
+often the global search was skipped/shrunk/widened. --sweep re-runs the
+adaptive policy for several strong-relevance thresholds.
+
+--calibrate measures instead: the relevance scores (app.relevance) of the
+hits each index returns, split into relevant and other hits, and the best
+user hit for questions the user's index did and didn't answer. It suggests
+RETRIEVAL_STRONG_RELEVANCE as the lowest score above which --precision of
+the user's hits are relevant, and RETRIEVAL_WEAK_RELEVANCE as the score
+below which the user's index rarely held the answer. Scores depend on the
+embedding model and the documents, so calibrate against the real indexes
+and keep the --output file with the thresholds you set.
+
+Labelled set: JSON lines, one question each:
+    {"user": "alice@example.com", "question": "...", "relevant": ["notes.pdf", "a phrase from the chunk"]}
+A retrieved chunk is relevant if its source file is listed or it contains
+one of the listed phrases. Without a labelled set, --synthesize N builds one
+from the indexes themselves: the opening words of a sampled chunk are the
+question and that chunk is the answer.
+
+Runs against the real indexes and embedding model, so run it from backend/
+with the app's environment:
+    python benchmarks/eval_adaptive_retrieval.py --questions labelled.jsonl
+    python benchmarks/eval_adaptive_retrieval.py --synthesize 200 --user alice@example.com --sweep 0.5 0.6 0.7
+    python benchmarks/eval_adaptive_retrieval.py --questions labelled.jsonl --calibrate --output calibration.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+DECISIONS = ("skipped", "shrunk", "default", "widened")
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthesize(users, count, seed=7):
+    """Questions made from the opening words of randomly sampled chunks in the users' and global indexes"""
+    rng = random.Random(seed)
+    pool = []
+    for user in users:
+        vs = app.load_vectorstore_for_user(user)
+        if vs is not None:
+            pool.extend((user, doc) for doc in vs.docstore._dict.values())
+    global_vs = app.global_vectorstore or app.load_global_vectorstore()
+    pool.extend((rng.choice(users), doc) for doc in global_vs.docstore._dict.values())
+    pool = [(user, doc) for user, doc in pool if len(doc.page_content.split()) >= 30]
+    questions = []
+    for user, doc in rng.sample(pool, min(count, len(pool))):
+        words = doc.page_content.split()
+        start = rng.randint(0, max(0, len(words) - 20))
+        questions.append({"user": user, "question": " ".join(words[start:start + 12]),
+                          "relevant": [doc.page_content[:200]]})
+    return questions
+
+
+def is_relevant(doc, relevant):
+    source = doc.metadata.get("source")
+    return any(item == source or item in doc.page_content for item in relevant)
+
+
+def fixed_retrieval(user, question):
+    """The previous policy, for comparison"""
+    name = user.split("@")[0].capitalize()
+    docs = []
+    vs = app.load_vectorstore_for_user(user)
+    if vs is not None:
+        docs.extend(vs.similarity_search(f"User Name: {name}\nQuestion: {question}", k=3))
+    docs.extend(app.search_global_knowledge(question, k=2, query_vector=app.embeddings.embed_query(question)))
+    unique, seen = [], set()
+    for doc in docs:
+        if doc.page_content not in seen:
+            unique.append(doc)
+            seen.add(doc.page_content)
+        if len(unique) >= 5:
+            break
+    return unique, {"embeddings": 2, "searches": 1 + (vs is not None)}
+
+
+def adaptive_retrieval(user, question):
+    before = metrics.snapshot()["counters"]
+    docs, _ = app.retrieve_context(user, question)
+    after = metrics.snapshot()["counters"]
+    decision = next(d for d in DECISIONS if after.get(f"retrieval.global_{d}", 0) > before.get(f"retrieval.global_{d}", 0))
+    has_user_index = app.load_vectorstore_for_user(user) is not None
+    speculative = after.get("retrieval.global_speculative", 0) > before.get("retrieval.global_speculative", 0)
+    return docs, {"embeddings": 1, "searches": has_user_index + (speculative or decision != "skipped"),
+                  "decision": decision}
+
+
+def evaluate(label, retrieve, questions):
+    found, recall, latencies, embeddings, searches = 0, [], [], 0, 0
+    decisions = dict.fromkeys(DECISIONS, 0)
+    for q in questions:
+        start = time.perf_counter()
+        docs, work = retrieve(q["user"], q["question"])
+        latencies.append(time.perf_counter() - start)
+        relevant_docs = [doc for doc in docs if is_relevant(doc, q["relevant"])]
+        found += bool(relevant_docs)
+        matched = sum(1 for item in q["relevant"] if any(is_relevant(doc, [item]) for doc in docs))
+        recall.append(matched / len(q["relevant"]))
+        embeddings += work["embeddings"]
+        searches += work["searches"]
+        if "decision" in work:
+            decisions[work["decision"]] += 1
+    n = len(questions)
+    latencies.sort()
+    spread = " ".join(f"{d}={decisions[d]}" for d in DECISIONS) if sum(decisions.values()) else ""
+    print(f"{label:>16} {found / n:>7.3f} {statistics.mean(recall):>7.3f} {embeddings / n:>6.2f} {searches / n:>6.2f} "
+          f"{1000 * statistics.mean(latencies):>8.1f} {1000 * latencies[int(0.95 * (n - 1))]:>8.1f}  {spread}")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))] if values else float("nan")
+
+
+def distribution(values):
+    return {"n": len(values), **{f"p{int(100 * p)}": round(percentile(values, p), 4)
+                                 for p in (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95)}}
+
+
+def strong_threshold(hits, precision):
+    """Lowest score t such that at least `precision` of the (score, relevant) hits scoring >= t are relevant"""
+    best, relevant = None, 0
+    for count, (score, is_rel) in enumerate(sorted(hits, reverse=True), start=1):
+        relevant += is_rel
+        if relevant / count >= precision:
+            best = score
+    return best
+
+
+def calibrate(questions, precision):
+    """Score distributions of both indexes' hits, and thresholds read off them"""
+    scores = {"user_relevant": [], "user_other": [], "global_relevant": [], "global_other": [],
+              "best_user_answered": [], "best_user_unanswered": []}
+    user_hits = []
+    for q in questions:
+        query_vector = app.embeddings.embed_query(q["question"])
+        norm_sq = float(np.dot(query_vector, query_vector))
+        for name, found in (("user", app.search_user_source(q["user"], query_vector, app.RETRIEVAL_USER_K)),
+                            ("global", app.search_global_source(query_vector, app.RETRIEVAL_GLOBAL_WIDE_K))):
+            scored = [(app.relevance(distance, norm_sq), is_relevant(doc, q["relevant"])) for doc, distance in found]
+            for score, is_rel in scored:
+                scores[f"{name}_{'relevant' if is_rel else 'other'}"].append(score)
+            if name == "user" and scored:
+                user_hits.extend(scored)
+                answered = any(is_rel for _, is_rel in scored)
+                scores[f"best_user_{'answered' if answered else 'unanswered'}"].append(max(s for s, _ in scored))
+    strong = strong_threshold(user_hits, precision)
+    weak = percentile(scores["best_user_answered"], 1 - precision) if scores["best_user_answered"] else None
+    return {"model": app.embeddings.model_name, "questions": len(questions), "precision": precision,
+            "distributions": {name: distribution(values) for name, values in scores.items()},
+            "suggested": {"RETRIEVAL_STRONG_RELEVANCE": strong, "RETRIEVAL_WEAK_RELEVANCE": weak}}
+
+
+def print_calibration(result):
+    print(f"{'relevance':>22} {'n':>5} " + " ".join(f"{p:>7}" for p in ("p5", "p10", "p25", "p50", "p75", "p90", "p95")))
+    for name, dist in result["distributions"].items():
+        print(f"{name:>22} {dist['n']:>5} " + " ".join(f"{dist[p]:>7.3f}" for p in ("p5", "p10", "p25", "p50", "p75", "p90", "p95")))
+    for name, value in result["suggested"].items():
+        print(f"{name}={'' if value is None else f'{value:.2f}'}"
+              + ("" if value is not None else "  # not enough labelled hits to suggest one"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="labelled question set (JSON lines)")
+    parser.add_argument("--synthesize", type=int, default=0, help="build N questions from the indexes instead")
+    parser.add_argument("--user", action="append", default=[], help="user whose index to sample (repeatable)")
+    parser.add_argument("--sweep", type=float, nargs="*", default=[], help="strong-relevance thresholds to try")
+    parser.add_argument("--calibrate", action="store_true", help="measure score distributions and suggest thresholds")
+    parser.add_argument("--precision", type=float, default=0.9, help="share of strong user hits that must be relevant")
+    parser.add_argument("--output", help="also write the --calibrate results here (JSON)")
+    args = parser.parse_args()
+
+    if args.questions:
+        questions = load_questions(args.questions)
+    elif args.synthesize and args.user:
+        questions = synthesize(args.user, args.synthesize)
+    else:
+        parser.error("pass --questions, or --synthesize N with at least one --user")
+    if not questions:
+        parser.error("no questions to evaluate")
+
+    print(f"{len(questions)} questions")
+    if args.calibrate:
+        result = calibrate(questions, args.precision)
+        print_calibration(result)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+        return
+    print(f"{'policy':>16} {'hit@5':>7} {'recall':>7} {'embed':>6} {'search':>6} {'mean ms':>8} {'p95 ms':>8}  global search")
+    evaluate("fixed", fixed_retrieval, questions)
+    evaluate(f"adaptive {app.RETRIEVAL_STRONG_RELEVANCE:.2f}", adaptive_retrieval, questions)
+    for threshold in args.sweep:
+        app.RETRIEVAL_STRONG_RELEVANCE = threshold
+        evaluate(f"adaptive {threshold:.2f}", adaptive_retrieval, questions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Resumable chunked uploads.
+
+Clients start an upload with the total size, PUT numbered parts (in any order,
+retrying any that fail), then complete it. Each part is streamed from the
+request body straight into the storage provider's staging file at its offset,
+so nothing is spooled in memory and a dropped connection only costs one part.
+
+Upload state lives on disk (one manifest plus one marker file per received
+part) so that any gunicorn worker can accept the next part or the completion.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import datetime
+from typing import BinaryIO, Dict, List, Optional
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class ChunkedUploadError(ValueError):
+    """Raised when an upload request is invalid; carries the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkedUploadManager:
+    """Tracks in-progress chunked uploads and writes their parts into staging files"""
+
+    def __init__(self, state_dir: str = "uploads", max_upload_bytes: int = 500 * 1024 * 1024,
+                 default_part_size: int = 8 * 1024 * 1024, max_part_size: int = 64 * 1024 * 1024,
+                 expiry_hours: int = 24):
+        self.state_dir = state_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.default_part_size = default_part_size
+        self.max_part_size = max_part_size
+        self.expiry_hours = expiry_hours
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _upload_dir(self, upload_id: str) -> str:
+        # Upload ids are server-generated UUIDs; reject anything else before touching the filesystem
+        try:
+            upload_id = str(uuid.UUID(upload_id))
+        except (ValueError, TypeError):
+            raise ChunkedUploadError("Upload not found", 404)
+        return os.path.join(self.state_dir, upload_id)
+
+    def _write_json(self, path: str, data: Dict):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def new_upload_id(self) -> str:
+        """Generate an id for a new upload"""
+        return str(uuid.uuid4())
+
+    def create(self, user: str, upload_id: str, filename: str, size: int, staging_path: str,
+               part_size: Optional[int] = None) -> Dict:
+        """Register a new upload and preallocate its staging file"""
+        if size <= 0:
+            raise ChunkedUploadError("Upload size must be positive")
+        if size > self.max_upload_bytes:
+            raise ChunkedUploadError(
+                f"File exceeds the maximum upload size of {self.max_upload_bytes // (1024 * 1024)} MB", 413)
+        part_size = part_size or self.default_part_size
+        if part_size < READ_BLOCK_SIZE or part_size > self.max_part_size:
+            raise ChunkedUploadError(
+                f"Part size must be between {READ_BLOCK_SIZE} and {self.max_part_size} bytes")
+
+        self.cleanup_expired()
+
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(os.path.join(upload_dir, "parts"), exist_ok=True)
+
+        # Sparse preallocation: parts are written in place at their offsets
+        with open(staging_path, "wb") as f:
+            f.truncate(size)
+
+        manifest = {
+            "upload_id": upload_id,
+            "user": user,
+            "filename": filename,
+            "size": size,
+            "part_size": part_size,
+            "total_parts": (size + part_size - 1) // part_size,
+            "staging_path": staging_path,
+            "created_at": datetime.datetime.now().isoformat()
+        }
+        self._write_json(os.path.join(upload_dir, "manifest.json"), manifest)
+        print(f"[ChunkedUpload] Started {upload_id} for {user}: {filename} ({size} bytes, {manifest['total_parts']} parts)")
+        return manifest
+
+    def get(self, upload_id: str, user: str) -> Dict:
+        """Load an upload's manifest, checking that it belongs to the user"""
+        manifest_path = os.path.join(self._upload_dir(upload_id), "manifest.json")
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            raise ChunkedUploadError("Upload not found", 404)
+        if manifest.get("user") != user:
+            raise ChunkedUploadError("Upload not found", 404)
+        return manifest
+
+    def received_parts(self, upload_id: str) -> List[int]:
+        """Get the sorted part numbers that have been received and verified"""
+        parts_dir = os.path.join(self._upload_dir(upload_id), "parts")
+        if not os.path.isdir(parts_dir):
+            return []
+        return sorted(int(name[:-5]) for name in os.listdir(parts_dir) if name.endswith(".json"))
+
+    def status(self, upload_id: str, user: str) -> Dict:
+        """Describe an upload so a client can resume it"""
+        manifest = self.get(upload_id, user)
+        received = self.received_parts(upload_id)
+        missing = [n for n in range(1, manifest["total_parts"] + 1) if n not in set(received)]
+        return {
+            "upload_id": upload_id,
+            "filename": manifest["filename"],
+            "size": manifest["size"],
+            "part_size": manifest["part_size"],
+            "total_parts": manifest["total_parts"],
+            "received_parts": received,
+            "missing_parts": missing
+        }
+
+    def write_part(self, upload_id: str, user: str, part_number: int, stream: BinaryIO,
+                   expected_sha256: Optional[str] = None) -> Dict:
+        """Stream one part into the staging file and record it once its size and checksum match"""
+        manifest = self.get(upload_id, user)
+        total_parts = manifest["total_parts"]
+        if part_number < 1 or part_number > total_parts:
+            raise ChunkedUploadError(f"Part number must be between 1 and {total_parts}")
+
+        offset = (part_number - 1) * manifest["part_size"]
+        expected_size = min(manifest["part_size"], manifest["size"] - offset)
+
+        # A re-sent part overwrites the old bytes, so it only counts again once it verifies
+        part_path = os.path.join(self._upload_dir(upload_id), "parts", f"{part_number}.json")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+        digest = hashlib.sha256()
+        written = 0
+        with open(manifest["staging_path"], "r+b") as f:
+            f.seek(offset)
+            while True:
+                block = stream.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if written > expected_size:
+                    raise ChunkedUploadError(f"Part {part_number} is larger than {expected_size} bytes")
+                digest.update(block)
+                f.write(block)
+
+        if written != expected_size:
+            raise ChunkedUploadError(f"Part {part_number} is incomplete: got {written} of {expected_size} bytes")
+        checksum = digest.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != checksum:
+            raise ChunkedUploadError(f"Checksum mismatch for part {part_number}", 422)
+
+        part_record = {"part_number": part_number, "size": written, "sha256": checksum}
+        self._write_json(part_path, part_record)
+        return part_record
+
+    def finish(self, upload_id: str, user: str) -> Dict:
+        """Check that every part has arrived; returns the manifest for the caller to commit"""
+        manifest = self.get(upload_id, user)
+        received = set(self.received_parts(upload_id))
+        missing = [n for n in range(1, manifest["total_parts"] + 1) if n not in received]
+        if missing:
+            raise ChunkedUploadError(f"Upload is missing {len(missing)} part(s): {missing[:20]}", 409)
+        return manifest
+
+    def discard(self, upload_id: str, remove_staging: bool = True):
+        """Forget an upload, optionally deleting its staging file"""
+        upload_dir = self._upload_dir(upload_id)
+        if remove_staging:
+            try:
+                with open(os.path.join(upload_dir, "manifest.json"), "r") as f:
+                    staging_path = json.load(f).get("staging_path")
+                if staging_path and os.path.exists(staging_path):
+                    os.remove(staging_path)
+            except (OSError, ValueError):
+                pass
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def cleanup_expired(self):
+        """Drop uploads that were started more than expiry_hours ago and never completed"""
+        cutoff = datetime.datetime.now() - datetime.timedelta(hours=self.expiry_hours)
+        for upload_id in os.listdir(self.state_dir):
+            manifest_path = os.path.join(self.state_dir, upload_id, "manifest.json")
+            try:
+                with open(manifest_path, "r") as f:
+                    created_at = datetime.datetime.fromisoformat(json.load(f)["created_at"])
+            except (OSError, ValueError, KeyError):
+                continue
+            if created_at < cutoff:
+                print(f"[ChunkedUpload] Removing expired upload {upload_id}")
+                self.discard(upload_id)
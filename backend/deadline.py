@@ -0,0 +1,41 @@
+"""
+Request deadlines.
+
+Each piece of a chat turn used to have its own fixed timeout, or none, so
+a turn could run well past any limit set at the proxy. A Deadline is
+created when a request arrives, from its route's budget (REQUEST_DEADLINES
+in app.py), and travels with the turn through retrieval, generation and
+persistence. Each stage asks how much time is left and scales itself down
+instead of overrunning: the global index search is skipped, the completion
+gets a shorter max_tokens and timeout, a streamed answer is cut short and
+kept as a partial answer, the history write moves off the request path.
+"""
+
+import math
+import time
+from typing import Optional
+
+
+class Deadline:
+    """A request's time budget, counted from when the Deadline is created; seconds=None or 0 means unbounded"""
+
+    def __init__(self, seconds: Optional[float] = None, route: Optional[str] = None):
+        self.seconds = seconds or None
+        self.route = route
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.seconds if self.seconds else math.inf
+
+    @property
+    def bounded(self) -> bool:
+        return self.seconds is not None
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Seconds left after keeping reserve seconds back for later stages; never negative, inf if unbounded"""
+        return max(0.0, self.expires_at - time.monotonic() - reserve)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Theta completions API.
+
+Answers POSTs with a canned reply so the backend can be exercised without an
+API key or network access. It speaks both request shapes the backend uses:
+
+  Theta       {"input": {"messages": [...], "stream": bool, ...}}
+              -> {"body": {"infer_requests": [{"output": {"message": {...}}}]}}
+  OpenAI      POST .../chat/completions {"messages": [...], "stream": bool}
+              -> {"choices": [{"message": {...}}]}
+
+With "stream": true the reply is sent as server-sent events, one word per
+chunk, ending with "data: [DONE]".
+
+Usage:
+    python dev_llm_server.py --port 8001 --delay 0.5 --token-delay 0.05
+    THETA_API_URL=http://127.0.0.1:8001/completions THETA_API_KEY=dev python app.py
+"""
+
+import json
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    options = None
+
+    def log_message(self, format, *args):
+        if not self.options.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # e.g. the losing request of a hedged pair, cancelled by the client
+            print("[StandInLLM] Client disconnected before the reply")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request_body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        if random.random() < self.options.fail_rate:
+            self._send_json(503, {"error": "simulated upstream failure"})
+            return
+
+        openai_style = self.path.rstrip("/").endswith("/chat/completions")
+        params = request_body if openai_style else request_body.get("input", {})
+        messages = params.get("messages", [])
+        question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        answer = f"{self.options.reply} You asked: {question.splitlines()[-1][:200] if question else '(nothing)'}"
+
+        delay = self.options.delay
+        if self.options.prefill_ms_per_1k:
+            # Rough prompt-processing cost: ~4 characters per token
+            input_tokens = sum(len(m.get("content") or "") for m in messages) / 4
+            delay += self.options.prefill_ms_per_1k / 1000 * input_tokens / 1000
+        if self.options.slow_rate and random.random() < self.options.slow_rate:
+            delay = self.options.slow_delay
+        time.sleep(delay)
+
+        if params.get("stream"):
+            self._stream(answer, openai_style)
+        elif openai_style:
+            self._send_json(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                               "finish_reason": "stop"}]})
+        else:
+            self._send_json(200, {"body": {"infer_requests": [
+                {"output": {"message": {"role": "assistant", "content": answer}}}
+            ]}})
+
+    def _stream(self, answer, openai_style):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ")
+        try:
+            for i, word in enumerate(words):
+                token = word if i == 0 else " " + word
+                self._write_chunk(f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': token}}]})}\n\n")
+                time.sleep(self.options.token_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            print("[StandInLLM] Client disconnected mid-stream")
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # load tests open hundreds of connections at once
+
+
+def make_server(host="127.0.0.1", port=8001, **overrides):
+    """Build a stand-in server (call serve_forever() on it); keyword args override CLI defaults"""
+    options = build_parser().parse_args([])
+    for key, value in overrides.items():
+        setattr(options, key, value)
+    handler = type("ConfiguredHandler", (StandInLLMHandler,), {"options": options})
+    return StandInServer((host, port), handler)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds before the first byte of a reply")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="seconds between streamed tokens")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0,
+                        help="extra delay per 1000 input tokens, to model prompt-size dependent latency")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that take --slow-delay")
+    parser.add_argument("--slow-delay", type=float, default=10.0)
+    parser.add_argument("--reply", default="This is a stand-in answer from the local LLM server.")
+    parser.add_argument("--quiet", action="store_true")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    server = make_server(**vars(args))
+    print(f"[StandInLLM] Listening on http://{args.host}:{args.port}")
+    server.serve_forever()
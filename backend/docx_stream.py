@@ -0,0 +1,113 @@
+"""
+Streaming DOCX text extraction.
+
+Instead of building python-docx's full object model, word/document.xml is
+read straight from the zip with lxml's iterparse. Paragraphs and table rows
+are yielded in document order and each finished element is cleared, so
+memory stays flat however long the document is.
+"""
+
+import zipfile
+from typing import Iterable, Iterator, List
+
+from lxml import etree
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P = W_NS + "p"
+W_T = W_NS + "t"
+W_TAB = W_NS + "tab"
+W_BR = W_NS + "br"
+W_CR = W_NS + "cr"
+W_TBL = W_NS + "tbl"
+W_TR = W_NS + "tr"
+W_TC = W_NS + "tc"
+
+
+def _paragraph_text(p) -> str:
+    parts = []
+    for node in p.iter(W_T, W_TAB, W_BR, W_CR):
+        if node.tag == W_T:
+            parts.append(node.text or "")
+        elif node.tag == W_TAB:
+            parts.append("\t")
+        else:
+            parts.append("\n")
+    return "".join(parts).strip()
+
+
+def _row_text(tr) -> str:
+    cells = []
+    for tc in tr.iterchildren(W_TC):
+        # Nested tables inside a cell are flattened into the cell's text
+        text = " ".join(t for t in (_paragraph_text(p) for p in tc.iter(W_P)) if t)
+        cells.append(text)
+    return " | ".join(cells) if any(cells) else ""
+
+
+def _release(elem):
+    """Free an element and the already-processed siblings before it"""
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def iter_docx_blocks(path: str) -> Iterator[str]:
+    """Yield the text of each body paragraph and table row of a .docx, in document order.
+
+    Table rows come out as ``cell | cell | cell``. A corrupt document raises
+    (lxml.etree.XMLSyntaxError) where the damage is, after the blocks before
+    it have been yielded, so callers must not keep what they consumed from a
+    stream that failed (see index_documents_incrementally in app.py).
+    """
+    with zipfile.ZipFile(path) as zf, zf.open("word/document.xml") as xml:
+        table_depth = 0
+        for event, elem in etree.iterparse(xml, events=("start", "end"), tag=(W_P, W_TBL, W_TR)):
+            if elem.tag == W_TBL:
+                if event == "start":
+                    table_depth += 1
+                else:
+                    table_depth -= 1
+                    if table_depth == 0:
+                        _release(elem)
+            elif event != "end":
+                continue
+            elif elem.tag == W_TR and table_depth == 1:
+                text = _row_text(elem)
+                if text:
+                    yield text
+                elem.clear()
+            elif elem.tag == W_P and table_depth == 0:
+                text = _paragraph_text(elem)
+                if text:
+                    yield text
+                _release(elem)
+
+
+def iter_text_chunks(blocks: Iterable[str], splitter, flush_chars: int = 8000) -> Iterator[str]:
+    """Split a stream of text blocks into chunks without holding the whole text.
+
+    Blocks are buffered until roughly ``flush_chars`` accumulate, then the
+    buffer is split with ``splitter``. The blocks covering the splitter's
+    overlap are carried into the next buffer so chunks stay overlapping across
+    flush boundaries.
+    """
+    overlap = getattr(splitter, "_chunk_overlap", 0)
+    buffer: List[str] = []
+    buffer_len = 0
+    fresh = False
+    for block in blocks:
+        buffer.append(block)
+        buffer_len += len(block) + 1
+        fresh = True
+        if buffer_len >= flush_chars:
+            yield from splitter.split_text("\n".join(buffer))
+            carry = []
+            carry_len = 0
+            while buffer and carry_len + len(buffer[-1]) + 1 <= overlap:
+                carry.insert(0, buffer.pop())
+                carry_len += len(carry[0]) + 1
+            buffer, buffer_len, fresh = carry, carry_len, False
+    if fresh:
+        yield from splitter.split_text("\n".join(buffer))
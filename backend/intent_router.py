@@ -0,0 +1,220 @@
+"""
+Intent routing for chat messages.
+
+A good share of chat traffic is not a question at all: "thanks", "ok",
+"bye", a thumbs-up. Each of those used to pay for an embedding, two index
+searches and a 70B completion. IntentRouter sorts a message into one of:
+
+  greeting, thanks, acknowledgement, farewell, capabilities
+      answered from a template; no retrieval, no LLM
+  chitchat
+      ("how are you", "tell me a joke") answered by the LLM without
+      retrieval, since no document can help
+  question
+      everything else; the normal retrieval + LLM path
+
+Two stages, cheapest first:
+
+  1. rules: the normalized message (lowercase, punctuation and emoji
+     stripped) is looked up in small phrase lists; an emoji-only message
+     is an acknowledgement
+  2. for short messages the rules didn't settle, a nearest-prototype
+     classifier over the question's embedding. The embedding is the one
+     retrieval needs anyway, so it is handed back for reuse. Prototype
+     sets include ordinary questions, so a short real question stays a
+     question.
+
+Longer messages skip both stages and are always questions.
+"""
+
+import threading
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from metrics import metrics
+
+GREETING = "greeting"
+THANKS = "thanks"
+ACKNOWLEDGEMENT = "acknowledgement"
+FAREWELL = "farewell"
+CAPABILITIES = "capabilities"
+CHITCHAT = "chitchat"
+QUESTION = "question"
+
+TEMPLATES = {
+    GREETING: "Hi {name}! 👋 How can I assist you today?",
+    THANKS: "You're welcome, {name}! 😊 Let me know if there's anything else you'd like to go over.",
+    ACKNOWLEDGEMENT: "👍 Anything else you'd like to go over?",
+    FAREWELL: "Goodbye, {name}! 👋 Good luck with your studies.",
+    CAPABILITIES: ("I'm your study assistant. I can answer questions about the documents, images and recordings "
+                   "you upload, explain topics in general, and reply in English, Tamil or Arabic. Just ask!")
+}
+
+RULES = {
+    GREETING: {"hi", "hello", "hey", "hi there", "hello there", "hey there", "hiya", "good morning",
+               "good afternoon", "good evening", "salam", "assalamu alaikum", "vanakkam", "வணக்கம்",
+               "السلام عليكم", "مرحبا"},
+    THANKS: {"thanks", "thank you", "thx", "ty", "thank you so much", "thanks so much", "thanks a lot",
+             "many thanks", "thank u", "cheers", "ok thanks", "ok thank you", "shukran", "nandri", "நன்றி",
+             "شكرا"},
+    ACKNOWLEDGEMENT: {"ok", "okay", "k", "kk", "got it", "i see", "cool", "nice", "great", "alright",
+                      "understood", "makes sense", "perfect", "awesome", "ok got it"},
+    FAREWELL: {"bye", "goodbye", "bye bye", "see you", "see you later", "see ya", "good night", "cya",
+               "talk later", "thanks bye", "ok bye"},
+    CAPABILITIES: {"help", "what can you do", "who are you", "what are you"},
+    CHITCHAT: {"how are you", "how are you doing", "whats up", "how is it going", "hows it going",
+               "tell me a joke"}
+}
+
+# Examples for the embedding classifier, on top of the rule phrases
+PROTOTYPES = {
+    GREETING: ["hello, nice to meet you", "hey, good to see you", "hi, I'm back"],
+    THANKS: ["thanks, that was really helpful", "thank you very much", "appreciate it", "that helped, thanks"],
+    ACKNOWLEDGEMENT: ["okay, that makes sense", "alright, understood", "oh I get it now", "fine"],
+    FAREWELL: ["I have to go now", "bye, see you tomorrow", "that's all for today"],
+    CAPABILITIES: ["what are you able to help with", "how do I use you", "what kinds of questions can I ask"],
+    CHITCHAT: ["how is your day", "are you a robot", "do you like music", "what's your favourite colour"],
+    QUESTION: ["what is photosynthesis", "explain chapter two", "summarize my notes", "define osmosis",
+               "what does the lecture say about gravity", "solve this equation", "why is the sky blue",
+               "what is on page 5", "give me an example", "can you explain that again", "what about mitosis",
+               "tell me more", "yes please", "no"]
+}
+
+NO_RETRIEVAL = {CHITCHAT}
+
+
+def _is_mark(c: str) -> bool:
+    return unicodedata.category(c)[0] == "M"
+
+
+def normalize(message: str) -> str:
+    """Lowercase, drop punctuation and emoji, collapse whitespace.
+
+    Combining marks (Mn/Mc/Me) that follow a letter are kept: Tamil vowel signs and viramas
+    and Arabic harakat are part of the word. A mark on anything else, such as the variation
+    selector after an emoji, goes with it.
+    """
+    chars = []
+    for c in message.lower():
+        if c == "'":
+            continue
+        if _is_mark(c):
+            attached = chars and (chars[-1].isalnum() or _is_mark(chars[-1]))
+            chars.append(c if attached else " ")
+        else:
+            chars.append(c if c.isalnum() or c == "_" or c.isspace() else " ")
+    return " ".join("".join(chars).split())
+
+
+def is_emoji_only(message: str) -> bool:
+    """True for messages made only of symbols such as emoji (and spaces), e.g. "👍" or "🙏🙏" """
+    chars = [c for c in message if not c.isspace()]
+    return bool(chars) and all(unicodedata.category(c) in ("So", "Sk", "Cf", "Mn") for c in chars) \
+        and any(unicodedata.category(c) == "So" for c in chars)
+
+
+class Route:
+    """Where a message goes: a template reply, the LLM without retrieval, or the full path"""
+    __slots__ = ("intent", "source", "score", "query_vector")
+
+    def __init__(self, intent, source=None, score=None, query_vector=None):
+        self.intent = intent
+        self.source = source  # "rule", "embedding" or None
+        self.score = score
+        self.query_vector = query_vector  # embedding of the message if the classifier computed one
+
+    @property
+    def templated(self) -> bool:
+        return self.intent in TEMPLATES
+
+    @property
+    def needs_retrieval(self) -> bool:
+        return self.intent not in TEMPLATES and self.intent not in NO_RETRIEVAL
+
+    def reply(self, name: str) -> str:
+        return TEMPLATES[self.intent].format(name=name)
+
+
+class IntentRouter:
+    def __init__(self, embed_query: Optional[Callable[[str], List[float]]] = None,
+                 embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 threshold: float = 0.8, max_words: int = 6):
+        self.embed_query = embed_query
+        self.embed_documents = embed_documents
+        self.threshold = threshold
+        self.max_words = max_words
+        self._prototype_vectors = None
+        self._prototype_intents = None
+        self._prototype_lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def _prototypes(self):
+        """Unit-length prototype embeddings and their intents, embedded once on first use"""
+        with self._prototype_lock:
+            if self._prototype_vectors is None:
+                texts, intents = [], []
+                for intent in PROTOTYPES:
+                    for text in sorted(RULES.get(intent, ())) + PROTOTYPES[intent]:
+                        texts.append(text)
+                        intents.append(intent)
+                vectors = np.asarray(self.embed_documents(texts), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                self._prototype_vectors, self._prototype_intents = vectors, intents
+            return self._prototype_vectors, self._prototype_intents
+
+    def _classify(self, message: str) -> Route:
+        normalized = normalize(message)
+        if not normalized:
+            return Route(ACKNOWLEDGEMENT, "rule") if is_emoji_only(message) else Route(QUESTION)
+        for intent, phrases in RULES.items():
+            if normalized in phrases:
+                return Route(intent, "rule")
+        if self.embed_query is None or len(normalized.split()) > self.max_words:
+            return Route(QUESTION)
+        query_vector = self.embed_query(message)
+        vectors, intents = self._prototypes()
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = vectors @ (query / (np.linalg.norm(query) or 1.0))
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if intents[best] == QUESTION or score < self.threshold:
+            return Route(QUESTION, score=score, query_vector=query_vector)
+        return Route(intents[best], "embedding", score, query_vector)
+
+    def classify(self, message: str) -> Route:
+        try:
+            route = self._classify(message)
+        except Exception as e:
+            # Never let routing break a turn: fall back to the full path
+            print(f"[IntentRouter] Classification failed: {e}")
+            route = Route(QUESTION)
+        with self._lock:
+            self.total += 1
+            self.counts[route.intent] = self.counts.get(route.intent, 0) + 1
+        metrics.incr("intent.messages")
+        metrics.incr(f"intent.{route.intent}")
+        if route.source:
+            metrics.incr(f"intent.{route.source}_hits")
+        if route.templated:
+            metrics.incr("intent.absorbed")
+        elif not route.needs_retrieval:
+            metrics.incr("intent.retrieval_skipped")
+        return route
+
+    def stats(self):
+        with self._lock:
+            total = self.total
+            counts = dict(self.counts)
+        absorbed = sum(n for intent, n in counts.items() if intent in TEMPLATES)
+        skipped = sum(n for intent, n in counts.items() if intent in NO_RETRIEVAL)
+        return {
+            "messages": total,
+            "by_intent": counts,
+            "absorbed_share": round(absorbed / total, 3) if total else 0.0,  # no retrieval, no LLM
+            "retrieval_skipped_share": round((absorbed + skipped) / total, 3) if total else 0.0,
+            "threshold": self.threshold
+        }
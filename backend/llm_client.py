@@ -0,0 +1,872 @@
+"""
+Theta API LLM client (LLaMA 3 70B).
+
+A client routes over one or more backends (LLMBackend): Theta endpoints
+and OpenAI-compatible /chat/completions servers. Each request goes to the
+healthy backend with the least expected wait (requests outstanding times
+recent latency); a backend that errors is failed over from immediately and,
+if it keeps erroring, its own circuit breaker takes it out of rotation.
+
+All calls go through one pooled requests.Session, so connections are kept
+alive and reused instead of paying a TCP+TLS handshake per turn. Transient
+upstream failures (connections that could not be opened, 429 and 5xx) are retried with jittered
+exponential backoff, and a circuit breaker fails fast while the upstream is
+erroring so worker threads are not all parked on a dead endpoint.
+
+AsyncThetaLLM is the asyncio twin used by the ASGI chat routes (see asgi.py):
+same payloads, retry policy and breaker, but on an httpx.AsyncClient so a
+request waiting on the model holds no thread at all.
+
+Both clients take an optional PromptCache (prompt_cache.py): a prompt that
+was already answered, with the same sampling parameters, is served from disk.
+
+Both can also hedge non-streamed completions (HedgePolicy): if no answer has
+arrived after a high percentile of recent latencies, a second identical
+request is sent, optionally to another endpoint, and the first answer wins.
+A budget caps how many extra upstream calls hedging may add.
+
+invoke() and stream() take an optional per-call timeout and max_tokens, so
+a caller working to a request deadline (deadline.py) can shrink both: the
+timeout bounds the whole call, retries and backoff included.
+"""
+
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from metrics import metrics, LatencyHistogram
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+DEFAULT_BACKEND_LATENCY = 1.0  # seconds assumed for a backend with no measured latency yet
+ERROR_LATENCY_PENALTY = 5.0  # seconds a failed attempt counts as in a backend's latency average
+
+UNAVAILABLE_MESSAGE = "⚠️ The AI service is temporarily unavailable. Please try again in a moment."
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit breaker is open"""
+
+
+def failed_to_connect(error: requests.exceptions.ConnectionError) -> bool:
+    """Whether a requests ConnectionError happened before the request was sent.
+
+    Only then (connect timeout, refused or unresolvable host) is it safe to resend. A connection
+    reset or closed after the request went out (RemoteDisconnected, ProtocolError) may have left
+    the model generating, and a resend would pay for the completion twice.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # requests wraps urllib3's MaxRetryError, whose reason is the underlying failure;
+    # NewConnectionError (refused, DNS) is a ConnectTimeoutError subclass
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class CircuitBreaker:
+    """Opens when the recent error rate crosses a threshold, then lets one trial request
+    through after a cooldown to decide whether to close again."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_ratio=0.5, min_requests=10, window_seconds=30.0, cooldown_seconds=15.0):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (timestamp, succeeded)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def available(self) -> bool:
+        """Whether allow_request() would let a request through now, without claiming the half-open trial"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at >= self.cooldown_seconds
+            return not self._trial_in_flight
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                print("[CircuitBreaker] Trial request succeeded, closing circuit")
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_ratio:
+                self._open(now)
+
+    def release_trial(self):
+        """The request let through as the half-open trial ended without an outcome (it was cancelled);
+        the next request becomes the trial instead"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open(self, now):
+        print(f"[CircuitBreaker] Opening circuit for {self.cooldown_seconds}s")
+        metrics.incr("llm.circuit_opened")
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+
+
+class HedgePolicy:
+    """When to send a backup request for a slow completion, and how many extra calls that may cost.
+
+    The hedge delay is the given percentile of recent completion latencies, clamped to
+    [min_delay, max_delay] (max_delay until min_samples are in). Every request earns
+    budget_ratio of a hedge, banked up to max_burst, so hedges add at most about
+    budget_ratio extra upstream calls on top of normal traffic.
+    """
+
+    def __init__(self, percentile=95.0, min_delay=1.0, max_delay=10.0, budget_ratio=0.1, max_burst=5.0,
+                 min_samples=20, url=None, kind="theta", model=None, api_key=None):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.max_burst = max_burst
+        self.min_samples = min_samples
+        self.url = url  # secondary endpoint for hedges; None routes them like any other request
+        self.kind = kind  # url's API shape, as in LLMBackend
+        self.model = model
+        self.api_key = api_key  # None: the client's own key
+        self.backend = None  # LLMBackend for url, created by the first client using this policy
+        self.latencies = LatencyHistogram(max_samples=512)
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.skipped_for_budget = 0
+        self._tokens = max_burst
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latencies.observe(seconds)
+
+    def delay(self) -> float:
+        with self._lock:
+            self._tokens = min(self.max_burst, self._tokens + self.budget_ratio)
+            if len(self.latencies.samples) < self.min_samples:
+                return self.max_delay
+            return min(self.max_delay, max(self.min_delay, self.latencies.percentile(self.percentile)))
+
+    def try_hedge(self) -> bool:
+        """Spend one hedge from the budget; False (and counted) if the budget is used up"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.hedges_sent += 1
+                metrics.incr("llm.hedges_sent")
+                return True
+            self.skipped_for_budget += 1
+        metrics.incr("llm.hedges_skipped_budget")
+        return False
+
+    def record_win(self, hedged):
+        if hedged:
+            with self._lock:
+                self.hedge_wins += 1
+            metrics.incr("llm.hedge_wins")
+
+    def stats(self):
+        with self._lock:
+            samples = len(self.latencies.samples)
+            delay = self.max_delay if samples < self.min_samples else \
+                min(self.max_delay, max(self.min_delay, self.latencies.percentile(self.percentile)))
+            return {
+                "delay_seconds": round(delay, 2),
+                "hedges_sent": self.hedges_sent,
+                "hedge_wins": self.hedge_wins,
+                "skipped_for_budget": self.skipped_for_budget,
+                "budget_available": round(self._tokens, 2)
+            }
+
+
+def extract_stream_token(chunk):
+    """Pull the text delta out of one streamed chunk (OpenAI-style or Theta's infer_requests shape)"""
+    if "choices" in chunk and chunk["choices"]:
+        choice = chunk["choices"][0]
+        delta = choice.get("delta") or {}
+        return delta.get("content") or choice.get("text") or ""
+    try:
+        message = chunk["body"]["infer_requests"][0]["output"]["message"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return message or ""
+
+
+class LLMBackend:
+    """One upstream completions endpoint: a Theta infer URL or an OpenAI-compatible /chat/completions URL.
+
+    Keeps what routing needs to know about it: requests outstanding, a moving average of
+    response latency (time to the response head for streams, the whole completion otherwise)
+    and its own circuit breaker.
+    """
+
+    THETA = "theta"
+    OPENAI = "openai"
+
+    def __init__(self, url, api_key, kind=THETA, model=None, name=None, breaker=None):
+        if kind not in (self.THETA, self.OPENAI):
+            raise ValueError(f"Unknown LLM backend kind: {kind}")
+        self.url = url
+        self.kind = kind
+        self.model = model
+        self.name = name or url
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.breaker = breaker or CircuitBreaker()
+        self.outstanding = 0
+        self.latency = None  # EWMA seconds; None until the first success
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def payload(self, messages, stream, sampling):
+        params = {"messages": messages, **sampling, "stream": stream}
+        if self.kind == self.OPENAI:
+            if self.model:
+                params["model"] = self.model
+            return params
+        return {"input": params}
+
+    def message_text(self, data):
+        """Pull the assistant's text out of a non-streamed completion response"""
+        if self.kind == self.OPENAI:
+            return data["choices"][0]["message"].get("content") or ""
+        assistant_msg = data["body"]["infer_requests"][0]["output"]["message"]
+        if isinstance(assistant_msg, dict):
+            return assistant_msg.get("content", "")
+        return assistant_msg  # if it's already a string
+
+    def load(self) -> float:
+        """Expected wait if one more request is sent here; unmeasured backends look fast so they get tried"""
+        return (self.outstanding + 1) * (self.latency if self.latency is not None else DEFAULT_BACKEND_LATENCY)
+
+    def begin(self):
+        with self._lock:
+            self.outstanding += 1
+            self.requests += 1
+
+    def end(self):
+        with self._lock:
+            self.outstanding -= 1
+
+    def record(self, seconds=None):
+        """Account a finished attempt: its latency if it succeeded, an error otherwise.
+
+        Errors count as very slow responses, so a failing backend is routed around well
+        before its breaker opens.
+        """
+        with self._lock:
+            if seconds is None:
+                self.errors += 1
+                seconds = ERROR_LATENCY_PENALTY
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * seconds
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "circuit_state": self.breaker.state
+        }
+
+
+class _ThetaClientBase:
+    """Routing, request shape, response parsing and retry policy shared by the sync and async clients.
+
+    Requests go to the least loaded backend whose breaker lets them through. A connection
+    that can't be opened or a retryable status fails over to another backend straight away; once every
+    backend has failed the round is retried with backoff, up to max_retries times.
+    """
+
+    def __init__(self, api_key, url=None, temperature=0.5, top_p=0.7, max_tokens=500, timeout=30,
+                 max_retries=2, backoff_base=0.5, backoff_max=4.0, breaker=None, prompt_cache=None, hedge=None,
+                 backends=None):
+        # Either a list of backends to route over, or the single Theta endpoint at url
+        self.backends = list(backends) if backends else [LLMBackend(url, api_key, breaker=breaker)]
+        self.url = self.backends[0].url
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.prompt_cache = prompt_cache
+        self.hedge = hedge
+        if hedge is not None and hedge.url and hedge.backend is None:
+            hedge.backend = LLMBackend(hedge.url, hedge.api_key or api_key, kind=hedge.kind, model=hedge.model,
+                                       name="hedge")
+
+    @property
+    def breaker(self):
+        return self.backends[0].breaker
+
+    def _sampling(self, max_tokens=None):
+        return {"temperature": self.temperature, "top_p": self.top_p, "max_tokens": max_tokens or self.max_tokens}
+
+    def _attempt_timeout(self, expires):
+        """Timeout for one upstream attempt: the client's own, cut to what is left before expires"""
+        if expires is None:
+            return self.timeout
+        return min(self.timeout, expires - time.monotonic())
+
+    @staticmethod
+    def _backoff_fits(delay, expires):
+        """Whether sleeping delay seconds before a retry still leaves time for the retry"""
+        return expires is None or time.monotonic() + delay < expires
+
+    @staticmethod
+    def _expires(timeout):
+        return time.monotonic() + timeout if timeout is not None else None
+
+    def _choose(self, exclude=()):
+        """Least loaded backend not in exclude that accepts a request now, or None"""
+        refused = set(exclude)
+        while True:
+            candidates = [b for b in self.backends if b not in refused and b.breaker.available()]
+            if not candidates:
+                return None
+            backend = min(candidates, key=LLMBackend.load)
+            if backend.breaker.allow_request():
+                return backend
+            refused.add(backend)  # lost the half-open trial to another request
+
+    def _next_backend(self, tried, pinned):
+        """Backend for the next attempt; raises CircuitOpenError when none will take it"""
+        if pinned is not None:
+            backend = pinned if pinned.breaker.allow_request() else None
+        else:
+            backend = self._choose(tried) or self._choose()
+        if backend is None:
+            metrics.incr("llm.circuit_rejections")
+            raise CircuitOpenError("No LLM backend is accepting requests")
+        return backend
+
+    def _fail_over(self, backend, error, attempt, tried, pinned) -> bool:
+        """Book a retryable failure; True to try another backend now, False to back off and retry.
+
+        Raises the error once every backend has failed on the last attempt.
+        """
+        backend.breaker.record_failure()
+        backend.record()
+        metrics.incr("llm.errors")
+        tried.add(backend)
+        if pinned is None and any(b not in tried and b.breaker.available() for b in self.backends):
+            print(f"[LLM Router] {backend.name}: {error}; failing over")
+            metrics.incr("llm.failovers")
+            return True
+        if attempt >= self.max_retries:
+            raise error
+        tried.clear()
+        return False
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # Full jitter: spread retries out so workers don't hammer the upstream in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _cache_key(self, messages, max_tokens=None):
+        """Prompt cache key; streamed and non-streamed calls for the same prompt share it"""
+        if self.prompt_cache is None:
+            return None
+        # Keyed on the primary endpoint whichever backend answers, so routing doesn't split the cache
+        payload = {"input": {"messages": messages, **self._sampling(max_tokens), "stream": False}}
+        return self.prompt_cache.key_for(self.url, payload)
+
+    @staticmethod
+    def _sse_token(line):
+        """Token carried by one streamed SSE line; None once the stream says [DONE]"""
+        if not line or not line.startswith("data:"):
+            return ""
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+        try:
+            return extract_stream_token(json.loads(data))
+        except ValueError:
+            return ""
+
+    def _stats(self):
+        return {
+            "circuit_state": self.breaker.state,
+            "backends": [b.stats() for b in self.backends],
+            "hedge": self.hedge.stats() if self.hedge else None
+        }
+
+
+class ThetaLLM(_ThetaClientBase):
+    def __init__(self, api_key, url=None, pool_size=10, **kwargs):
+        super().__init__(api_key, url, **kwargs)
+
+        # Retries are handled here (with backoff and breaker accounting), not by urllib3
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=len(self.backends) + 1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        # Completions run here when hedging, so the caller can wait on two of them at once
+        self._hedge_pool = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="llm-hedge") if self.hedge else None
+
+    def _post(self, messages, stream=False, pinned=None, expires=None, max_tokens=None):
+        """POST to a backend with failover and retries; returns (response, backend) or raises.
+
+        expires (time.monotonic()) bounds every attempt and the backoff between them.
+        A streamed request stays outstanding on its backend until the caller calls backend.end().
+        """
+        attempt = 0
+        tried = set()
+        while True:
+            timeout = self._attempt_timeout(expires)
+            if timeout <= 0:
+                metrics.incr("llm.deadline_expired")
+                raise requests.exceptions.Timeout("Request deadline reached before the LLM answered")
+            backend = self._next_backend(tried, pinned)
+            metrics.incr("llm.requests")
+            backend.begin()
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self.session.post(backend.url, headers=backend.headers, stream=stream,
+                                             timeout=(min(10, timeout), timeout) if stream else timeout,
+                                             json=backend.payload(messages, stream, self._sampling(max_tokens)))
+                elapsed = time.perf_counter() - start
+                metrics.observe("llm.upstream_latency", elapsed)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    backend.breaker.record_success()
+                    backend.record(elapsed)
+                    if not stream:
+                        backend.end()
+                    return response, backend
+                error = requests.exceptions.HTTPError(f"{response.status_code} from {backend.name}", response=response)
+            except requests.exceptions.ConnectionError as e:
+                if not failed_to_connect(e):
+                    # Dropped after the request was sent: the model may have it, so don't resend
+                    backend.end()
+                    backend.breaker.record_failure()
+                    backend.record()
+                    metrics.incr("llm.errors")
+                    raise
+                # The request never reached the model, so it is always safe to resend
+                error = e
+            except requests.exceptions.HTTPError:
+                # Other 4xx: our request is wrong, the upstream is fine; retrying would not help
+                response.close()
+                backend.end()
+                backend.breaker.record_success()
+                metrics.incr("llm.errors")
+                raise
+            except requests.exceptions.RequestException:
+                # Read timeouts: retrying would double an already long wait
+                backend.end()
+                backend.breaker.record_failure()
+                backend.record()
+                metrics.incr("llm.errors")
+                raise
+            except BaseException:
+                # Interrupted: no verdict on the backend, but a half-open trial must not stay claimed
+                backend.end()
+                backend.breaker.release_trial()
+                raise
+
+            backend.end()
+            if response is not None:
+                response.close()
+            if self._fail_over(backend, error, attempt, tried, pinned):
+                continue
+            delay = self._backoff(attempt, response)
+            if not self._backoff_fits(delay, expires):
+                raise error
+            print(f"[Theta API] {error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            metrics.incr("llm.retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def _complete(self, messages, pinned=None, expires=None, max_tokens=None):
+        """One completion (with failover and retries); feeds the hedge policy's latency samples"""
+        start = time.perf_counter()
+        response, backend = self._post(messages, pinned=pinned, expires=expires, max_tokens=max_tokens)
+        answer = backend.message_text(response.json())
+        if self.hedge:
+            self.hedge.observe(time.perf_counter() - start)
+        return answer
+
+    def _hedged_complete(self, messages, expires=None, max_tokens=None):
+        """Completion that sends a backup request if the first is slower than the hedge delay"""
+        primary = self._hedge_pool.submit(self._complete, messages, None, expires, max_tokens)
+        done, _ = wait([primary], timeout=self.hedge.delay())
+        if done or not self.hedge.try_hedge():
+            return primary.result()
+        # Without a dedicated hedge endpoint the backup is routed, and the primary's backend now looks busier
+        backup = self._hedge_pool.submit(self._complete, messages, self.hedge.backend, expires, max_tokens)
+        pending, error = {primary, backup}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # A blocking requests call can't be interrupted; the loser finishes in the background
+                    for other in pending:
+                        other.cancel()
+                    self.hedge.record_win(future is backup)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def invoke(self, messages, timeout=None, max_tokens=None):
+        # messages: list of {"role": ..., "content": ...}; timeout bounds the whole call, retries included
+        cache_key = self._cache_key(messages, max_tokens)
+        if cache_key:
+            cached = self.prompt_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        start = time.perf_counter()
+        expires = self._expires(timeout)
+        try:
+            if self.hedge:
+                answer = self._hedged_complete(messages, expires, max_tokens)
+            else:
+                answer = self._complete(messages, expires=expires, max_tokens=max_tokens)
+        except CircuitOpenError:
+            return UNAVAILABLE_MESSAGE
+        except requests.exceptions.Timeout:
+            print("[Theta API Timeout] Request timed out")
+            return "⚠️ Request timed out. Please try again."
+        except Exception as e:
+            print(f"[Theta API Error] {e}")
+            return "⚠️ Error from Theta API"
+        metrics.observe("llm.invoke_latency", time.perf_counter() - start)
+        if cache_key and answer:
+            self.prompt_cache.put(cache_key, answer)
+        return answer
+
+    def stream(self, messages, timeout=None, max_tokens=None):
+        """Yield the completion piece by piece as the API streams it back; timeout bounds the wait for it to start"""
+        cache_key = self._cache_key(messages, max_tokens)
+        if cache_key:
+            cached = self.prompt_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        try:
+            response, backend = self._post(messages, stream=True, expires=self._expires(timeout), max_tokens=max_tokens)
+        except CircuitOpenError:
+            yield UNAVAILABLE_MESSAGE
+            return
+        except requests.exceptions.Timeout:
+            print("[Theta API Timeout] Request timed out")
+            yield "⚠️ Request timed out. Please try again."
+            return
+        except Exception as e:
+            print(f"[Theta API Error] {e}")
+            yield "⚠️ Error from Theta API"
+            return
+        parts = []
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                token = self._sse_token(line)
+                if token is None:
+                    break
+                if token:
+                    parts.append(token)
+                    yield token
+        except requests.exceptions.RequestException as e:
+            print(f"[Theta API Stream Error] {e}")
+            yield " ⚠️ The response was interrupted."
+        else:
+            # Only a stream read to the end is cached; a consumer that stops early never gets here
+            if cache_key and parts:
+                self.prompt_cache.put(cache_key, "".join(parts))
+        finally:
+            response.close()
+            backend.end()
+
+    def pool_stats(self):
+        """Connection reuse for the pooled session: requests sent vs. connections opened"""
+        opened = 0
+        sent = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        return {
+            "connections_opened": opened,
+            "requests_sent": sent,
+            "connection_reuse_ratio": round(1 - opened / sent, 3) if sent else 0.0,
+            **self._stats()
+        }
+
+
+class AsyncThetaLLM(_ThetaClientBase):
+    """Asyncio client for the Theta API with the same routing, retry, breaker and metrics behaviour as ThetaLLM.
+
+    The httpx client is created on first use so it binds to the event loop that serves requests.
+    """
+
+    def __init__(self, api_key, url=None, pool_size=200, **kwargs):
+        super().__init__(api_key, url, **kwargs)
+        self.pool_size = pool_size
+        self.in_flight = 0
+        self.requests_sent = 0
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                # Waiting for a free connection counts against the same budget as the request
+                timeout=httpx.Timeout(self.timeout, connect=10, pool=self.timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, messages, stream=False, pinned=None, expires=None, max_tokens=None):
+        """POST to a backend with failover and retries; returns (response, backend) or raises.
+
+        expires (time.monotonic()) bounds every attempt and the backoff between them.
+        When streaming the body is unread, and the request stays outstanding on its backend until
+        the caller calls backend.end().
+        """
+        client = self._get_client()
+        attempt = 0
+        tried = set()
+        while True:
+            timeout = self._attempt_timeout(expires)
+            if timeout <= 0:
+                metrics.incr("llm.deadline_expired")
+                raise httpx.TimeoutException("Request deadline reached before the LLM answered")
+            backend = self._next_backend(tried, pinned)
+            metrics.incr("llm.requests")
+            self.requests_sent += 1
+            backend.begin()
+            start = time.perf_counter()
+            response = None
+            try:
+                request = client.build_request("POST", backend.url, headers=backend.headers,
+                                               json=backend.payload(messages, stream, self._sampling(max_tokens)),
+                                               timeout=httpx.Timeout(timeout, connect=min(10, timeout), pool=timeout))
+                response = await client.send(request, stream=stream)
+                elapsed = time.perf_counter() - start
+                metrics.observe("llm.upstream_latency", elapsed)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    backend.breaker.record_success()
+                    backend.record(elapsed)
+                    if not stream:
+                        backend.end()
+                    return response, backend
+                error = httpx.HTTPStatusError(f"{response.status_code} from {backend.name}",
+                                              request=response.request, response=response)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # The request never reached the model, so it is always safe to resend
+                error = e
+            except httpx.HTTPStatusError:
+                # Other 4xx: our request is wrong, the upstream is fine; retrying would not help
+                await response.aclose()
+                backend.end()
+                backend.breaker.record_success()
+                metrics.incr("llm.errors")
+                raise
+            except httpx.HTTPError:
+                # Read and pool timeouts: retrying would double an already long wait
+                backend.end()
+                backend.breaker.record_failure()
+                backend.record()
+                metrics.incr("llm.errors")
+                raise
+            except BaseException:
+                # Cancelled (e.g. the losing half of a hedged pair, or a client that went away): no verdict
+                # on the backend, but a half-open trial must not stay claimed or the backend never recovers
+                backend.end()
+                backend.breaker.release_trial()
+                raise
+
+            backend.end()
+            if response is not None:
+                await response.aclose()
+            if self._fail_over(backend, error, attempt, tried, pinned):
+                continue
+            delay = self._backoff(attempt, response)
+            if not self._backoff_fits(delay, expires):
+                raise error
+            print(f"[Theta API] {error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            metrics.incr("llm.retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _complete(self, messages, pinned=None, expires=None, max_tokens=None):
+        start = time.perf_counter()
+        response, backend = await self._post(messages, pinned=pinned, expires=expires, max_tokens=max_tokens)
+        answer = backend.message_text(response.json())
+        if self.hedge:
+            self.hedge.observe(time.perf_counter() - start)
+        return answer
+
+    async def _hedged_complete(self, messages, expires=None, max_tokens=None):
+        primary = asyncio.ensure_future(self._complete(messages, None, expires, max_tokens))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge.delay())
+            if done or not self.hedge.try_hedge():
+                return await primary
+            backup = asyncio.ensure_future(self._complete(messages, self.hedge.backend, expires, max_tokens))
+            tasks.add(backup)
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge.record_win(task is backup)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # Cancelling the loser closes its connection, so the upstream stops working on it too
+            for task in tasks:
+                task.cancel()
+
+    async def invoke(self, messages, timeout=None, max_tokens=None):
+        cache_key = self._cache_key(messages, max_tokens)
+        if cache_key:
+            cached = await asyncio.to_thread(self.prompt_cache.get, cache_key)
+            if cached is not None:
+                return cached
+        self.in_flight += 1
+        metrics.set_gauge("llm.async_in_flight", self.in_flight)
+        start = time.perf_counter()
+        expires = self._expires(timeout)
+        try:
+            if self.hedge:
+                answer = await self._hedged_complete(messages, expires, max_tokens)
+            else:
+                answer = await self._complete(messages, expires=expires, max_tokens=max_tokens)
+        except CircuitOpenError:
+            return UNAVAILABLE_MESSAGE
+        except httpx.TimeoutException:
+            print("[Theta API Timeout] Request timed out")
+            return "⚠️ Request timed out. Please try again."
+        except Exception as e:
+            print(f"[Theta API Error] {e}")
+            return "⚠️ Error from Theta API"
+        finally:
+            self.in_flight -= 1
+            metrics.set_gauge("llm.async_in_flight", self.in_flight)
+        metrics.observe("llm.invoke_latency", time.perf_counter() - start)
+        if cache_key and answer:
+            await asyncio.to_thread(self.prompt_cache.put, cache_key, answer)
+        return answer
+
+    async def stream(self, messages, timeout=None, max_tokens=None):
+        """Async generator yielding the completion piece by piece; timeout bounds the wait for it to start"""
+        cache_key = self._cache_key(messages, max_tokens)
+        if cache_key:
+            cached = await asyncio.to_thread(self.prompt_cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+        self.in_flight += 1
+        metrics.set_gauge("llm.async_in_flight", self.in_flight)
+        try:
+            try:
+                response, backend = await self._post(messages, stream=True, expires=self._expires(timeout),
+                                                     max_tokens=max_tokens)
+            except CircuitOpenError:
+                yield UNAVAILABLE_MESSAGE
+                return
+            except httpx.TimeoutException:
+                print("[Theta API Timeout] Request timed out")
+                yield "⚠️ Request timed out. Please try again."
+                return
+            except Exception as e:
+                print(f"[Theta API Error] {e}")
+                yield "⚠️ Error from Theta API"
+                return
+            parts = []
+            try:
+                async for line in response.aiter_lines():
+                    token = self._sse_token(line)
+                    if token is None:
+                        break
+                    if token:
+                        parts.append(token)
+                        yield token
+            except httpx.HTTPError as e:
+                print(f"[Theta API Stream Error] {e}")
+                yield " ⚠️ The response was interrupted."
+            else:
+                if cache_key and parts:
+                    await asyncio.to_thread(self.prompt_cache.put, cache_key, "".join(parts))
+            finally:
+                await response.aclose()
+                backend.end()
+        finally:
+            self.in_flight -= 1
+            metrics.set_gauge("llm.async_in_flight", self.in_flight)
+
+    def pool_stats(self):
+        return {
+            "max_connections": self.pool_size,
+            "in_flight": self.in_flight,
+            "requests_sent": self.requests_sent,
+            **self._stats()
+        }
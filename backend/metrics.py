@@ -0,0 +1,94 @@
+"""
+In-process metrics: counters, gauges and latency histograms.
+
+Everything is kept in memory per worker and exposed as JSON by /api/metrics.
+Histograms keep a bounded reservoir of recent samples, so percentiles
+describe recent traffic rather than the whole process lifetime.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+
+class LatencyHistogram:
+    """Recent latency samples (seconds) with count, mean and percentiles"""
+
+    def __init__(self, max_samples: int = 2048):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def summary(self, percentiles: Iterable[float] = (50, 95, 99)) -> Dict:
+        result = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0
+        }
+        for p in percentiles:
+            result[f"p{int(p)}_ms"] = round(self.percentile(p) * 1000, 1)
+        return result
+
+
+class MetricsRegistry:
+    """Thread-safe registry of named counters, gauges and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def percentile(self, name: str, p: float) -> float:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            return histogram.percentile(p) if histogram else 0.0
+
+    @contextmanager
+    def timer(self, name: str):
+        """Record how long the with-block takes under the given histogram name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "latency": {name: h.summary() for name, h in self.histograms.items()}
+            }
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
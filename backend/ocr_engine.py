@@ -0,0 +1,209 @@
+"""
+OCR engine for uploaded images.
+
+Phone photos are cleaned up before Tesseract sees them: EXIF rotation is
+applied, the image is converted to grayscale, downscaled to the target DPI,
+deskewed and binarized. Work runs in a small process pool with a cap on how
+many images can be queued at once, so OCR neither blocks the upload thread's
+interpreter nor lets a burst of uploads swamp the machine.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageOps
+
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "eng+tam+ara")
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", str(OCR_MAX_WORKERS * 2)))
+
+# Phone photos carry no DPI, or a nominal 72/96 that says nothing about the page; for those,
+# assume the long side of the image spans a page
+ASSUMED_PAGE_LONG_SIDE_INCHES = 11.0
+NOMINAL_DPI_MAX = 96
+DESKEW_MAX_ANGLE = 10.0
+DESKEW_SAMPLE_SIZE = 800
+
+# Tesseract flags per language. LSTM engine everywhere; Arabic keeps word
+# spacing because right-to-left text otherwise comes back run together.
+LANGUAGE_CONFIGS = {
+    "eng": ["--oem 1", "--psm 3"],
+    "tam": ["--oem 1", "--psm 3"],
+    "ara": ["--oem 1", "--psm 3", "-c preserve_interword_spaces=1"],
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(OCR_MAX_CONCURRENCY)
+
+
+@lru_cache(maxsize=1)
+def installed_languages() -> Tuple[str, ...]:
+    """Languages the local Tesseract install has traineddata for"""
+    try:
+        return tuple(pytesseract.get_languages(config=""))
+    except Exception as e:
+        print(f"[OCR] Could not list Tesseract languages: {e}")
+        return ("eng",)
+
+
+@lru_cache(maxsize=32)
+def get_tesseract_config(lang: str = OCR_LANGUAGES) -> Tuple[str, str]:
+    """Resolve a language spec like 'eng+ara' to the installed subset and its Tesseract flags"""
+    available = installed_languages()
+    langs = [code for code in lang.split("+") if code in available] or ["eng"]
+    flags = []
+    for code in langs:
+        for flag in LANGUAGE_CONFIGS.get(code, ["--oem 1", "--psm 3"]):
+            if flag not in flags:
+                flags.append(flag)
+    return "+".join(langs), " ".join(flags)
+
+
+def _otsu_threshold(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = gray.size
+    cum_count = np.cumsum(hist)
+    cum_mean = np.cumsum(hist * np.arange(256))
+    mean_total = cum_mean[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean_total * cum_count - cum_mean * total) ** 2 / (cum_count * (total - cum_count))
+    # Empty classes give 0/0; a flat image has no split and falls back to mid-grey
+    between = np.nan_to_num(between, nan=-1.0, posinf=-1.0)
+    return int(np.argmax(between)) if between.max() > 0 else 128
+
+
+def _estimate_skew(gray: Image.Image) -> float:
+    """Find the small rotation that makes text lines most horizontal (projection profile)"""
+    sample = gray.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIZE, DESKEW_SAMPLE_SIZE))
+    arr = np.asarray(sample)
+    ink = Image.fromarray(((arr < _otsu_threshold(arr)) * 255).astype(np.uint8))
+
+    def score(angle):
+        rotated = np.asarray(ink.rotate(angle, resample=Image.NEAREST, expand=False))
+        return float(np.var(rotated.sum(axis=1)))
+
+    def best(angles):
+        # Smallest rotation first, so a page with no clear lines (ties everywhere) stays as it is
+        return max(sorted(angles, key=abs), key=score)
+
+    coarse = best(np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 0.1, 1.0))
+    return float(best(np.arange(max(-DESKEW_MAX_ANGLE, coarse - 1.0), min(DESKEW_MAX_ANGLE, coarse + 1.0) + 0.01, 0.2)))
+
+
+def preprocess_image(image: Image.Image, target_dpi: int = OCR_TARGET_DPI) -> Tuple[Image.Image, Dict]:
+    """Orient, grayscale, downscale, deskew and binarize an image for OCR"""
+    source_dpi = image.info.get("dpi", (None,))[0]
+    image = ImageOps.exif_transpose(image)
+    gray = image.convert("L")
+
+    if not source_dpi or source_dpi <= NOMINAL_DPI_MAX:
+        source_dpi = max(gray.size) / ASSUMED_PAGE_LONG_SIDE_INCHES
+    scale = target_dpi / float(source_dpi)
+    if scale < 1.0:
+        gray = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.LANCZOS)
+
+    angle = _estimate_skew(gray)
+    if abs(angle) >= 0.2:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    arr = np.asarray(gray)
+    binary = Image.fromarray(np.where(arr > _otsu_threshold(arr), 255, 0).astype(np.uint8))
+    return binary, {"skew_angle": round(angle, 2), "width": binary.width, "height": binary.height}
+
+
+def _ocr_file(path: str, lang: str) -> Dict:
+    """Preprocess and OCR one image file; runs inside a pool worker"""
+    start = time.perf_counter()
+    with Image.open(path) as image:
+        image.load()
+        prepared, info = preprocess_image(image)
+    preprocessed = time.perf_counter()
+
+    tess_lang, config = get_tesseract_config(lang)
+    data = pytesseract.image_to_data(prepared, lang=tess_lang, config=config, output_type=pytesseract.Output.DICT)
+    finished = time.perf_counter()
+
+    # Rebuild the text from word boxes, keeping line and paragraph breaks
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confidences.append(conf)
+    text_parts = []
+    previous_par = None
+    for (block, par, _), words in sorted(lines.items()):
+        if previous_par is not None and (block, par) != previous_par:
+            text_parts.append("")
+        text_parts.append(" ".join(words))
+        previous_par = (block, par)
+
+    return {
+        "text": "\n".join(text_parts),
+        "confidence": round(sum(confidences) / len(confidences), 1) if confidences else 0.0,
+        "lang": tess_lang,
+        "preprocess_ms": round((preprocessed - start) * 1000, 1),
+        "ocr_ms": round((finished - preprocessed) * 1000, 1),
+        **info
+    }
+
+
+def _pool_context():
+    """Start method for the workers: forkserver where available, else spawn, never a plain fork.
+
+    The pool is created lazily from inside the running web server, which by then has request
+    threads, the retrieval pool, HTTP client pools and torch threads. Forking it would copy
+    locks those threads hold into the child, where nothing ever releases them. The fork server
+    is a fresh single-threaded process that preloads only this module, so workers still start
+    quickly and never import the web app.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS, mp_context=_pool_context())
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def ocr_image(path: str, lang: str = OCR_LANGUAGES, timeout: Optional[float] = None) -> Dict:
+    """OCR one image in the worker pool; waits for a free slot if too many are queued"""
+    with _pool_slots:
+        try:
+            return _get_pool().submit(_ocr_file, path, lang).result(timeout=timeout)
+        except BrokenProcessPool:
+            print("[OCR] Worker pool broke, restarting it and running this image inline")
+            _reset_pool()
+            return _ocr_file(path, lang)
+
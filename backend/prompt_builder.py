@@ -0,0 +1,165 @@
+"""
+Token-budgeted prompt assembly.
+
+The chat prompt is made of fixed instructions, retrieved context chunks
+(best first) and recent chat history. PromptBudget counts tokens with
+tiktoken and packs as much of the context and history as fits into a
+fixed input budget:
+
+  - the instructions and the user's message are always included
+  - recent history gets at most a share of what's left: the session's
+    running summary (if any) first, then messages newest first; long
+    messages (typically earlier answers) are trimmed
+  - context chunks fill the rest in rank order; the last one that only
+    partly fits is trimmed, the ones after it are dropped
+
+summary_messages() builds the request that folds older turns into a
+session's running summary, so history can be carried as summary + recent
+messages instead of an ever longer transcript.
+
+Counts use the cl100k_base encoding. It is not Llama's tokenizer, but it
+is close enough for budgeting; if the encoding can't be loaded (e.g. no
+network to fetch it on first use) a 4-characters-per-token estimate is used.
+"""
+
+from functools import cached_property
+from typing import Dict, List, Sequence, Tuple
+
+import tiktoken
+
+ELLIPSIS = " …"
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators per chat message
+MIN_HISTORY_LINE_TOKENS = 16  # below this a trimmed history message says too little to be worth including
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a tutoring conversation between a student and a teacher assistant.\n"
+    "Merge the new messages into the existing summary. Keep the student's name, goals, the topics and questions "
+    "covered and the key facts or explanations given. Write at most 150 words of plain prose."
+)
+
+
+class PromptBudget:
+    def __init__(self, max_input_tokens: int = 3000, max_history_share: float = 0.35,
+                 max_history_message_tokens: int = 250, min_chunk_tokens: int = 64,
+                 encoding_name: str = "cl100k_base"):
+        self.max_input_tokens = max_input_tokens
+        self.max_history_share = max_history_share
+        self.max_history_message_tokens = max_history_message_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        self.encoding_name = encoding_name
+
+    @cached_property
+    def encoding(self):
+        try:
+            return tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            print(f"[PromptBudget] Could not load {self.encoding_name} ({e}); estimating 4 characters per token")
+            return None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the beginning of text within max_tokens, marking the cut"""
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(0, max_tokens - self.count(ELLIPSIS))
+        if self.encoding is None:
+            return text[:keep * 4].rstrip() + ELLIPSIS
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:keep]).rstrip() + ELLIPSIS
+
+    def _pack_history(self, history: Sequence[Dict], budget: int, summary: str = None) -> Tuple[List[str], int, int]:
+        """Newest-first packing of history lines after the summary; returns (lines oldest-first, tokens, trimmed count)"""
+        lines, used, trimmed = [], 0, 0
+        summary_line = None
+        if summary:
+            # The summary may take up to half the history budget; recent messages get the rest
+            summary_line = f"Summary of earlier conversation: {summary}"
+            if self.count(summary_line) > budget // 2:
+                summary_line = self.truncate(summary_line, budget // 2)
+                trimmed += 1
+            used += self.count(summary_line) + 1
+        for msg in reversed(history):
+            if msg.get("role") == "user":
+                line = f"User: {msg['content']}"
+            elif msg.get("role") == "assistant":
+                line = f"Assistant: {msg['content']}"
+            else:
+                continue
+            limit = min(self.max_history_message_tokens, budget - used - 1)
+            if limit < MIN_HISTORY_LINE_TOKENS:
+                break
+            if self.count(line) > limit:
+                line = self.truncate(line, limit)
+                trimmed += 1
+            lines.insert(0, line)
+            used += self.count(line) + 1
+        if summary_line:
+            lines.insert(0, summary_line)
+        return lines, used, trimmed
+
+    def _pack_context(self, chunks: Sequence[str], budget: int) -> Tuple[List[str], int, int]:
+        """Rank-order packing of context chunks; returns (chunks, tokens, trimmed count)"""
+        packed, used, trimmed = [], 0, 0
+        for chunk in chunks:
+            cost = self.count(chunk) + 1
+            if used + cost <= budget:
+                packed.append(chunk)
+                used += cost
+                continue
+            remaining = budget - used - 1
+            # Always keep some of the best chunk, even under a tight budget
+            if remaining >= self.min_chunk_tokens or (not packed and remaining > 0):
+                chunk = self.truncate(chunk, remaining)
+                packed.append(chunk)
+                used += self.count(chunk) + 1
+                trimmed += 1
+            break
+        return packed, used, trimmed
+
+    def build_system_prompt(self, instructions: str, chunks: Sequence[str], history: Sequence[Dict],
+                            user_content: str, summary: str = None) -> Tuple[str, Dict]:
+        """System prompt with as much context and history as fits; returns (content, stats).
+
+        With no chunks the prompt is the instructions alone, as the chat prompt has always been.
+        """
+        fixed = self.count(instructions) + self.count(user_content) + 2 * MESSAGE_OVERHEAD_TOKENS
+        headers = self.count("Context:\n\n\nChat History:\n")
+        available = max(0, self.max_input_tokens - fixed - headers)
+        stats = {"budget": self.max_input_tokens, "context_chunks": 0, "context_chunks_available": len(chunks),
+                 "history_messages": 0, "history_messages_available": len(history), "history_tokens": 0,
+                 "summary": bool(summary), "trimmed": 0}
+
+        if not chunks:
+            content = instructions
+        else:
+            history_lines, history_tokens, history_trimmed = self._pack_history(
+                history, int(available * self.max_history_share), summary)
+            packed, _, chunks_trimmed = self._pack_context(chunks, available - history_tokens)
+            context_text = "\n".join(packed)
+            history_text = "\n".join(history_lines)
+            content = f"{instructions}Context:\n{context_text}\n\nChat History:\n{history_text}"
+            stats.update(context_chunks=len(packed), history_messages=len(history_lines) - (1 if summary else 0),
+                         history_tokens=history_tokens, trimmed=history_trimmed + chunks_trimmed)
+
+        stats["input_tokens"] = self.count(content) + self.count(user_content) + 2 * MESSAGE_OVERHEAD_TOKENS
+        return content, stats
+
+
+def summary_messages(budget: PromptBudget, previous_summary: str, messages: Sequence[Dict],
+                     max_message_tokens: int = 400) -> List[Dict]:
+    """LLM request that merges messages into previous_summary; long messages are trimmed first"""
+    lines = []
+    for msg in messages:
+        if msg.get("role") in ("user", "assistant"):
+            speaker = "Student" if msg["role"] == "user" else "Assistant"
+            lines.append(budget.truncate(f"{speaker}: {msg['content']}", max_message_tokens))
+    new_messages = "\n".join(lines)
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": f"Summary so far:\n{previous_summary or '(none)'}\n\nNew messages:\n{new_messages}"}
+    ]
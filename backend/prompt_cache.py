@@ -0,0 +1,98 @@
+"""
+Exact-match prompt cache persisted on disk.
+
+Completions are stored in SQLite keyed by a hash of the full request
+payload (endpoint URL, messages and sampling parameters), so an identical
+prompt -- a retried request, a health probe -- is answered without calling
+the model. The database is a plain file in WAL mode, so entries survive
+restarts and are shared by every worker process on the machine.
+
+Entries expire after a TTL; beyond max_entries the least recently used are
+evicted.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+from metrics import metrics
+
+
+class PromptCache:
+    def __init__(self, path: str = "prompt_cache.sqlite3", ttl_seconds: float = 86400, max_entries: int = 5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    completion TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5)
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def key_for(url: str, payload: dict) -> str:
+        """Content address of a request: same URL, messages and sampling parameters -> same key"""
+        canonical = json.dumps({"url": url, "payload": payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            with self._connect() as db:
+                row = db.execute("SELECT completion, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    if row is not None:
+                        db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    metrics.incr("prompt_cache.misses")
+                    return None
+                db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"[PromptCache] Lookup failed: {e}")
+            return None
+        metrics.incr("prompt_cache.hits")
+        return row[0]
+
+    def put(self, key: str, completion: str):
+        now = time.time()
+        try:
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO completions (key, completion, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, completion, now, now)
+                )
+                db.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+                db.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"[PromptCache] Store failed: {e}")
+            return
+        metrics.incr("prompt_cache.stores")
+
+    def stats(self):
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        return {"path": self.path, "entries": entries, "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries}
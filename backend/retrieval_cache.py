@@ -0,0 +1,155 @@
+"""
+Per-session retrieval cache for follow-up questions.
+
+Follow-ups in a session ("and the second one?", "explain that step") mostly
+need the chunks the previous turn retrieved, yet every turn searched the
+indexes from scratch. SessionRetrievalCache keeps the last few retrievals
+of each session: the question's embedding and the chunks it retrieved,
+with their relevance. For a new question:
+
+  reuse   its embedding is within reuse_similarity of a recent question:
+          the cached chunks are the context, no index is searched
+  merge   it is within merge_similarity: the indexes are searched as usual
+          and the recent chunks are kept as candidates alongside the fresh
+          ones, so a vaguely worded follow-up doesn't lose the material it
+          refers to
+  miss    anything else
+
+Cached relevance is scaled by the similarity between the two questions, so
+a carried-over chunk only outranks a fresh hit when the questions are
+close.
+
+Entries are stamped with the user's index version when retrieval started.
+Indexing, deleting or clearing documents bumps the user's version (and a
+global knowledge update bumps every user's), so nothing retrieved from an
+older index is served again, including retrievals that were still running
+when the index changed. Entries also expire after a TTL, and the least
+recently used session is dropped once max_sessions are cached.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import metrics
+
+REUSE = "reuse"
+MERGE = "merge"
+
+
+class CachedRetrieval:
+    __slots__ = ("vector", "hits", "version", "created_at")
+
+    def __init__(self, vector, hits, version):
+        self.vector = vector
+        self.hits = hits  # [(doc, relevance)], best first
+        self.version = version
+        self.created_at = time.monotonic()
+
+
+class SessionRetrievalCache:
+    """Recent retrievals per (user, session), matched by question-embedding similarity"""
+
+    def __init__(self, reuse_similarity: float = 0.9, merge_similarity: float = 0.75, turns: int = 3,
+                 ttl_seconds: float = 600, max_sessions: int = 5000):
+        self.reuse_similarity = reuse_similarity
+        self.merge_similarity = merge_similarity
+        self.turns = turns
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # (user, session_id) -> [CachedRetrieval], newest last
+        self._user_versions = {}
+        self._global_version = 0
+        self._lock = threading.Lock()
+        self.counts = {REUSE: 0, MERGE: 0, "miss": 0}
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def version(self, user):
+        """The user's current index version; pass it to store() for a retrieval started now"""
+        with self._lock:
+            return self._global_version, self._user_versions.get(user, 0)
+
+    def invalidate_user(self, user):
+        """The user's index changed: nothing retrieved from the old one is served again"""
+        with self._lock:
+            self._user_versions[user] = self._user_versions.get(user, 0) + 1
+            for key in [key for key in self._sessions if key[0] == user]:
+                del self._sessions[key]
+        metrics.incr("retrieval_cache.invalidations")
+
+    def invalidate_all(self):
+        """The global index changed, which every cached retrieval may have drawn from"""
+        with self._lock:
+            self._global_version += 1
+            self._sessions.clear()
+        metrics.incr("retrieval_cache.invalidations")
+
+    def drop_session(self, user, session_id):
+        with self._lock:
+            self._sessions.pop((user, session_id), None)
+
+    def lookup(self, user, session_id, query_vector):
+        """(REUSE or MERGE, hits rescaled to the new question) for the closest recent retrieval, or (None, [])"""
+        query = self._normalize(query_vector)
+        now = time.monotonic()
+        key = (user, session_id)
+        with self._lock:
+            current = (self._global_version, self._user_versions.get(user, 0))
+            entries = [entry for entry in self._sessions.get(key, ())
+                       if entry.version == current and now - entry.created_at <= self.ttl_seconds]
+            best, best_score = None, self.merge_similarity
+            for entry in entries:
+                score = float(np.dot(query, entry.vector))
+                if score >= best_score:
+                    best, best_score = entry, score
+            if entries:
+                self._sessions[key] = entries
+                self._sessions.move_to_end(key)
+            else:
+                self._sessions.pop(key, None)
+            kind = None if best is None else REUSE if best_score >= self.reuse_similarity else MERGE
+            self.counts[kind or "miss"] += 1
+        metrics.incr(f"retrieval_cache.{kind or 'miss'}")
+        if best is None:
+            return None, []
+        return kind, [(doc, score * best_score) for doc, score in best.hits]
+
+    def store(self, user, session_id, query_vector, hits, version):
+        """Remember a session's retrieval, unless the index changed since version was taken"""
+        if self.turns <= 0:
+            # turns=0 turns the cache off
+            return
+        entry = CachedRetrieval(self._normalize(query_vector), list(hits), version)
+        key = (user, session_id)
+        with self._lock:
+            if version != (self._global_version, self._user_versions.get(user, 0)):
+                metrics.incr("retrieval_cache.stale_stores")
+                return
+            entries = self._sessions.setdefault(key, [])
+            entries.append(entry)
+            del entries[:-self.turns]
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                metrics.incr("retrieval_cache.evictions")
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self.counts.values())
+            return {
+                "sessions": len(self._sessions),
+                "lookups": lookups,
+                "reused": self.counts[REUSE],
+                "merged": self.counts[MERGE],
+                "reuse_rate": round(self.counts[REUSE] / lookups, 3) if lookups else 0.0,
+                "merge_rate": round(self.counts[MERGE] / lookups, 3) if lookups else 0.0,
+                "reuse_similarity": self.reuse_similarity,
+                "merge_similarity": self.merge_similarity
+            }
@@ -0,0 +1,30 @@
+"""
+Sizing the global index search from the user's own hits.
+
+A question is answered from the user's documents and the shared global
+index. When the user's chunks match well the global index adds little, and
+when they match poorly it is the main source of context, so the number of
+global chunks fetched follows the relevance of the user's hits:
+
+  skipped   at least user_k user hits reach strong: no global search
+  shrunk    some (fewer than user_k) do: one global chunk
+  widened   no user hits, or the best is below weak: wide_k global chunks
+  default   anything in between: global_k global chunks
+
+Relevance is in [0, 1] as computed by the caller (1.0 is an exact match).
+"""
+
+from typing import Sequence, Tuple
+
+
+def plan_global_search(user_hits: Sequence[Tuple[object, float]], user_k: int, global_k: int, wide_k: int,
+                       strong: float, weak: float) -> Tuple[int, str]:
+    """How many global chunks to fetch, given the user's own hits as (doc, relevance); returns (k, decision)"""
+    strong_hits = sum(1 for _, score in user_hits if score >= strong)
+    if strong_hits >= user_k:
+        return 0, "skipped"
+    if strong_hits:
+        return 1, "shrunk"
+    if not user_hits or max(score for _, score in user_hits) < weak:
+        return wide_k, "widened"
+    return global_k, "default"
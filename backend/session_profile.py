@@ -0,0 +1,51 @@
+"""
+Per-session student profile: the name and interests a student has told us.
+
+Profiles used to be rebuilt by rescanning the whole chat history on every
+turn. The state now lives in the session record, with "scanned" marking
+how much of the history it covers, so each turn only reads the messages
+appended since the last one. Sessions saved before this existed are
+scanned in full once.
+"""
+
+from typing import Dict, List
+
+
+def update_profile_state(state: Dict, messages: List[Dict]) -> Dict:
+    """Fold user messages into a profile state dict ({"name", "interests"}) in place"""
+    for msg in messages:
+        if msg.get("role") == "user":
+            text = msg["content"].lower()
+            if "my name is" in text:
+                part = text.split("my name is", 1)[1].strip()
+                if part:
+                    name = part.split()[0]
+                    state["name"] = name.capitalize()
+            if "i like" in text or "i am interested in" in text:
+                if "i like" in text:
+                    interest = text.split("i like", 1)[1].strip()
+                else:
+                    interest = text.split("interested in", 1)[1].strip()
+                if interest:
+                    interest = interest.split('.')[0].capitalize()
+                    if interest not in state["interests"]:
+                        state["interests"].append(interest)
+    return state
+
+
+def extract_user_profile(history: List[Dict], default_name: str = "User") -> Dict:
+    """Profile from a whole history, for a conversation with no session record"""
+    state = update_profile_state({"name": None, "interests": []}, history)
+    return {"name": state["name"] or default_name, "interests": state["interests"]}
+
+
+def session_record_profile(record: Dict, conv: List[Dict], default_name: str = "User") -> Dict:
+    """Profile for the session record's conversation conv, updated only from messages appended since the last call"""
+    state = record.get("profile")
+    if state is None or state.get("scanned", 0) > len(conv):
+        # No state yet, or the history was replaced underneath it: rebuild from scratch
+        state = record["profile"] = {"name": None, "interests": [], "scanned": 0}
+    if state["scanned"] < len(conv):
+        update_profile_state(state, conv[state["scanned"]:])
+        state["scanned"] = len(conv)
+    return {"name": state["name"] or default_name, "interests": list(state["interests"])}
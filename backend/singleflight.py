@@ -0,0 +1,130 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When the same question is asked many times at once (a question on the
+projector, thirty students pasting it), only the first request -- the
+leader -- calls the LLM. Requests with the same key that arrive while it is
+in flight wait for the leader's result instead of starting their own call.
+The key must cover everything that shapes the answer, or a follower is
+served a result meant for someone else: flight_key() keys a
+first-turn question on its wording and retrieved chunks, so any students
+asking it share the call, and one with chat history on the user's whole
+prompt as well.
+
+Followers wait at most wait_timeout seconds, or less if do() is given a
+shorter wait (what is left of the request's deadline). If the leader fails
+or the wait runs out they do the work themselves, so coalescing can delay a
+request but never fail one.
+
+SingleFlight is for threads (the Flask routes); AsyncSingleFlight is the
+asyncio version for the ASGI routes.
+"""
+
+import time
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from answer_cache import depersonalize
+from metrics import metrics
+
+_FAILED = object()
+
+
+def flight_key(user: str, message: str, retrieval: dict) -> Hashable:
+    """Key for a chat question: the normalized question, the retrieved chunks and the prompt without the student's name.
+
+    retrieval is the turn's (see stage_prompt in app.py). A shareable prompt is the same for every
+    student but the name, so students asking the same question over the same chunks share one
+    call, each answer addressed to its asker (see shared_answer). Any other prompt carries the
+    user's history, so its key has the user too.
+    """
+    normalized = " ".join(message.lower().split()).rstrip("?!. ")
+    owner = None if retrieval.get("shareable") else user
+    return owner, normalized, retrieval["fingerprint"], retrieval["prompt_fingerprint"]
+
+
+def shared_answer(text: str, retrieval: dict) -> str:
+    """A leader's answer as its followers share it: without the student's name if the prompt is shareable"""
+    return depersonalize(text, retrieval["name"]) if retrieval.get("shareable") else text
+
+
+class _Call:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _FAILED
+
+
+class SingleFlight:
+    def __init__(self, wait_timeout: float = 30.0, name: str = "singleflight"):
+        self.wait_timeout = wait_timeout
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], wait: Optional[float] = None) -> Tuple[Any, bool]:
+        """Run fn, or share the result of an identical call already in flight; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if leader:
+            metrics.incr(f"{self.name}.leaders")
+            try:
+                call.result = fn()
+                return call.result, False
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        start = time.perf_counter()
+        if not call.done.wait(self.wait_timeout if wait is None else min(self.wait_timeout, wait)):
+            metrics.incr(f"{self.name}.wait_timeouts")
+            return fn(), False
+        metrics.observe(f"{self.name}.wait", time.perf_counter() - start)
+        if call.result is _FAILED:
+            metrics.incr(f"{self.name}.leader_failures")
+            return fn(), False
+        metrics.incr(f"{self.name}.coalesced")
+        return call.result, True
+
+
+class AsyncSingleFlight:
+    def __init__(self, wait_timeout: float = 30.0, name: str = "singleflight"):
+        self.wait_timeout = wait_timeout
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                 wait: Optional[float] = None) -> Tuple[Any, bool]:
+        """Await fn(), or share the result of an identical call already in flight; returns (result, shared)"""
+        future = self._calls.get(key)
+        if future is None:
+            future = self._calls[key] = asyncio.get_running_loop().create_future()
+            metrics.incr(f"{self.name}.leaders")
+            result = _FAILED
+            try:
+                result = await fn()
+                return result, False
+            finally:
+                # A failed or cancelled leader resolves to _FAILED so followers fall back to their own call
+                self._calls.pop(key, None)
+                future.set_result(result)
+
+        start = time.perf_counter()
+        try:
+            timeout = self.wait_timeout if wait is None else min(self.wait_timeout, wait)
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            metrics.incr(f"{self.name}.wait_timeouts")
+            return await fn(), False
+        metrics.observe(f"{self.name}.wait", time.perf_counter() - start)
+        if result is _FAILED:
+            metrics.incr(f"{self.name}.leader_failures")
+            return await fn(), False
+        metrics.incr(f"{self.name}.coalesced")
+        return result, True
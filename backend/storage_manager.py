@@ -1,6 +1,7 @@
 import os
 import json
 import shutil
+import tempfile
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional, BinaryIO
 import datetime
@@ -32,6 +33,31 @@ class StorageProvider(ABC):
     def file_exists(self, user: str, filename: str) -> bool:
         """Check if a file exists"""
         pass
+    
+    def get_staging_path(self, user: str, upload_id: str) -> str:
+        """Get a local path where a chunked upload can be assembled before it is committed"""
+        staging_dir = os.path.join(tempfile.gettempdir(), "studybuddy_uploads")
+        os.makedirs(staging_dir, exist_ok=True)
+        return os.path.join(staging_dir, f"{upload_id}.partial")
+    
+    def commit_staged_file(self, user: str, filename: str, staging_path: str) -> bool:
+        """Store a fully assembled upload and remove the staging file"""
+        try:
+            with open(staging_path, 'rb') as f:
+                saved = self.save_file(user, filename, f)
+        except Exception as e:
+            print(f"[Storage] Commit staged file error: {e}")
+            return False
+        if saved:
+            try:
+                os.remove(staging_path)
+            except OSError:
+                pass
+        return saved
+    
+    def get_local_path(self, user: str, filename: str) -> Optional[str]:
+        """Get a local filesystem path for a stored file, or None if the provider has no local copy"""
+        return None
 
 class LocalStorageProvider(StorageProvider):
     """Local file system storage provider"""
@@ -124,6 +150,28 @@ class LocalStorageProvider(StorageProvider):
         except Exception as e:
             print(f"[LocalStorage] Exists error: {e}")
             return False
+    
+    def get_staging_path(self, user: str, upload_id: str) -> str:
+        """Stage chunked uploads next to the user's files so committing is a rename, not a copy"""
+        staging_dir = os.path.join(self._get_user_path(user), ".uploads")
+        os.makedirs(staging_dir, exist_ok=True)
+        return os.path.join(staging_dir, f"{upload_id}.partial")
+    
+    def commit_staged_file(self, user: str, filename: str, staging_path: str) -> bool:
+        """Move a fully assembled upload into the user's directory"""
+        try:
+            user_dir = self._get_user_path(user)
+            os.makedirs(user_dir, exist_ok=True)
+            os.replace(staging_path, os.path.join(user_dir, filename))
+            return True
+        except Exception as e:
+            print(f"[LocalStorage] Commit staged file error: {e}")
+            return False
+    
+    def get_local_path(self, user: str, filename: str) -> Optional[str]:
+        """Get the on-disk path of a stored file"""
+        file_path = os.path.join(self._get_user_path(user), filename)
+        return file_path if os.path.isfile(file_path) else None
 
 class GoogleDriveStorageProvider(StorageProvider):
     """Google Drive storage provider (Real implementation)"""
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionController, Overloaded, PRIORITY_TEXT, PRIORITY_AUDIO, PRIORITY_BACKGROUND
+
+
+def test_admits_up_to_the_concurrency_limit_then_queues():
+    controller = AdmissionController(max_concurrent=2, max_per_user=2, queue_timeout=0.1)
+    first = controller.acquire("a")
+    second = controller.acquire("b")
+    with pytest.raises(Overloaded) as e:
+        controller.acquire("c")
+    assert (e.value.status, e.value.reason) == (503, "timeout")
+    controller.release(first)
+    controller.release(second)
+    assert controller.stats()["active"] == 0
+
+
+def test_released_slot_goes_to_the_waiting_request():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=5)
+    held = controller.acquire("a")
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(controller.acquire("b")))
+    waiter.start()
+    time.sleep(0.05)
+    assert controller.stats()["queued"] == 1
+    controller.release(held)
+    waiter.join(5)
+    assert len(granted) == 1
+    controller.release(granted[0])
+
+
+def test_waiters_are_served_by_priority():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=5)
+    held = controller.acquire(None)
+    order = []
+
+    def wait_for_slot(user, priority):
+        ticket = controller.acquire(user, priority)
+        order.append(priority)
+        controller.release(ticket)
+
+    threads = []
+    for user, priority in (("bg", PRIORITY_BACKGROUND), ("voice", PRIORITY_AUDIO), ("text", PRIORITY_TEXT)):
+        thread = threading.Thread(target=wait_for_slot, args=(user, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    controller.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == [PRIORITY_TEXT, PRIORITY_AUDIO, PRIORITY_BACKGROUND]
+
+
+def test_user_over_their_queue_allowance_gets_429():
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_user_queue=0, queue_timeout=5)
+    held = controller.acquire("a")
+    with pytest.raises(Overloaded) as e:
+        controller.acquire("a")
+    assert e.value.status == 429
+    assert e.value.retry_after >= 1
+    controller.release(held)
+
+
+def test_full_queue_sheds_a_less_important_waiter():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+    held = controller.acquire(None)
+    shed = []
+
+    def background():
+        try:
+            controller.acquire("bg", PRIORITY_BACKGROUND)
+        except Overloaded as e:
+            shed.append(e.reason)
+
+    waiter = threading.Thread(target=background)
+    waiter.start()
+    time.sleep(0.05)
+    text = []
+    texter = threading.Thread(target=lambda: text.append(controller.acquire("text", PRIORITY_TEXT)))
+    texter.start()
+    waiter.join(5)
+    assert shed == ["shed"]
+    controller.release(held)
+    texter.join(5)
+    controller.release(text[0])
+
+
+def test_full_queue_rejects_an_equally_important_request():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=5)
+    held = controller.acquire("a")
+    with pytest.raises(Overloaded) as e:
+        controller.acquire("b")
+    assert e.value.reason == "queue_full"
+    controller.release(held)
+
+
+def test_wait_is_capped_by_the_callers_timeout():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=10)
+    held = controller.acquire("a")
+    start = time.monotonic()
+    with pytest.raises(Overloaded):
+        controller.acquire("b", timeout=0.1)
+    assert time.monotonic() - start < 1
+    assert controller.stats()["queued"] == 0
+    controller.release(held)
+
+
+def test_async_acquire_is_woken_by_a_release():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=5)
+
+    async def main():
+        held = controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.acquire_async("b"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        controller.release(held)
+        ticket = await asyncio.wait_for(waiter, 5)
+        controller.release(ticket)
+
+    asyncio.run(main())
+    assert controller.stats()["active"] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=5)
+
+    async def main():
+        held = controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.acquire_async("b"))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        controller.release(held)
+
+    asyncio.run(main())
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["active"] == 0
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from answer_cache import SemanticAnswerCache, context_fingerprint, prompt_fingerprint, depersonalize, personalize
+
+
+def doc(content, doc_id=None):
+    return SimpleNamespace(page_content=content, id=doc_id)
+
+
+def test_fingerprint_ignores_order_but_not_content():
+    a, b = doc("alpha", "1"), doc("beta", "2")
+    assert context_fingerprint([a, b]) == context_fingerprint([b, a])
+    assert context_fingerprint([a, b]) != context_fingerprint([a, doc("beta changed", "2")])
+
+
+def test_similar_question_over_the_same_context_hits():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0], "ctx", "answer", upstream_seconds=2.0)
+    entry = cache.lookup([0.99, 0.05], "ctx")
+    assert entry is not None and entry.answer == "answer"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["saved_upstream_seconds"] == 2.0
+
+
+def test_dissimilar_question_or_other_context_misses():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0], "ctx", "answer")
+    assert cache.lookup([0.0, 1.0], "ctx") is None
+    assert cache.lookup([1.0, 0.0], "other ctx") is None
+
+
+def test_expired_entries_are_not_served():
+    cache = SemanticAnswerCache(ttl_seconds=0)
+    cache.store([1.0, 0.0], "ctx", "answer")
+    assert cache.lookup([1.0, 0.0], "ctx") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store([1.0, 0.0], "a", "first")
+    cache.store([1.0, 0.0], "b", "second")
+    cache.lookup([1.0, 0.0], "a")
+    cache.store([1.0, 0.0], "c", "third")
+    assert cache.lookup([1.0, 0.0], "b") is None
+    assert cache.lookup([1.0, 0.0], "a").answer == "first"
+    assert cache.lookup([1.0, 0.0], "c").answer == "third"
+
+
+def test_prompt_fingerprint_separates_profiles_and_histories():
+    docs = [doc("alpha", "1")]
+    base = prompt_fingerprint(docs, "Context: alpha\nChat History:\n", "User Name: Alice\n")
+    assert base == prompt_fingerprint(docs, "Context: alpha\nChat History:\n", "User Name: Alice\n")
+    assert base != prompt_fingerprint(docs, "Context: alpha\nChat History:\n", "User Name: Bob\n")
+    assert base != prompt_fingerprint(docs, "Context: alpha\nChat History:\nStudent: hi\n", "User Name: Alice\n")
+    assert base != prompt_fingerprint([doc("beta", "2")], "Context: alpha\nChat History:\n", "User Name: Alice\n")
+    assert base != context_fingerprint(docs)
+
+
+def test_other_students_share_an_answer_addressed_to_them():
+    cache = SemanticAnswerCache(threshold=0.95)
+    context = context_fingerprint([doc("alpha", "1")])
+    cache.store([1.0, 0.0], context, depersonalize("Hi Alice! Osmosis, Alice, is diffusion of water.", "Alice"))
+    entry = cache.lookup([0.99, 0.05], context)
+    assert personalize(entry.answer, "Bob") == "Hi Bob! Osmosis, Bob, is diffusion of water."
+    assert cache.lookup([0.99, 0.05], context_fingerprint([doc("beta", "2")])) is None
+
+
+def test_depersonalize_replaces_whole_words_only():
+    answer = depersonalize("Alice, see Alicent's notes.", "Alice")
+    assert personalize(answer, "Bob") == "Bob, see Alicent's notes."
+    assert depersonalize("No name here.", "") == "No name here."
@@ -0,0 +1,53 @@
+import pytest
+
+from answer_pipeline import AnswerPipeline, Turn, STAGES
+
+
+def recording_pipeline(answer_at=None):
+    ran = []
+
+    def stage(name):
+        def run(turn):
+            ran.append(name)
+            if name == answer_at:
+                turn.answer = "Hello! How can I help?"
+        return run
+
+    return AnswerPipeline({name: stage(name) for name in STAGES}, name="test_pipeline"), ran
+
+
+def test_stages_run_in_order():
+    pipeline, ran = recording_pipeline()
+    turn = pipeline.run(Turn("alice", message="what is osmosis"))
+    assert ran == list(STAGES)
+    assert set(turn.timings) == set(STAGES)
+
+
+def test_an_early_answer_skips_to_persist():
+    pipeline, ran = recording_pipeline(answer_at="route")
+    turn = pipeline.run(Turn("alice", message="hi"))
+    assert ran == ["profile", "history", "route", "persist"]
+    assert turn.answer == "Hello! How can I help?"
+    assert "retrieve" not in turn.timings
+
+
+def test_callers_can_run_stages_a_few_at_a_time():
+    pipeline, ran = recording_pipeline()
+    turn = Turn("alice", message="what is osmosis")
+    pipeline.run(turn, "profile", "history")
+    pipeline.run(turn, "route", "retrieve")
+    assert ran == ["profile", "history", "route", "retrieve"]
+
+
+def test_hooks_see_every_stage_and_a_failing_hook_is_ignored():
+    pipeline, _ = recording_pipeline()
+    seen = []
+    pipeline.add_hook(lambda turn, stage, seconds: 1 / 0)
+    pipeline.add_hook(lambda turn, stage, seconds: seen.append(stage))
+    pipeline.run(Turn("alice", message="what is osmosis"))
+    assert seen == list(STAGES)
+
+
+def test_missing_stages_are_rejected():
+    with pytest.raises(ValueError, match="generate"):
+        AnswerPipeline({name: lambda turn: None for name in STAGES if name != "generate"})
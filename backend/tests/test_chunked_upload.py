@@ -0,0 +1,76 @@
+import io
+import hashlib
+
+import pytest
+
+from chunked_upload import ChunkedUploadManager, ChunkedUploadError, READ_BLOCK_SIZE
+
+PART = READ_BLOCK_SIZE
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return ChunkedUploadManager(state_dir=str(tmp_path / "uploads"), default_part_size=PART)
+
+
+def start(manager, tmp_path, data):
+    upload_id = manager.new_upload_id()
+    staging = str(tmp_path / "staging.bin")
+    manager.create("alice", upload_id, "notes.pdf", len(data), staging)
+    return upload_id, staging
+
+
+def part(data, number):
+    return data[(number - 1) * PART:number * PART]
+
+
+def test_parts_arriving_out_of_order_assemble_the_file(manager, tmp_path):
+    data = bytes(range(256)) * (PART * 3 // 256) + b"tail"
+    upload_id, staging = start(manager, tmp_path, data)
+    for number in (4, 2, 1, 3):
+        manager.write_part(upload_id, "alice", number, io.BytesIO(part(data, number)))
+    manager.finish(upload_id, "alice")
+    with open(staging, "rb") as f:
+        assert f.read() == data
+
+
+def test_status_lists_what_is_missing_so_a_client_can_resume(manager, tmp_path):
+    data = b"x" * (PART * 3)
+    upload_id, staging = start(manager, tmp_path, data)
+    manager.write_part(upload_id, "alice", 2, io.BytesIO(part(data, 2)))
+    with pytest.raises(ChunkedUploadError) as missing:
+        manager.finish(upload_id, "alice")
+    assert missing.value.status_code == 409
+
+    # A fresh manager (another worker) picks the upload up from its on-disk state
+    resumed = ChunkedUploadManager(state_dir=manager.state_dir, default_part_size=PART)
+    status = resumed.status(upload_id, "alice")
+    assert status["received_parts"] == [2]
+    assert status["missing_parts"] == [1, 3]
+    for number in status["missing_parts"]:
+        resumed.write_part(upload_id, "alice", number, io.BytesIO(part(data, number)))
+    assert resumed.finish(upload_id, "alice")["filename"] == "notes.pdf"
+
+
+def test_failed_part_does_not_count_until_it_is_resent(manager, tmp_path):
+    data = b"y" * (PART * 2)
+    upload_id, _ = start(manager, tmp_path, data)
+    with pytest.raises(ChunkedUploadError):
+        manager.write_part(upload_id, "alice", 1, io.BytesIO(part(data, 1)[:-10]))
+    bad_sum = hashlib.sha256(b"other").hexdigest()
+    with pytest.raises(ChunkedUploadError) as mismatch:
+        manager.write_part(upload_id, "alice", 2, io.BytesIO(part(data, 2)), expected_sha256=bad_sum)
+    assert mismatch.value.status_code == 422
+    assert manager.status(upload_id, "alice")["received_parts"] == []
+    manager.write_part(upload_id, "alice", 1, io.BytesIO(part(data, 1)),
+                       expected_sha256=hashlib.sha256(part(data, 1)).hexdigest())
+    assert manager.status(upload_id, "alice")["received_parts"] == [1]
+
+
+def test_other_users_cannot_see_or_write_an_upload(manager, tmp_path):
+    upload_id, _ = start(manager, tmp_path, b"z" * PART)
+    with pytest.raises(ChunkedUploadError) as not_found:
+        manager.write_part(upload_id, "bob", 1, io.BytesIO(b"z" * PART))
+    assert not_found.value.status_code == 404
+    with pytest.raises(ChunkedUploadError):
+        manager.status("../../etc", "alice")
@@ -0,0 +1,28 @@
+import math
+import time
+
+from deadline import Deadline
+
+
+def test_unbounded_deadline():
+    for deadline in (Deadline(), Deadline(0), Deadline(None, "chat")):
+        assert not deadline.bounded
+        assert not deadline.expired
+        assert deadline.remaining() == math.inf
+        assert deadline.remaining(reserve=5) == math.inf
+
+
+def test_remaining_counts_down_and_keeps_the_reserve_back():
+    deadline = Deadline(10, "chat")
+    assert deadline.bounded and deadline.route == "chat"
+    assert 9 < deadline.remaining() <= 10
+    assert 6 < deadline.remaining(reserve=3) <= 7
+    assert deadline.remaining(reserve=20) == 0.0
+
+
+def test_expires():
+    deadline = Deadline(0.05)
+    time.sleep(0.06)
+    assert deadline.expired
+    assert deadline.remaining() == 0.0
+    assert deadline.elapsed() >= 0.05
@@ -0,0 +1,52 @@
+import zipfile
+
+import pytest
+from lxml import etree
+
+from docx_stream import iter_docx_blocks, iter_text_chunks
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def row(*cells):
+    return "<w:tr>" + "".join(f"<w:tc>{paragraph(cell)}</w:tc>" for cell in cells) + "</w:tr>"
+
+
+def write_docx(path, body):
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("word/document.xml", f"<w:document {W}><w:body>{body}</w:body></w:document>")
+    return str(path)
+
+
+def test_paragraphs_and_table_rows_in_document_order(tmp_path):
+    path = write_docx(tmp_path / "doc.docx", paragraph("Intro") + "<w:tbl>" + row("a", "b") + row("c", "d")
+                      + "</w:tbl>" + paragraph("Outro"))
+    assert list(iter_docx_blocks(path)) == ["Intro", "a | b", "c | d", "Outro"]
+
+
+def test_corrupt_xml_raises_after_the_blocks_before_it(tmp_path):
+    path = tmp_path / "broken.docx"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("word/document.xml", f"<w:document {W}><w:body>{paragraph('Intro')}<w:tbl>{row('a', 'b')}"
+                                         "</w:tbl><w:p><w:r><w:t>cut off</w:r></w:body></w:document>")
+    seen = []
+    with pytest.raises(etree.XMLSyntaxError):
+        for block in iter_docx_blocks(str(path)):
+            seen.append(block)
+    assert seen == ["Intro", "a | b"]
+
+
+class WordSplitter:
+    _chunk_overlap = 0
+
+    def split_text(self, text):
+        return text.split("\n")
+
+
+def test_text_chunks_cover_every_block():
+    blocks = [f"block {i}" for i in range(50)]
+    assert list(iter_text_chunks(iter(blocks), WordSplitter(), flush_chars=40)) == blocks
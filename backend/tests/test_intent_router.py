@@ -0,0 +1,29 @@
+from intent_router import IntentRouter, normalize, GREETING, THANKS, ACKNOWLEDGEMENT
+
+
+def test_normalize_strips_punctuation_emoji_and_apostrophes():
+    assert normalize("  Hello,   there!! 👋 ") == "hello there"
+    assert normalize("What's up?") == "whats up"
+
+
+def test_normalize_keeps_tamil_vowel_signs_and_viramas():
+    assert normalize("வணக்கம்!") == "வணக்கம்"
+    assert normalize("நன்றி 🙏") == "நன்றி"
+
+
+def test_normalize_keeps_arabic_harakat():
+    assert normalize("السَّلَامُ عَلَيْكُمْ!") == "السَّلَامُ عَلَيْكُمْ"
+
+
+def test_normalize_drops_a_variation_selector_with_its_emoji():
+    assert normalize("👍️") == ""
+    assert normalize("ok 👍️") == "ok"
+
+
+def test_native_script_greetings_and_thanks_are_answered_from_templates():
+    router = IntentRouter()
+    assert router.classify("வணக்கம்!").intent == GREETING
+    assert router.classify("السلام عليكم").intent == GREETING
+    assert router.classify("நன்றி").intent == THANKS
+    assert router.classify("شكرا!").intent == THANKS
+    assert router.classify("👍️").intent == ACKNOWLEDGEMENT
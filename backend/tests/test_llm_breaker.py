@@ -0,0 +1,125 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from llm_client import CircuitBreaker, LLMBackend, ThetaLLM, AsyncThetaLLM
+
+
+def failing_breaker(**kwargs):
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4, cooldown_seconds=kwargs.pop("cooldown_seconds", 60),
+                             **kwargs)
+    for _ in range(4):
+        breaker.record_failure()
+    return breaker
+
+
+def test_stays_closed_below_the_minimum_request_count():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_once_the_error_rate_crosses_the_threshold():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert not breaker.available()
+
+
+def test_half_open_after_cooldown_lets_one_trial_through():
+    breaker = failing_breaker(cooldown_seconds=0.05)
+    time.sleep(0.06)
+    assert breaker.available()
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+    assert not breaker.available()
+
+
+def test_successful_trial_closes():
+    breaker = failing_breaker(cooldown_seconds=0)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_failed_trial_reopens():
+    breaker = failing_breaker(cooldown_seconds=0.05)
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_old_outcomes_fall_out_of_the_window():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4, window_seconds=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_released_trial_lets_the_next_request_be_the_trial():
+    breaker = failing_breaker(cooldown_seconds=0)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release_trial()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_cancelled_half_open_trial_does_not_wedge_the_async_client():
+    started = asyncio.Event()
+
+    async def handler(request):
+        if not started.is_set():
+            started.set()
+            await asyncio.sleep(10)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "recovered"}}]})
+
+    breaker = failing_breaker(cooldown_seconds=0)
+    backend = LLMBackend("http://llm.test/v1/chat/completions", "key", kind=LLMBackend.OPENAI, breaker=breaker)
+    llm = AsyncThetaLLM(api_key="key", backends=[backend], max_retries=0)
+
+    async def main():
+        llm._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        trial = asyncio.ensure_future(llm.invoke([{"role": "user", "content": "hi"}]))
+        await asyncio.wait_for(started.wait(), 5)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        answer = await llm.invoke([{"role": "user", "content": "hi"}])
+        await llm.aclose()
+        return answer
+
+    assert asyncio.run(main()) == "recovered"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_interrupted_half_open_trial_does_not_wedge_the_sync_client():
+    class InterruptingAdapter(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            raise KeyboardInterrupt
+
+        def close(self):
+            pass
+
+    breaker = failing_breaker(cooldown_seconds=0)
+    llm = ThetaLLM(api_key="key", url="http://llm.test/completions", breaker=breaker, max_retries=0)
+    llm.session.mount("http://", InterruptingAdapter())
+    with pytest.raises(KeyboardInterrupt):
+        llm.invoke([{"role": "user", "content": "hi"}])
+    assert breaker.allow_request()
@@ -0,0 +1,23 @@
+from llm_client import HedgePolicy, LLMBackend, ThetaLLM
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_hedge_backend_defaults_to_a_theta_endpoint_on_the_client_key():
+    hedge = HedgePolicy(url="http://theta.test/completions")
+    ThetaLLM(api_key="key", url="http://primary.test/completions", hedge=hedge)
+    assert hedge.backend.kind == LLMBackend.THETA
+    assert hedge.backend.headers["Authorization"] == "Bearer key"
+    assert "input" in hedge.backend.payload(MESSAGES, False, {})
+
+
+def test_hedge_backend_uses_the_configured_kind_model_and_key():
+    hedge = HedgePolicy(url="http://vllm.test/v1/chat/completions", kind=LLMBackend.OPENAI, model="llama",
+                        api_key="other-key")
+    ThetaLLM(api_key="key", url="http://primary.test/completions", hedge=hedge)
+    assert hedge.backend.kind == LLMBackend.OPENAI
+    assert hedge.backend.headers["Authorization"] == "Bearer other-key"
+    payload = hedge.backend.payload(MESSAGES, False, {})
+    assert payload["model"] == "llama"
+    assert payload["messages"] == MESSAGES
+    assert hedge.backend.message_text({"choices": [{"message": {"content": "ok"}}]}) == "ok"
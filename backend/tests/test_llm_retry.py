@@ -0,0 +1,137 @@
+import io
+import socket
+import asyncio
+import threading
+
+import httpx
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+
+from llm_client import LLMBackend, ThetaLLM, AsyncThetaLLM, failed_to_connect
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class CountingAdapter(HTTPAdapter):
+    def __init__(self):
+        super().__init__(max_retries=0)
+        self.sends = 0
+
+    def send(self, request, **kwargs):
+        self.sends += 1
+        return super().send(request, **kwargs)
+
+
+def sync_client(url):
+    llm = ThetaLLM(api_key="key", url=url, max_retries=1, backoff_base=0.001)
+    adapter = CountingAdapter()
+    llm.session.mount("http://", adapter)
+    return llm, adapter
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def hang_up_server():
+    """Reads each request, then closes the connection without answering"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    accepted = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            accepted.append(conn)
+            conn.recv(65536)
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}/completions", accepted
+    server.close()
+
+
+def test_connect_phase_failures_are_classified_as_resendable():
+    assert failed_to_connect(requests.exceptions.ConnectTimeout("connect timed out"))
+    assert not failed_to_connect(requests.exceptions.ConnectionError(ProtocolError("Connection aborted.")))
+    assert not failed_to_connect(requests.exceptions.ConnectionError())
+
+
+def test_refused_connection_is_retried():
+    llm, adapter = sync_client(f"http://127.0.0.1:{closed_port()}/completions")
+    with pytest.raises(requests.exceptions.ConnectionError):
+        llm._post(MESSAGES)
+    assert adapter.sends == 2
+
+
+def test_connection_dropped_after_sending_is_not_retried(hang_up_server):
+    url, accepted = hang_up_server
+    llm, adapter = sync_client(url)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        llm._post(MESSAGES)
+    assert adapter.sends == 1
+    assert len(accepted) == 1
+    assert llm.backends[0].errors == 1
+    assert llm.backends[0].outstanding == 0
+
+
+def async_calls(error):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise error("upstream failed", request=request)
+
+    backend = LLMBackend("http://llm.test/v1/chat/completions", "key", kind=LLMBackend.OPENAI)
+    llm = AsyncThetaLLM(api_key="key", backends=[backend], max_retries=1, backoff_base=0.001)
+
+    async def main():
+        llm._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            with pytest.raises(error):
+                await llm._post(MESSAGES)
+        finally:
+            await llm.aclose()
+
+    asyncio.run(main())
+    return len(calls)
+
+
+def test_async_connect_error_is_retried():
+    assert async_calls(httpx.ConnectError) == 2
+
+
+def test_async_connection_dropped_after_sending_is_not_retried():
+    assert async_calls(httpx.RemoteProtocolError) == 1
+
+
+def test_rejected_request_releases_its_connection():
+    class RejectingAdapter(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            response = requests.Response()
+            response.status_code = 400
+            response.raw = io.BytesIO(b'{"error": "bad request"}')
+            response.request = request
+            response.url = request.url
+            self.response = response
+            return response
+
+        def close(self):
+            pass
+
+    llm = ThetaLLM(api_key="key", url="http://llm.test/completions", max_retries=1)
+    adapter = RejectingAdapter()
+    llm.session.mount("http://", adapter)
+    with pytest.raises(requests.exceptions.HTTPError):
+        llm._post(MESSAGES, stream=True)
+    assert adapter.response.raw.closed
+    assert llm.backends[0].outstanding == 0
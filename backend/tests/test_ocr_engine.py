@@ -0,0 +1,40 @@
+import os
+
+from PIL import Image, ImageDraw
+
+import ocr_engine
+
+
+def test_workers_are_never_forked_from_the_server():
+    assert ocr_engine._pool_context().get_start_method() != "fork"
+
+
+def test_pool_runs_work_in_worker_processes():
+    try:
+        assert ocr_engine._get_pool().submit(os.getpid).result(timeout=60) != os.getpid()
+    finally:
+        ocr_engine._reset_pool()
+
+
+def test_phone_photo_with_nominal_dpi_is_downscaled():
+    photo = Image.new("L", (4032, 3024), 255)
+    photo.info["dpi"] = (72, 72)
+    prepared, info = ocr_engine.preprocess_image(photo)
+    assert max(prepared.size) < 4032
+    assert max(prepared.size) <= round(ocr_engine.OCR_TARGET_DPI * ocr_engine.ASSUMED_PAGE_LONG_SIDE_INCHES * 1.1)
+
+
+def test_scan_with_real_dpi_keeps_its_scale():
+    scan = Image.new("L", (1275, 1650), 255)
+    scan.info["dpi"] = (150, 150)
+    prepared, _ = ocr_engine.preprocess_image(scan)
+    assert prepared.size == (1275, 1650)
+
+
+def test_skew_estimate_stays_within_the_maximum_angle():
+    page = Image.new("L", (600, 800), 255)
+    draw = ImageDraw.Draw(page)
+    for y in range(60, 760, 40):
+        draw.rectangle((40, y, 560, y + 12), fill=0)
+    steep = page.rotate(-14, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    assert abs(ocr_engine._estimate_skew(steep)) <= ocr_engine.DESKEW_MAX_ANGLE
@@ -0,0 +1,70 @@
+import pytest
+
+from prompt_builder import PromptBudget, MIN_HISTORY_LINE_TOKENS
+
+
+@pytest.fixture
+def budget():
+    budget = PromptBudget(max_input_tokens=400, max_history_share=0.5, max_history_message_tokens=40,
+                          min_chunk_tokens=16)
+    budget.encoding = None  # count 4 characters per token so sizes don't depend on fetching the encoding
+    return budget
+
+
+def words(n, word="word"):
+    return " ".join([word] * n)
+
+
+def test_history_keeps_the_newest_messages_in_order(budget):
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(40)]
+    lines, used, trimmed = budget._pack_history(history, 60)
+    assert lines[-1] == "Assistant: message 39"
+    assert lines == [f"{'User' if i % 2 == 0 else 'Assistant'}: message {i}" for i in range(40 - len(lines), 40)]
+    assert len(lines) < 40 and used <= 60 and trimmed == 0
+
+
+def test_long_history_messages_are_trimmed_before_older_ones_are_dropped(budget):
+    history = [{"role": "user", "content": "short question"},
+               {"role": "assistant", "content": words(200, "answer")}]
+    lines, _, trimmed = budget._pack_history(history, 100)
+    assert lines[0] == "User: short question"
+    assert lines[1].endswith("…") and budget.count(lines[1]) <= budget.max_history_message_tokens
+    assert trimmed == 1
+
+
+def test_summary_comes_first_and_takes_at_most_half_the_history_budget(budget):
+    history = [{"role": "user", "content": "latest"}]
+    lines, _, trimmed = budget._pack_history(history, 2 * MIN_HISTORY_LINE_TOKENS + 40, summary=words(200))
+    assert lines[0].startswith("Summary of earlier conversation:")
+    assert budget.count(lines[0]) <= (2 * MIN_HISTORY_LINE_TOKENS + 40) // 2
+    assert lines[1] == "User: latest"
+    assert trimmed == 1
+
+
+def test_context_keeps_rank_order_trims_the_partial_chunk_and_drops_the_rest(budget):
+    chunks = ["first " + words(20), "second " + words(20), "third " + words(40), "fourth"]
+    packed, used, trimmed = budget._pack_context(chunks, 2 * (budget.count(chunks[0]) + 1) + 30)
+    assert packed[:2] == chunks[:2]
+    assert packed[2].startswith("third") and packed[2].endswith("…")
+    assert len(packed) == 3 and trimmed == 1
+
+
+def test_best_chunk_is_kept_even_under_a_tight_budget(budget):
+    packed, _, trimmed = budget._pack_context([words(100), "second"], 8)
+    assert len(packed) == 1 and packed[0].endswith("…") and trimmed == 1
+
+
+def test_system_prompt_gives_history_its_share_and_context_the_rest(budget):
+    chunks = [f"chunk {i} " + words(30) for i in range(10)]
+    history = [{"role": "user", "content": f"question {i} " + words(20)} for i in range(10)]
+    content, stats = budget.build_system_prompt("Answer from the context.\n", chunks, history, "What now?")
+    assert stats["input_tokens"] <= budget.max_input_tokens
+    assert 0 < stats["context_chunks"] < len(chunks)
+    assert 0 < stats["history_messages"] < len(history)
+    assert "chunk 0 " in content and "question 9 " in content
+    assert "question 0 " not in content
+
+
+def test_no_chunks_means_the_instructions_alone(budget):
+    content, stats = budget.build_system_prompt("Instructions", [], [{"role": "user", "content": "hi"}], "q")
+    assert content == "Instructions" and stats["history_messages"] == 0
@@ -0,0 +1,69 @@
+import time
+
+import requests
+
+from llm_client import ThetaLLM
+from prompt_cache import PromptCache
+
+MESSAGES = [{"role": "user", "content": "What is osmosis?"}]
+
+
+def test_identical_request_hits_and_any_change_misses(tmp_path):
+    cache = PromptCache(str(tmp_path / "cache.sqlite3"))
+    key = PromptCache.key_for("http://llm.test", {"messages": MESSAGES, "temperature": 0.5})
+    assert cache.get(key) is None
+    cache.put(key, "Diffusion of water.")
+    assert cache.get(PromptCache.key_for("http://llm.test", {"temperature": 0.5, "messages": MESSAGES})) == \
+        "Diffusion of water."
+    assert cache.get(PromptCache.key_for("http://llm.test", {"messages": MESSAGES, "temperature": 0.7})) is None
+    assert cache.get(PromptCache.key_for("http://other.test", {"messages": MESSAGES, "temperature": 0.5})) is None
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = PromptCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05)
+    cache.put("key", "answer")
+    assert cache.get("key") == "answer"
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_survive_a_restart_and_the_least_recently_used_is_evicted(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = PromptCache(path, max_entries=2)
+    cache.put("a", "first")
+    time.sleep(0.01)
+    cache.put("b", "second")
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "third")
+    reopened = PromptCache(path, max_entries=2)
+    assert reopened.get("b") is None
+    assert reopened.get("a") == "first"
+    assert reopened.get("c") == "third"
+
+
+def test_client_answers_a_repeated_prompt_without_calling_the_model(tmp_path):
+    class CountingAdapter(requests.adapters.BaseAdapter):
+        calls = 0
+
+        def send(self, request, **kwargs):
+            CountingAdapter.calls += 1
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"body": {"infer_requests": [{"output": {"message": "Diffusion of water."}}]}}'
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    llm = ThetaLLM(api_key="key", url="http://llm.test/completions",
+                   prompt_cache=PromptCache(str(tmp_path / "cache.sqlite3")))
+    llm.session.mount("http://", CountingAdapter())
+    assert llm.invoke(MESSAGES) == "Diffusion of water."
+    assert llm.invoke(MESSAGES) == "Diffusion of water."
+    assert CountingAdapter.calls == 1
+    assert llm.invoke(MESSAGES, max_tokens=50) == "Diffusion of water."
+    assert CountingAdapter.calls == 2
@@ -0,0 +1,69 @@
+from retrieval_cache import SessionRetrievalCache, REUSE, MERGE
+
+
+def test_close_follow_up_reuses_and_rescales_hits():
+    cache = SessionRetrievalCache(reuse_similarity=0.9, merge_similarity=0.75)
+    cache.store("u", "s", [1.0, 0.0], [("doc", 0.8)], cache.version("u"))
+    kind, hits = cache.lookup("u", "s", [1.0, 0.0])
+    assert kind == REUSE
+    assert hits == [("doc", 0.8)]
+
+
+def test_looser_follow_up_merges():
+    cache = SessionRetrievalCache(reuse_similarity=0.9, merge_similarity=0.75)
+    cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], cache.version("u"))
+    kind, hits = cache.lookup("u", "s", [0.8, 0.6])
+    assert kind == MERGE
+    assert abs(hits[0][1] - 0.8) < 1e-6
+
+
+def test_unrelated_question_and_other_sessions_miss():
+    cache = SessionRetrievalCache()
+    cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], cache.version("u"))
+    assert cache.lookup("u", "s", [0.0, 1.0]) == (None, [])
+    assert cache.lookup("u", "other", [1.0, 0.0]) == (None, [])
+    assert cache.lookup("v", "s", [1.0, 0.0]) == (None, [])
+
+
+def test_index_changes_invalidate():
+    cache = SessionRetrievalCache()
+    cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], cache.version("u"))
+    cache.invalidate_user("u")
+    assert cache.lookup("u", "s", [1.0, 0.0]) == (None, [])
+
+    cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], cache.version("u"))
+    cache.invalidate_all()
+    assert cache.lookup("u", "s", [1.0, 0.0]) == (None, [])
+
+
+def test_retrieval_racing_an_index_change_is_not_stored():
+    cache = SessionRetrievalCache()
+    version = cache.version("u")
+    cache.invalidate_user("u")
+    cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], version)
+    assert cache.lookup("u", "s", [1.0, 0.0]) == (None, [])
+
+
+def test_only_recent_turns_and_sessions_are_kept():
+    cache = SessionRetrievalCache(turns=1, max_sessions=1)
+    cache.store("u", "s", [1.0, 0.0], [("old", 1.0)], cache.version("u"))
+    cache.store("u", "s", [0.0, 1.0], [("new", 1.0)], cache.version("u"))
+    assert cache.lookup("u", "s", [1.0, 0.0]) == (None, [])
+    cache.store("u", "t", [1.0, 0.0], [("other", 1.0)], cache.version("u"))
+    assert cache.lookup("u", "s", [0.0, 1.0]) == (None, [])
+    assert cache.lookup("u", "t", [1.0, 0.0])[0] == REUSE
+
+
+def test_dropped_session_is_forgotten():
+    cache = SessionRetrievalCache()
+    cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], cache.version("u"))
+    cache.drop_session("u", "s")
+    assert cache.lookup("u", "s", [1.0, 0.0]) == (None, [])
+
+
+def test_zero_turns_disables_the_cache():
+    cache = SessionRetrievalCache(turns=0)
+    for _ in range(3):
+        cache.store("u", "s", [1.0, 0.0], [("doc", 1.0)], cache.version("u"))
+    assert cache.lookup("u", "s", [1.0, 0.0]) == (None, [])
+    assert cache.stats()["sessions"] == 0
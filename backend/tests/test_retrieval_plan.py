@@ -0,0 +1,30 @@
+import pytest
+
+from retrieval_plan import plan_global_search
+
+BANDS = dict(user_k=3, global_k=2, wide_k=4, strong=0.8, weak=0.4)
+
+
+def hits(*scores):
+    return [(f"doc {i}", score) for i, score in enumerate(scores)]
+
+
+@pytest.mark.parametrize("scores, expected", [
+    ((0.9, 0.85, 0.8), (0, "skipped")),
+    ((0.9, 0.85, 0.8, 0.1), (0, "skipped")),
+    ((0.9, 0.5, 0.3), (1, "shrunk")),
+    ((0.8, 0.79, 0.79), (1, "shrunk")),
+    ((0.79, 0.6, 0.4), (2, "default")),
+    ((0.39, 0.2), (4, "widened")),
+    ((), (4, "widened")),
+])
+def test_each_band_sizes_the_global_search(scores, expected):
+    assert plan_global_search(hits(*scores), **BANDS) == expected
+
+
+def test_placeholder_thresholds_only_widen_for_users_without_hits():
+    # The shipped defaults (strong 1.0, weak 0.0) leave the global search at global_k for real matches
+    placeholders = dict(BANDS, strong=1.0, weak=0.0)
+    assert plan_global_search(hits(0.99, 0.98, 0.97), **placeholders) == (2, "default")
+    assert plan_global_search(hits(0.01), **placeholders) == (2, "default")
+    assert plan_global_search([], **placeholders) == (4, "widened")
@@ -0,0 +1,52 @@
+from session_profile import extract_user_profile, session_record_profile
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+def test_profile_is_built_from_the_history_once_then_kept_in_the_record():
+    record = {"id": "s1"}
+    conv = [user("Hi, my name is priya"), assistant("Hello Priya!"), user("I like organic chemistry.")]
+    assert session_record_profile(record, conv, "Alice") == {"name": "Priya", "interests": ["Organic chemistry"]}
+    assert record["profile"]["scanned"] == 3
+
+
+def test_only_new_messages_are_scanned():
+    record = {"id": "s1"}
+    conv = [user("my name is priya")]
+    session_record_profile(record, conv)
+    # Messages already scanned are not read again: rewriting one changes nothing
+    conv[0] = user("my name is someone else")
+    conv += [assistant("Hi!"), user("I am interested in thermodynamics. And you?")]
+    profile = session_record_profile(record, conv)
+    assert profile == {"name": "Priya", "interests": ["Thermodynamics"]}
+    assert record["profile"]["scanned"] == 3
+
+
+def test_repeated_interests_are_kept_once_and_the_default_name_fills_in():
+    record = {"id": "s1"}
+    conv = [user("I like music"), user("I like music")]
+    assert session_record_profile(record, conv, "Alice") == {"name": "Alice", "interests": ["Music"]}
+
+
+def test_replaced_history_is_rescanned_from_scratch():
+    record = {"id": "s1"}
+    session_record_profile(record, [user("my name is priya"), user("I like music"), user("ok")])
+    assert session_record_profile(record, [user("my name is omar")]) == {"name": "Omar", "interests": []}
+
+
+def test_returned_profile_is_a_copy_of_the_state():
+    record = {"id": "s1"}
+    profile = session_record_profile(record, [user("I like music")])
+    profile["interests"].append("Art")
+    assert record["profile"]["interests"] == ["Music"]
+
+
+def test_history_without_a_session_record():
+    assert extract_user_profile([user("My name is Lee and I like maths")], "Alice") == \
+        {"name": "Lee", "interests": ["Maths"]}
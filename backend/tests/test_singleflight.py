@@ -0,0 +1,171 @@
+import time
+import asyncio
+import threading
+
+from answer_cache import personalize
+from singleflight import SingleFlight, AsyncSingleFlight, flight_key, shared_answer
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight(wait_timeout=5)
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("q", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("q", slow))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight(wait_timeout=5)
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+
+
+def test_follower_runs_its_own_call_when_the_leader_fails():
+    flight = SingleFlight(wait_timeout=5)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    leader_errors = []
+
+    def lead():
+        try:
+            flight.do("q", failing)
+        except RuntimeError as e:
+            leader_errors.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(5)
+    assert flight.do("q", lambda: "own") == ("own", False)
+    leader.join(5)
+    assert leader_errors
+
+
+def test_follower_wait_is_capped_by_the_callers_wait():
+    flight = SingleFlight(wait_timeout=10)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "leader"
+
+    leader = threading.Thread(target=flight.do, args=("q", slow))
+    leader.start()
+    started.wait(5)
+    start = time.monotonic()
+    assert flight.do("q", lambda: "own", wait=0.1) == ("own", False)
+    assert time.monotonic() - start < 1
+    release.set()
+    leader.join(5)
+
+
+def test_async_followers_share_the_leaders_result():
+    flight = AsyncSingleFlight(wait_timeout=5)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("q", slow) for _ in range(4)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+
+
+def test_async_follower_falls_back_when_the_leader_fails():
+    flight = AsyncSingleFlight(wait_timeout=5)
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    async def own():
+        return "own"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("q", failing))
+        await asyncio.sleep(0)
+        follower = await flight.do("q", own)
+        try:
+            await leader
+        except RuntimeError:
+            pass
+        return follower
+
+    assert asyncio.run(main()) == ("own", False)
+
+
+def shareable_retrieval(name):
+    return {"shareable": True, "name": name, "fingerprint": "ctx", "prompt_fingerprint": "prompt"}
+
+
+def test_students_asking_the_same_question_over_the_same_chunks_share_one_call():
+    flight = SingleFlight(wait_timeout=5)
+    release = threading.Event()
+    calls = []
+    answers = {}
+
+    def ask(user, name, message):
+        retrieval = shareable_retrieval(name)
+
+        def call_llm():
+            calls.append(user)
+            release.wait(5)
+            return shared_answer(f"Good question, {name}! Osmosis is diffusion of water.", retrieval)
+
+        answer, _ = flight.do(flight_key(user, message, retrieval), call_llm)
+        answers[user] = personalize(answer, name)
+
+    leader = threading.Thread(target=ask, args=("alice@example.com", "Alice", "What is osmosis?"))
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+    follower = threading.Thread(target=ask, args=("bob@example.com", "Bob", "what is  osmosis"))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert calls == ["alice@example.com"]
+    assert answers == {"alice@example.com": "Good question, Alice! Osmosis is diffusion of water.",
+                       "bob@example.com": "Good question, Bob! Osmosis is diffusion of water."}
+
+
+def test_questions_with_history_only_coalesce_for_the_same_user():
+    retrieval = {"shareable": False, "name": "Alice", "fingerprint": "ctx", "prompt_fingerprint": "prompt"}
+    assert flight_key("alice@example.com", "What is osmosis?", retrieval) == \
+        flight_key("alice@example.com", "what is osmosis", retrieval)
+    assert flight_key("alice@example.com", "What is osmosis?", retrieval) != \
+        flight_key("bob@example.com", "What is osmosis?", retrieval)
+    assert flight_key("alice@example.com", "What is osmosis?", shareable_retrieval("Alice")) != \
+        flight_key("alice@example.com", "What is osmosis?", dict(shareable_retrieval("Alice"), fingerprint="other"))
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from voice_pipeline import VoicePipeline
+
+VECTORS = {
+    "what is photosynthesis": [1.0, 0.0, 0.0],
+    "what is photosynthesis in plants": [0.95, 0.1, 0.0],
+    "what is photosynthesis no wait what is mitosis": [0.1, 1.0, 0.0],
+}
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+class Retriever:
+    def __init__(self):
+        self.questions = []
+
+    def __call__(self, text, query_vector=None):
+        self.questions.append(text)
+        return [f"chunks for {text}"], VECTORS[text] if query_vector is None else query_vector
+
+
+def pipeline(executor, *segments):
+    def transcribe(audio):
+        return iter(SimpleNamespace(text=text) for text in segments), None
+    return VoicePipeline(transcribe, lambda text: VECTORS[text], executor, speculate_min_words=3)
+
+
+def test_unchanged_transcript_keeps_the_speculative_retrieval(executor):
+    voice, retrieve = pipeline(executor, "what is photosynthesis"), Retriever()
+    transcript = voice.transcribe(b"audio", retrieve)
+    assert transcript.partial_text == transcript.text
+    docs, vector = voice.context(transcript, retrieve)
+    assert docs == ["chunks for what is photosynthesis"] and vector == VECTORS["what is photosynthesis"]
+    assert retrieve.questions == ["what is photosynthesis"]
+
+
+def test_close_final_question_keeps_the_speculative_retrieval(executor):
+    voice, retrieve = pipeline(executor, "what is photosynthesis", "in plants"), Retriever()
+    transcript = voice.transcribe(b"audio", retrieve)
+    docs, vector = voice.context(transcript, retrieve)
+    assert docs == ["chunks for what is photosynthesis"]
+    assert vector == VECTORS["what is photosynthesis in plants"]
+    assert retrieve.questions == ["what is photosynthesis"]
+
+
+def test_changed_question_is_retrieved_again(executor):
+    voice, retrieve = pipeline(executor, "what is photosynthesis", "no wait what is mitosis"), Retriever()
+    transcript = voice.transcribe(b"audio", retrieve)
+    docs, _ = voice.context(transcript, retrieve)
+    assert docs == ["chunks for what is photosynthesis no wait what is mitosis"]
+    assert retrieve.questions == ["what is photosynthesis", "what is photosynthesis no wait what is mitosis"]
+
+
+def test_failed_speculation_falls_back_to_a_fresh_retrieval(executor):
+    voice = pipeline(executor, "what is photosynthesis")
+    retrieve = Retriever()
+
+    def failing(text, query_vector=None):
+        raise RuntimeError("index unavailable")
+
+    transcript = voice.transcribe(b"audio", failing)
+    docs, _ = voice.context(transcript, retrieve)
+    assert docs == ["chunks for what is photosynthesis"] and retrieve.questions == ["what is photosynthesis"]
+
+
+def test_short_partial_transcript_does_not_speculate(executor):
+    voice, retrieve = pipeline(executor, "photosynthesis"), Retriever()
+    transcript = voice.transcribe(b"audio", retrieve)
+    assert transcript.speculation is None and retrieve.questions == []
@@ -0,0 +1,159 @@
+"""
+Whisper transcription helpers.
+
+The Whisper model is loaded once per process and shared. Transcripts are
+consumed as a stream of segments so long recordings can be chunked and
+indexed while they are still being transcribed.
+
+Long recordings go through faster-whisper's BatchedInferencePipeline, which
+splits the audio on voice activity and decodes the pieces in parallel
+batches. Short clips keep plain sequential decoding, which has lower latency
+when there is only one or two segments to decode.
+"""
+
+import os
+import threading
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional
+
+import av
+import numpy as np
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL", "base")
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+WHISPER_SAMPLE_RATE = 16000
+# Recordings at least this long (seconds) are transcribed with the batched pipeline
+WHISPER_BATCHED_MIN_SECONDS = float(os.getenv("WHISPER_BATCHED_MIN_SECONDS", "120"))
+
+_whisper_model = None
+_batched_pipeline = None
+_whisper_model_lock = threading.Lock()
+
+
+def get_whisper_model() -> WhisperModel:
+    """Get the shared Whisper model, loading it on first use"""
+    global _whisper_model
+    if _whisper_model is None:
+        with _whisper_model_lock:
+            if _whisper_model is None:
+                print(f"[Whisper] Loading '{WHISPER_MODEL_SIZE}' model")
+                _whisper_model = WhisperModel(WHISPER_MODEL_SIZE)
+    return _whisper_model
+
+
+def get_batched_pipeline() -> BatchedInferencePipeline:
+    """Get the shared batched pipeline, built on top of the shared model"""
+    global _batched_pipeline
+    if _batched_pipeline is None:
+        model = get_whisper_model()
+        with _whisper_model_lock:
+            if _batched_pipeline is None:
+                _batched_pipeline = BatchedInferencePipeline(model=model)
+    return _batched_pipeline
+
+
+def get_audio_duration(path: str) -> Optional[float]:
+    """Read a file's duration in seconds from its container header, without decoding it"""
+    try:
+        with av.open(path) as container:
+            if container.duration:
+                return container.duration / av.time_base
+    except Exception as e:
+        print(f"[Whisper] Could not read duration of {path}: {e}")
+    return None
+
+
+def decode_audio_stream(stream: BinaryIO, max_seconds: Optional[float] = None) -> np.ndarray:
+    """Decode an audio file-like object in memory to a 16 kHz mono float32 array.
+
+    Uses PyAV directly so uploads never touch the disk. Decoding stops once
+    ``max_seconds`` of audio have been produced.
+    """
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=WHISPER_SAMPLE_RATE)
+    max_samples = int(max_seconds * WHISPER_SAMPLE_RATE) if max_seconds else None
+    chunks = []
+    total = 0
+    with av.open(stream, mode="r", metadata_errors="ignore") as container:
+        frames = container.decode(audio=0)
+        for frame in frames:
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+                total += chunks[-1].shape[0]
+            if max_samples and total >= max_samples:
+                break
+        else:
+            # Flush samples buffered inside the resampler
+            for resampled in resampler.resample(None):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    audio = np.concatenate(chunks)
+    if max_samples:
+        audio = audio[:max_samples]
+    return audio.astype(np.float32) / 32768.0
+
+
+def transcribe_segments(audio, vad_filter: bool = True, batched: Optional[bool] = None,
+                        batch_size: Optional[int] = None, **kwargs):
+    """Start transcribing audio (a path or a 16 kHz float32 array); returns a lazy segment
+    generator and the transcription info.
+
+    Nothing is decoded until the generator is iterated, so callers can act on
+    each segment as soon as Whisper produces it.
+
+    ``batched=None`` picks the batched pipeline for files of at least
+    WHISPER_BATCHED_MIN_SECONDS; pass True/False to force a mode.
+    """
+    if batched is None:
+        duration = get_audio_duration(audio) if isinstance(audio, str) else None
+        batched = duration is not None and duration >= WHISPER_BATCHED_MIN_SECONDS
+    if batched:
+        pipeline = get_batched_pipeline()
+        return pipeline.transcribe(audio, vad_filter=True, batch_size=batch_size or WHISPER_BATCH_SIZE, **kwargs)
+    model = get_whisper_model()
+    return model.transcribe(audio, vad_filter=vad_filter, **kwargs)
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as m:ss, or h:mm:ss for recordings over an hour"""
+    seconds = int(seconds or 0)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def iter_segment_windows(segments: Iterable, window_chars: int = 1000,
+                         overlap_segments: int = 1) -> Iterator[Dict]:
+    """Group consecutive Whisper segments into rolling windows of roughly window_chars.
+
+    Each window carries the start/end time of the segments it covers. The last
+    ``overlap_segments`` segments of a window are repeated at the start of the
+    next one, mirroring the chunk overlap used for text documents.
+    """
+    window = []
+    window_len = 0
+    fresh_segments = 0  # segments not yet emitted in any window
+    for seg in segments:
+        text = seg.text.strip()
+        if not text:
+            continue
+        window.append((seg.start, seg.end, text))
+        window_len += len(text) + 1
+        fresh_segments += 1
+        if window_len >= window_chars:
+            yield _window_to_dict(window)
+            window = window[-overlap_segments:] if overlap_segments else []
+            window_len = sum(len(t) + 1 for _, _, t in window)
+            fresh_segments = 0
+    if fresh_segments:
+        yield _window_to_dict(window)
+
+
+def _window_to_dict(window) -> Dict:
+    return {
+        "text": " ".join(text for _, _, text in window),
+        "start": window[0][0],
+        "end": window[-1][1]
+    }
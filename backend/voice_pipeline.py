@@ -0,0 +1,127 @@
+"""
+Pipelined voice questions.
+
+A voice question used to go strictly step by step: the whole transcript,
+then the session profile, then retrieval, then the LLM. Whisper produces
+segments one at a time, though, and by the first segment or two the
+question is usually clear. VoicePipeline overlaps the steps:
+
+  1. segments are consumed as Whisper decodes them
+  2. once the partial transcript has speculate_after_segments segments and
+     speculate_min_words words, retrieval starts on it in the background
+     while Whisper keeps decoding
+  3. when the transcript is final, the speculative retrieval is
+       kept       if the transcript didn't change, or the final question's
+                  embedding is within keep_similarity of the partial one
+       refined    otherwise: retrieval runs again on the final question
+       discarded  if the final question needs no retrieval at all
+
+so the LLM call can start as soon as the final context is known. The
+session profile is loaded alongside transcription by the caller.
+"""
+
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+
+KEPT = "kept"
+REFINED = "refined"
+DISCARDED = "discarded"
+
+
+class VoiceTranscript:
+    """A finished transcript and the retrieval started on part of it, if any"""
+    __slots__ = ("text", "segments", "partial_text", "speculation", "first_segment_seconds", "seconds")
+
+    def __init__(self):
+        self.text = ""
+        self.segments = 0
+        self.partial_text = None  # transcript the speculative retrieval was started on
+        self.speculation: Optional[Future] = None  # -> (docs, query_vector)
+        self.first_segment_seconds = None
+        self.seconds = 0.0
+
+
+def cosine(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    norms = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / norms) if norms else 0.0
+
+
+class VoicePipeline:
+    def __init__(self, transcribe: Callable, embed_query: Callable[[str], List[float]], executor: Executor,
+                 speculate_after_segments: int = 1, speculate_min_words: int = 4, keep_similarity: float = 0.9):
+        self.transcribe_segments = transcribe  # audio -> (lazy segment generator, info)
+        self.embed_query = embed_query
+        self.executor = executor
+        self.speculate_after_segments = speculate_after_segments
+        self.speculate_min_words = speculate_min_words
+        self.keep_similarity = keep_similarity
+
+    def transcribe(self, audio, retrieve: Optional[Callable] = None) -> VoiceTranscript:
+        """Transcribe audio, starting retrieve(partial_text) on the executor once the partial transcript is long enough.
+
+        retrieve(text, query_vector=None) returns (docs, query_vector); pass None to transcribe only.
+        """
+        transcript = VoiceTranscript()
+        start = time.perf_counter()
+        segments, _ = self.transcribe_segments(audio)
+        parts = []
+        for segment in segments:
+            text = segment.text.strip()
+            if not text:
+                continue
+            parts.append(text)
+            transcript.segments += 1
+            if transcript.first_segment_seconds is None:
+                transcript.first_segment_seconds = time.perf_counter() - start
+            if (retrieve is not None and transcript.speculation is None
+                    and transcript.segments >= self.speculate_after_segments
+                    and sum(len(part.split()) for part in parts) >= self.speculate_min_words):
+                transcript.partial_text = " ".join(parts)
+                transcript.speculation = self.executor.submit(retrieve, transcript.partial_text)
+                metrics.incr("voice.speculations")
+        transcript.text = " ".join(parts)
+        transcript.seconds = time.perf_counter() - start
+        metrics.observe("voice.transcribe", transcript.seconds)
+        if transcript.first_segment_seconds is not None:
+            metrics.observe("voice.first_segment", transcript.first_segment_seconds)
+        return transcript
+
+    def context(self, transcript: VoiceTranscript, retrieve: Callable,
+                query_vector=None) -> Tuple[list, Optional[List[float]]]:
+        """Final (docs, query_vector) for the finished transcript, reusing the speculative retrieval when it still fits.
+
+        query_vector is the final question's embedding if the caller already has one.
+        """
+        if transcript.speculation is None:
+            return retrieve(transcript.text, query_vector)
+        start = time.perf_counter()
+        try:
+            docs, partial_vector = transcript.speculation.result()
+        except Exception as e:
+            print(f"[Voice] Speculative retrieval failed: {e}")
+            docs, partial_vector = None, None
+        metrics.observe("voice.speculation_wait", time.perf_counter() - start)
+        if docs is not None and transcript.partial_text == transcript.text:
+            metrics.incr(f"voice.speculation_{KEPT}")
+            return docs, query_vector if query_vector is not None else partial_vector
+        if docs is not None and partial_vector is not None:
+            if query_vector is None:
+                query_vector = self.embed_query(transcript.text)
+            if cosine(query_vector, partial_vector) >= self.keep_similarity:
+                metrics.incr(f"voice.speculation_{KEPT}")
+                return docs, query_vector
+        metrics.incr(f"voice.speculation_{REFINED}")
+        return retrieve(transcript.text, query_vector)
+
+    def discard(self, transcript: VoiceTranscript):
+        """The final question needs no retrieval; drop the speculative one"""
+        if transcript.speculation is not None:
+            transcript.speculation.cancel()
+            metrics.incr(f"voice.speculation_{DISCARDED}")
@@ -218,6 +218,7 @@ function Chat({ user, onLogout }) {
                     const audioBlob = new Blob(chunksRef.current, { type: 'audio/wav' });
                     const formData = new FormData();
                     formData.append('file', audioBlob, 'recording.wav');
+                    formData.append('session_id', currentSessionId);
                     
                     try {
                         const res = await fetch('http://localhost:5000/api/audio', {